@@ -1,4 +1,8 @@
 from .tasks import router as tasks_router
 from .logs import router as logs_router
+from .stats import router as stats_router
+from .events import router as events_router
+from .metrics import router as metrics_router
+from .diagnostics import router as diagnostics_router
 
-__all__ = ["tasks_router", "logs_router"]
\ No newline at end of file
+__all__ = ["tasks_router", "logs_router", "stats_router", "events_router", "metrics_router", "diagnostics_router"]
\ No newline at end of file
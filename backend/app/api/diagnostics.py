@@ -0,0 +1,147 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query, Request
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.config import settings
+from app.core.profiling import profiler, ProfilerBusy, CPUProfile, MemorySnapshot, MemoryDiff
+from app.core.watchdog import loop_watchdog, LoopReport
+from app.core.timing import TimedRoute
+import logging
+import secrets
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/diagnostics", tags=["diagnostics"], route_class=TimedRoute)
+
+
+class ProfilingState(BaseModel):
+    enabled: bool
+
+
+class MemoryTracing(BaseModel):
+    tracing: bool
+    frames: int = Field(1, ge=1, le=65535, description="Frames kept per allocation")
+    snapshots: List[int] = []
+
+
+def require_profiling():
+    if not settings.profiling_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Profiling is disabled, enable it with PUT /api/diagnostics/profiling"
+        )
+
+
+def memory_tracing() -> MemoryTracing:
+    return MemoryTracing(
+        tracing=profiler.tracing,
+        frames=profiler.traceback_limit,
+        snapshots=profiler.snapshot_ids()
+    )
+
+
+@router.get("/loop", response_model=LoopReport)
+async def get_loop_report():
+    """
+    Current event loop lag and the most recent stalls, newest first, with the stack that blocked the loop
+    """
+    return loop_watchdog.report()
+
+
+@router.get("/profiling", response_model=ProfilingState)
+async def get_profiling():
+    return ProfilingState(enabled=settings.profiling_enabled)
+
+
+@router.put("/profiling", response_model=ProfilingState)
+async def set_profiling(
+    state: ProfilingState,
+    request: Request,
+    x_profiling_token: Optional[str] = Header(None, description="settings.profiling_token")
+):
+    """
+    Switch the profiling endpoints on or off without a restart. Requires the configured
+    ``profiling_token``, the client address is not trusted: behind a reverse proxy on the
+    same host every client connects from loopback.
+    """
+    if not settings.profiling_token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Set profiling_token to switch profiling at runtime"
+        )
+    if x_profiling_token is None or not secrets.compare_digest(x_profiling_token, settings.profiling_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profiling token")
+    settings.profiling_enabled = state.enabled
+    if not state.enabled and profiler.tracing:
+        profiler.stop_tracing()
+    host = request.client.host if request.client else None
+    logger.warning(f"Profiling {'enabled' if state.enabled else 'disabled'} by {host}")
+    return state
+
+
+@router.get("/profile/cpu", response_model=CPUProfile, dependencies=[Depends(require_profiling)])
+async def profile_cpu(
+    seconds: float = Query(5, gt=0, description="How long to sample"),
+    interval_ms: float = Query(5, ge=1, le=1000, description="Time between samples"),
+    idle: bool = Query(False, description="Include threads waiting for work"),
+    format: str = Query("json", pattern="^(json|collapsed)$", description="json, or collapsed stacks as text")
+):
+    """
+    Statistical CPU profile of every thread, the event loop and the executor threads included
+    """
+    if seconds > settings.profiling_max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"seconds must be at most {settings.profiling_max_seconds:g}"
+        )
+    try:
+        profile = await profiler.sample_cpu(seconds, interval_ms / 1000, idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if format == "collapsed":
+        return PlainTextResponse("".join(f"{stack} {count}\n" for stack, count in profile.collapsed.items()))
+    return profile
+
+
+@router.get("/profile/memory", response_model=MemoryTracing, dependencies=[Depends(require_profiling)])
+async def get_memory_tracing():
+    return memory_tracing()
+
+
+@router.put("/profile/memory", response_model=MemoryTracing, dependencies=[Depends(require_profiling)])
+async def set_memory_tracing(tracing: MemoryTracing):
+    """
+    Start tracemalloc, keeping ``frames`` frames per allocation, or stop it and drop its snapshots
+    """
+    if tracing.tracing:
+        profiler.start_tracing(tracing.frames)
+    else:
+        profiler.stop_tracing()
+    return memory_tracing()
+
+
+@router.post("/profile/memory/snapshots", response_model=MemorySnapshot, dependencies=[Depends(require_profiling)])
+async def take_memory_snapshot(limit: int = Query(20, ge=1, le=1000, description="Top allocation sites to return")):
+    """
+    Snapshot the allocations traced so far, kept for diffs
+    """
+    if not profiler.tracing:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Memory tracing is not started")
+    return profiler.take_snapshot(limit)
+
+
+@router.get("/profile/memory/diff", response_model=MemoryDiff, dependencies=[Depends(require_profiling)])
+async def diff_memory_snapshots(
+    base: int,
+    target: Optional[int] = Query(None, description="Snapshot to compare, by default the latest"),
+    limit: int = Query(20, ge=1, le=1000, description="Top allocation sites to return")
+):
+    """
+    Allocation sites that grew or shrank the most between two snapshots
+    """
+    snapshots = profiler.snapshot_ids()
+    if target is None and snapshots:
+        target = snapshots[-1]
+    diff = profiler.compare(base, target, limit)
+    if diff is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Snapshot not found")
+    return diff
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, HTTPException, status, Query, Header
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Optional
+from app.config import settings
+from app.scheduler.event_bus import event_bus, Event, TOPICS
+from app.core.timing import TimedRoute
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/events", tags=["events"], route_class=TimedRoute)
+
+# Reconnect delay suggested to EventSource clients, in milliseconds
+RETRY_MS = 3000
+
+
+async def encode_events(events: AsyncIterator[Optional[Event]]) -> AsyncIterator[str]:
+    """
+    Server-sent event framing, a comment line keeps idle connections open
+    """
+    yield f"retry: {RETRY_MS}\n\n"
+    async for event in events:
+        if event is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"id: {event_bus.event_id(event.seq)}\ndata: {event.model_dump_json()}\n\n"
+
+
+@router.get("")
+@router.get("/")
+async def stream_events(
+    topics: Optional[str] = Query(None, description=f"Comma separated topics, any of: {', '.join(TOPICS)}"),
+    task_id: Optional[int] = Query(None, description="Only events of this task"),
+    last_event_id: Optional[str] = Query(None, description="Resume after this event id"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Stream task and run state changes as server-sent events. Reconnecting clients
+    send the id of the last event they received (EventSource does so on its own)
+    and get the events they missed, or a ``reset`` event if those are gone.
+    """
+    selected = set(TOPICS)
+    if topics:
+        selected = {topic.strip() for topic in topics.split(",") if topic.strip()}
+        unknown = selected - set(TOPICS)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Unknown topics: {', '.join(sorted(unknown))}"
+            )
+    events = event_bus.subscribe(
+        selected,
+        task_id=task_id,
+        last_event_id=last_event_id_header or last_event_id,
+        heartbeat=settings.event_heartbeat_seconds
+    )
+    return StreamingResponse(
+        encode_events(events),
+        media_type="text/event-stream",
+        # Proxies must not buffer or cache the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
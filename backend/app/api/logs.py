@@ -1,60 +1,340 @@
-from fastapi import APIRouter, HTTPException, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, status, Query, BackgroundTasks, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional, Tuple
 from datetime import datetime, timezone
-from app.models.log import TaskLog, TaskLog_Pydantic
+import csv
+import io
+import json
+import zlib
+from app.models.log import TaskLog_Pydantic, TaskLogSummary, LogOutputPage, LOG_SUMMARY_FIELDS, LIFECYCLE_FIELDS
 from app.core.schemas import PaginatedResponse
-from tortoise.expressions import Q
+from app.config import settings
+from app.core.responses import FastJSONResponse
+from app.core.caching import make_etag, is_fresh, not_modified, cache_headers, set_cache_headers, IMMUTABLE
+from app.db.archive import archive
+from app.db.blobs import storage_stats
+from app.db.log_router import log_router, LogFilter, LOG_EXPORT_FIELDS
+from app.db.log_writer import log_writer
+from app.db.partitions import FINISHED_STATUSES
+from app.db.retention import retention, RetentionPolicy, RetentionProgress
+from app.db.versions import change_version
+from app.core.timing import TimedRoute, query_budget
 import logging
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/logs", tags=["logs"])
+router = APIRouter(prefix="/logs", tags=["logs"], default_response_class=FastJSONResponse, route_class=TimedRoute)
 
+FIELDS_DESCRIPTION = f"Comma separated summary fields to return, any of: {', '.join(LOG_SUMMARY_FIELDS)}"
 
-@router.get("", response_model=PaginatedResponse[TaskLog_Pydantic])
-@router.get("/", response_model=PaginatedResponse[TaskLog_Pydantic])
+
+def parse_summary_fields(fields: Optional[str]) -> List[str]:
+    """
+    Parse a ``fields=`` sparse fieldset into summary column names, ``id`` is always included
+    """
+    if not fields:
+        return LOG_SUMMARY_FIELDS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in LOG_SUMMARY_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return ["id", *(field for field in LOG_SUMMARY_FIELDS if field in requested and field != "id")]
+
+
+def parse_export_fields(fields: Optional[str]) -> List[str]:
+    """
+    Parse the export column selection, by default every summary column without the output
+    """
+    if not fields:
+        return LOG_SUMMARY_FIELDS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in LOG_EXPORT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return ["id", *(field for field in LOG_EXPORT_FIELDS if field in requested and field != "id")]
+
+
+EXPORT_DATETIME_FIELDS = {"started_at", "finished_at", "created_at"} | set(LIFECYCLE_FIELDS)
+
+OUTPUT_STREAM_PATTERN = "^(stdout|stderr)$"
+# Most lines one output page may hold
+OUTPUT_PAGE_MAX_LINES = 10000
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte of a single ``bytes=`` range, clamped to ``size``. None when
+    the header is not a single byte range and should be ignored, 416 when no byte
+    of the range exists.
+    """
+    unit, _, spec = header.partition("=")
+    first, separator, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or "," in spec or not separator:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+        else:
+            # Suffix range, the last N bytes, none of them for N = 0
+            suffix = int(last)
+            start, end = (size - suffix if suffix else size), size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return max(start, 0), min(end, size - 1)
+
+
+def _export_value(field: str, value):
+    if field not in EXPORT_DATETIME_FIELDS or value is None:
+        return value
+    if isinstance(value, str):
+        # Timestamps read from partitions come back as stored text
+        value = datetime.fromisoformat(value)
+    return value.isoformat()
+
+
+async def encode_export(batches: AsyncIterator[List[dict]], fields: List[str], export_format: str,
+                        compress: bool) -> AsyncIterator[bytes]:
+    """
+    Encode exported batches as NDJSON or CSV, one chunk per batch, optionally gzipped
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        header = emit(buffer.getvalue())
+        if header:
+            yield header
+    async for batch in batches:
+        if export_format == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_export_value(field, row[field]) for field in fields] for row in batch)
+            chunk = emit(buffer.getvalue())
+        else:
+            chunk = emit("".join(
+                json.dumps({field: _export_value(field, value) for field, value in row.items()}, ensure_ascii=False) + "\n"
+                for row in batch
+            ))
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+@router.get("", response_model=PaginatedResponse[TaskLogSummary], response_model_exclude_unset=True)
+@router.get("/", response_model=PaginatedResponse[TaskLogSummary], response_model_exclude_unset=True)
+@query_budget(2)
 async def get_logs(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     task_id: Optional[int] = None,
     status: Optional[int] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    started_after: Optional[datetime] = Query(None, description="Only logs started at or after this time"),
+    started_before: Optional[datetime] = Query(None, description="Only logs started before this time"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
 ):
     """
-    Get execution logs with filtering
+    Get execution log summaries with filtering, full output is only returned by ``GET /logs/{log_id}``
     """
-    query = TaskLog.all().prefetch_related("task")
+    selected_fields = parse_summary_fields(fields)
+    log_filter = LogFilter(
+        task_id=task_id,
+        status=status,
+        search=search,
+        started_after=started_after,
+        started_before=started_before
+    )
+    return await log_router.page(log_filter, skip, limit, selected_fields)
 
-    if task_id is not None:
-        query = query.filter(task_id=task_id)
-    if status is not None:
-        query = query.filter(status=status)
-    if search:
-        query = query.filter(
-            Q(stdout__icontains=search) |
-            Q(stderr__icontains=search) |
-            Q(error_message__icontains=search) |
-            Q(command_executed__icontains=search)
-        )
 
-    total = await query.count()
-    logs_query = query.offset(skip).limit(limit).order_by("-started_at")
-    return PaginatedResponse(
-        total=total,
-        skip=skip,
-        limit=limit,
-        data=await TaskLog_Pydantic.from_queryset(logs_query)
+@router.get("/export")
+async def export_logs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    task_id: Optional[int] = None,
+    status: Optional[int] = None,
+    started_after: Optional[datetime] = Query(None, description="Only logs started at or after this time"),
+    started_before: Optional[datetime] = Query(None, description="Only logs started before this time"),
+    fields: Optional[str] = Query(None, description=f"Comma separated columns, any of: {', '.join(LOG_EXPORT_FIELDS)}"),
+    gzip: bool = Query(False, description="Gzip the response body")
+):
+    """
+    Stream every matching log as NDJSON or CSV, in constant memory however many rows match
+    """
+    selected_fields = parse_export_fields(fields)
+    log_filter = LogFilter(
+        task_id=task_id,
+        status=status,
+        started_after=started_after,
+        started_before=started_before
+    )
+    extension = "csv" if format == "csv" else "ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="logs.{extension}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        encode_export(log_router.export(log_filter, selected_fields), selected_fields, format, gzip),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers=headers
     )
 
 
+@router.get("/storage")
+async def get_storage_stats():
+    """
+    Get output storage statistics, including the deduplication ratio and the log archive
+    """
+    return {**await storage_stats(), "archive": archive.stats()}
+
+
+@router.get("/retention")
+async def get_retention_status():
+    """
+    Get the global retention policy and the progress of the current or last run
+    """
+    return {
+        "enabled": settings.retention_enabled,
+        "interval_seconds": settings.retention_interval_seconds,
+        "policy": RetentionPolicy.global_default(),
+        "progress": retention.progress,
+    }
+
+
+@router.post("/retention/run", response_model=RetentionProgress, status_code=status.HTTP_202_ACCEPTED)
+async def run_retention(background_tasks: BackgroundTasks):
+    """
+    Start a retention run in the background
+    """
+    if retention.running:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Retention is already running")
+    background_tasks.add_task(retention.run)
+    return retention.progress
+
+
 @router.get("/{log_id}", response_model=TaskLog_Pydantic)
-async def get_log(log_id: int):
+@query_budget(2)
+async def get_log(log_id: int, request: Request, response: Response):
     """
-    Get a specific log by ID
+    Get a specific log by ID. Finished logs never change and are sent as immutable,
+    running ones are revalidated against the task_logs change version.
     """
-    log = await TaskLog.get_or_none(id=log_id).prefetch_related("task")
+    version = None
+    if not log_writer.is_pending(log_id):
+        # Queued changes do not show up in the version until they are written
+        version = change_version("task_logs")
+        etag = make_etag("log", log_id, version.key)
+        if is_fresh(request, etag, version.modified_at):
+            return not_modified(etag, version.modified_at)
+
+    log = await log_router.get(log_id)
     if not log:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Log not found")
-    return await TaskLog_Pydantic.from_tortoise_orm(log)
+    if log.status in FINISHED_STATUSES:
+        etag = make_etag("log", log_id, "finished")
+        if is_fresh(request, etag, log.finished_at):
+            return not_modified(etag, log.finished_at, IMMUTABLE)
+        set_cache_headers(response, etag, log.finished_at, IMMUTABLE)
+    elif version is not None:
+        set_cache_headers(response, etag, version.modified_at)
+    else:
+        response.headers["Cache-Control"] = "no-store"
+    return log
+
+
+@router.get("/{log_id}/output", response_model=LogOutputPage)
+async def get_log_output(
+    log_id: int,
+    request: Request,
+    response: Response,
+    stream: str = Query("stdout", pattern=OUTPUT_STREAM_PATTERN, description="stdout or stderr"),
+    from_line: int = Query(0, ge=0, description="First line to return, 0-based"),
+    count: int = Query(1000, ge=1, le=OUTPUT_PAGE_MAX_LINES, description="Number of lines to return"),
+    tail: Optional[int] = Query(None, ge=1, le=OUTPUT_PAGE_MAX_LINES, description="Return the last N lines instead")
+):
+    """
+    Get a page of lines of a log's output. The output is indexed by line on first
+    access, so every page costs the same however large the output is.
+    """
+    found = await log_router.output_index(log_id, stream)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Log not found")
+    index, log_status = found
+    if tail is not None:
+        from_line, count = max(index.line_count - tail, 0), tail
+    if log_status in FINISHED_STATUSES:
+        etag = make_etag("log-output", log_id, stream, from_line, count)
+        if is_fresh(request, etag):
+            return not_modified(etag, cache_control=IMMUTABLE)
+        set_cache_headers(response, etag, cache_control=IMMUTABLE)
+    else:
+        response.headers["Cache-Control"] = "no-store"
+    return LogOutputPage(
+        log_id=log_id,
+        stream=stream,
+        status=log_status,
+        total_lines=index.line_count,
+        total_bytes=index.size,
+        from_line=from_line,
+        lines=index.lines(from_line, count)
+    )
+
+
+@router.get("/{log_id}/output/raw")
+async def get_log_output_raw(
+    log_id: int,
+    request: Request,
+    stream: str = Query("stdout", pattern=OUTPUT_STREAM_PATTERN, description="stdout or stderr")
+):
+    """
+    Get a log's output as plain UTF-8 text. A single ``Range: bytes=`` range is
+    answered with 206 and just those bytes.
+    """
+    found = await log_router.output_index(log_id, stream)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Log not found")
+    index, log_status = found
+    headers = {"Accept-Ranges": "bytes"}
+    if log_status in FINISHED_STATUSES:
+        etag = make_etag("log-output-raw", log_id, stream)
+        if is_fresh(request, etag):
+            return not_modified(etag, cache_control=IMMUTABLE)
+        headers.update(cache_headers(etag, cache_control=IMMUTABLE))
+    else:
+        headers["Cache-Control"] = "no-store"
+
+    byte_range = None
+    if request.headers.get("range") and index.size:
+        byte_range = parse_byte_range(request.headers["range"], index.size)
+    if byte_range is None:
+        return Response(index.data, media_type="text/plain; charset=utf-8", headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{index.size}"
+    return Response(
+        index.byte_range(start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
 
 
 @router.delete("/{log_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -62,11 +342,8 @@ async def delete_log(log_id: int):
     """
     Delete a log entry
     """
-    log = await TaskLog.get_or_none(id=log_id)
-    if not log:
+    if not await log_router.delete(log_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Log not found")
-
-    await log.delete()
     return None
 
 
@@ -79,17 +356,13 @@ async def clear_logs(
     """
     Clear logs with optional filters
     """
-    query = TaskLog.all()
-
-    if task_id is not None:
-        query = query.filter(task_id=task_id)
+    log_filter = LogFilter(task_id=task_id)
 
     if older_than_days:
         from datetime import datetime, timedelta
-        cutoff_date = datetime.utcnow() - timedelta(days=older_than_days)
-        query = query.filter(started_at__lt=cutoff_date)
+        log_filter.started_before = datetime.utcnow() - timedelta(days=older_than_days)
 
-    await query.delete()
+    await log_router.delete_matching(log_filter)
     return None
 
 
@@ -113,10 +386,6 @@ async def clear_logs_before(
         before_time = before_time.astimezone(timezone.utc)
         before_time = before_time.replace(tzinfo=None)
 
-    query = TaskLog.all()
-    query = query.filter(started_at__lt=before_time)
-
-    deleted_count = await query.count()
-    await query.delete()
+    deleted_count = await log_router.delete_matching(LogFilter(started_before=before_time))
 
-    return {"deleted": deleted_count}
\ No newline at end of file
+    return {"deleted": deleted_count}
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+from app.core.metrics import registry, CONTENT_TYPE
+import logging
+
+logger = logging.getLogger(__name__)
+# Served at /metrics, outside /api, where Prometheus looks by default
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Scheduler, database and HTTP metrics in the Prometheus text format
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, HTTPException, status, Query
+from typing import Optional
+from datetime import datetime, timezone
+from app.db.partitions import as_utc
+from app.db.rollups import stats, rebuild, StatsResponse, RebuildResult, ROLLUP_BUCKETS
+from app.core.timing import TimedRoute
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/stats", tags=["stats"], route_class=TimedRoute)
+
+# Range covered when no start is given
+DEFAULT_RANGES = {"hour": ROLLUP_BUCKETS["hour"] * 24, "day": ROLLUP_BUCKETS["day"] * 30}
+MAX_BUCKETS = 5000
+
+
+@router.get("", response_model=StatsResponse)
+@router.get("/", response_model=StatsResponse)
+async def get_stats(
+    bucket: str = Query("hour", pattern="^(hour|day)$", description="Bucket size, hour or day"),
+    task_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, description="ISO datetime, by default 24 hours or 30 days before end"),
+    end: Optional[datetime] = Query(None, description="ISO datetime, by default now")
+):
+    """
+    Run counts and duration percentiles per bucket, served from pre-aggregated rollups
+    """
+    # Naive bounds are UTC, like the stored timestamps
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - DEFAULT_RANGES[bucket]
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="start must be before end")
+    if (end - start) / ROLLUP_BUCKETS[bucket] > MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Range covers more than {MAX_BUCKETS} {bucket} buckets, use a larger bucket"
+        )
+    return await stats(bucket, start, end, task_id)
+
+
+@router.post("/rebuild", response_model=RebuildResult)
+async def rebuild_stats(
+    since: Optional[datetime] = Query(None, description="ISO datetime, rebuild from the start of this day"),
+    until: Optional[datetime] = Query(None, description="ISO datetime, rebuild up to the end of this day")
+):
+    """
+    Recompute rollups from the stored logs, safe to run repeatedly
+    """
+    return await rebuild(since, until)
@@ -1,24 +1,88 @@
 from shutil import which
 
-from fastapi import APIRouter, HTTPException, status, Query, BackgroundTasks
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, status, Query, BackgroundTasks, Request, Response
+from typing import Dict, List, Literal, Optional
+from datetime import datetime, timezone
 
 from pydantic import BaseModel
 from app.models.task import Task, Task_Pydantic, TaskIn_Pydantic, TaskUpdate_Pydantic, ScheduleType, TaskWithStats
-from app.models.log import TaskLog, TaskLog_Pydantic, ExecutionStatus
+from app.models.log import TaskLog, TaskLogSummary, ExecutionStatus
 from app.core.schemas import PaginatedResponse
+from app.api.logs import FIELDS_DESCRIPTION, parse_summary_fields
+from app.core.responses import FastJSONResponse
+from app.core.caching import make_etag, is_fresh, not_modified, set_cache_headers
+from app.db.blobs import referenced_blobs, release_blobs
+from app.db.log_router import log_router, LogFilter
+from app.db.log_writer import log_writer
+from app.db.versions import change_version, bumps
 from app.scheduler.scheduler import scheduler
-from tortoise.transactions import atomic
+from app.core.timing import TimedRoute, query_budget
+from tortoise.transactions import in_transaction
 from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
 import logging
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/tasks", tags=["tasks"])
+router = APIRouter(prefix="/tasks", tags=["tasks"], default_response_class=FastJSONResponse, route_class=TimedRoute)
+
+
+# Columns of Task_Pydantic, read with .values() by the list endpoint
+TASK_FIELDS = list(Task_Pydantic.model_fields)
+# Most items a bulk request may carry
+BULK_MAX_ITEMS = 10000
+# Ids or names per IN (...) lookup of a bulk request
+BULK_CHUNK_SIZE = 500
+
+
+class BulkIds(BaseModel):
+    ids: List[int]
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: Literal["created", "updated", "unchanged", "enabled", "disabled", "deleted", "failed"]
+    error: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+
+def _schedule_error(schedule_type: ScheduleType, cron_expression: Optional[str],
+                    interval_seconds: Optional[int]) -> Optional[str]:
+    if schedule_type == ScheduleType.CRON and not cron_expression:
+        return "cron_expression is required for cron schedule type"
+    if schedule_type == ScheduleType.INTERVAL and not interval_seconds:
+        return "interval_seconds is required for interval schedule type"
+    return None
+
+
+async def get_tasks_with_stats(query: QuerySet[Task]) -> List[TaskWithStats]:
+    """
+    Tasks of ``query`` with their log statistics. Reads plain rows instead of model
+    instances, and the statistics of all tasks together from every log source.
+    """
+    rows = await query.values(*TASK_FIELDS)
+    if not rows:
+        return []
+    stats = await log_router.task_stats([row["id"] for row in rows])
+    tasks = []
+    for row in rows:
+        task_stats = stats[row["id"]]
+        last_success = None if task_stats.last_status is None else task_stats.last_status == ExecutionStatus.COMPLETED
+        tasks.append(TaskWithStats(**row, log_count=task_stats.log_count, last_execution_success=last_success))
+    return tasks
 
 
 @router.get("", response_model=PaginatedResponse[TaskWithStats])
 @router.get("/", response_model=PaginatedResponse[TaskWithStats])
+@query_budget(3)
 async def get_tasks(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     enabled: Optional[bool] = None,
@@ -27,6 +91,13 @@ async def get_tasks(
     """
     Get list of tasks with pagination and filtering
     """
+    # The statistics come from task_logs, so both tables take part in the version
+    version = change_version("tasks", "task_logs")
+    etag = make_etag("tasks", version.key, skip, limit, enabled, search)
+    if is_fresh(request, etag, version.modified_at):
+        return not_modified(etag, version.modified_at)
+    set_cache_headers(response, etag, version.modified_at)
+
     query = Task.all()
     if enabled is not None:
         query = query.filter(enabled=enabled)
@@ -34,30 +105,7 @@ async def get_tasks(
         query = query.filter(Q(name__icontains=search) | Q(description__icontains=search))
 
     total = await query.count()
-    tasks = await query.offset(skip).limit(limit).order_by("-created_at")
-
-    # Build response with statistics
-    tasks_with_stats = []
-    for task in tasks:
-        # Get log count for this task
-        log_count = await task.logs.all().count()
-
-        # Get latest execution status
-        last_execution_success = None
-        latest_log = await task.logs.all().order_by("-started_at").first()
-        if latest_log:
-            last_execution_success = latest_log.status == ExecutionStatus.COMPLETED
-
-        # Create TaskWithStats instance
-        task_data = await Task_Pydantic.from_tortoise_orm(task)
-        task_dict = task_data.model_dump()
-        task_with_stats = TaskWithStats(
-            **task_dict,
-            log_count=log_count,
-            last_execution_success=last_execution_success
-        )
-        tasks_with_stats.append(task_with_stats)
-
+    tasks_with_stats = await get_tasks_with_stats(query.offset(skip).limit(limit).order_by("-created_at"))
     return PaginatedResponse(
         total=total,
         skip=skip,
@@ -67,36 +115,41 @@ async def get_tasks(
 
 
 @router.get("/{task_id}", response_model=Task_Pydantic)
-async def get_task(task_id: int):
+@query_budget(1)
+async def get_task(task_id: int, request: Request, response: Response):
     """
     Get a specific task by ID
     """
+    version = change_version("tasks")
+    etag = make_etag("task", task_id, version.key)
+    if is_fresh(request, etag, version.modified_at):
+        return not_modified(etag, version.modified_at)
+    set_cache_headers(response, etag, version.modified_at)
+
+    # A single instance is cheaper to fetch than a one-row .values() query
     task = await Task.get_or_none(id=task_id)
     if not task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
-    return await Task_Pydantic.from_tortoise_orm(task)
+    return Task_Pydantic.model_validate(task)
 
 
 @router.post("", response_model=Task_Pydantic, status_code=status.HTTP_201_CREATED)
 @router.post("/", response_model=Task_Pydantic, status_code=status.HTTP_201_CREATED)
-@atomic()
 async def create_task(task_in: TaskIn_Pydantic):
     """
     Create a new task
     """
     # Validate schedule type
-    if task_in.schedule_type == ScheduleType.CRON and not task_in.cron_expression:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="cron_expression is required for cron schedule type"
-        )
-    if task_in.schedule_type == ScheduleType.INTERVAL and not task_in.interval_seconds:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="interval_seconds is required for interval schedule type"
-        )
-
-    task = await Task.create(**task_in.model_dump(exclude_unset=True))
+    error = _schedule_error(task_in.schedule_type, task_in.cron_expression, task_in.interval_seconds)
+    if error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=error)
+
+    since = change_version("tasks").key
+    async with in_transaction("default"):
+        task = await Task.create(**task_in.model_dump(exclude_unset=True))
+    # Only committed tasks reach the registry, SSE subscribers and the jobs
+    scheduler.tasks_committed(since)
+    scheduler.register_task(task)
     # Add to scheduler if enabled
     if task.enabled:
         await scheduler.add_task(task)
@@ -104,39 +157,34 @@ async def create_task(task_in: TaskIn_Pydantic):
 
 
 @router.put("/{task_id}", response_model=Task_Pydantic)
-@atomic()
 async def update_task(task_id: int, task_update: TaskUpdate_Pydantic):
     """
     Update an existing task
     """
-    task = await Task.get_or_none(id=task_id)
-    if not task:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
-
-    update_data = task_update.model_dump(exclude_unset=True)
-
-    # Validate schedule type consistency
-    if "schedule_type" in update_data or "cron_expression" in update_data or "interval_seconds" in update_data:
-        schedule_type = update_data.get("schedule_type", task.schedule_type)
-        cron_expression = update_data.get("cron_expression", task.cron_expression)
-        interval_seconds = update_data.get("interval_seconds", task.interval_seconds)
-
-        if schedule_type == ScheduleType.CRON and not cron_expression:
-            raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="cron_expression is required for cron schedule type"
-            )
-        if schedule_type == ScheduleType.INTERVAL and not interval_seconds:
-            raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="interval_seconds is required for interval schedule type"
-            )
-
-    # Store old enabled state for scheduler update
-    old_enabled = task.enabled
-
-    await task.update_from_dict(update_data)
-    await task.save()
+    since = change_version("tasks").key
+    async with in_transaction("default"):
+        task = await Task.get_or_none(id=task_id)
+        if not task:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+
+        update_data = task_update.model_dump(exclude_unset=True)
+
+        # Validate schedule type consistency
+        if "schedule_type" in update_data or "cron_expression" in update_data or "interval_seconds" in update_data:
+            schedule_type = update_data.get("schedule_type", task.schedule_type)
+            cron_expression = update_data.get("cron_expression", task.cron_expression)
+            interval_seconds = update_data.get("interval_seconds", task.interval_seconds)
+            error = _schedule_error(schedule_type, cron_expression, interval_seconds)
+            if error:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=error)
+
+        # Store old enabled state for scheduler update
+        old_enabled = task.enabled
+
+        await task.update_from_dict(update_data)
+        await task.save()
+    scheduler.tasks_committed(since)
+    scheduler.register_task(task)
 
     # Update scheduler
     if not old_enabled and task.enabled:
@@ -153,49 +201,289 @@ async def update_task(task_id: int, task_update: TaskUpdate_Pydantic):
     return await Task_Pydantic.from_tortoise_orm(task)
 
 
+async def delete_tasks(task_ids: List[int]):
+    """
+    Delete tasks and their logs. Their jobs and running executions are stopped and
+    their queued logs dropped first, so no run writes a log of a deleted task. The
+    task rows are then deleted in one transaction together with their live logs,
+    which the cascade removes, and the output blob references of those logs. A failed
+    delete schedules the tasks again. Logs in partitions and archive segments live in
+    other files and are deleted afterwards.
+    """
+    for task_id in task_ids:
+        await scheduler.remove_task(task_id)
+    log_writer.discard_tasks(task_ids)
+    since = change_version("tasks").key
+    try:
+        async with in_transaction("default") as conn:
+            for chunk in _chunks(task_ids):
+                hashes = await referenced_blobs(TaskLog.filter(task_id__in=chunk), conn)
+                await Task.filter(id__in=chunk).using_db(conn).delete()
+                await release_blobs(hashes, conn)
+    except Exception:
+        for task_id in task_ids:
+            task = scheduler.tasks.get(task_id)
+            if task is not None and task.enabled:
+                await scheduler.add_task(task)
+        raise
+    scheduler.tasks_committed(since)
+    await scheduler.apply_tasks([], task_ids)
+    await log_router.delete_matching(LogFilter(task_ids=set(task_ids)))
+
+
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-@atomic()
+@bumps("task_logs")
 async def delete_task(task_id: int):
     """
     Delete a task
     """
-    task = await Task.get_or_none(id=task_id)
-    if not task:
+    if not await Task.exists(id=task_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+    await delete_tasks([task_id])
+    return None
 
-    # Remove from scheduler
-    await scheduler.remove_task(task_id)
 
-    await task.delete()
-    return None
+def _check_bulk_size(count: int):
+    if count > BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {BULK_MAX_ITEMS} items per bulk request"
+        )
+
 
+def _bulk_result(results: List[BulkItemResult]) -> BulkResult:
+    results.sort(key=lambda result: result.index)
+    failed = sum(result.status == "failed" for result in results)
+    return BulkResult(succeeded=len(results) - failed, failed=failed, results=results)
 
-@router.get("/{task_id}/logs", response_model=PaginatedResponse[TaskLog_Pydantic])
+
+def _chunks(items: list) -> List[list]:
+    return [items[start:start + BULK_CHUNK_SIZE] for start in range(0, len(items), BULK_CHUNK_SIZE)]
+
+
+async def _fetch_tasks(**lookup) -> List[Task]:
+    """
+    Tasks matching a single ``<field>__in`` lookup, queried in chunks
+    """
+    [(key, values)] = lookup.items()
+    tasks = []
+    for chunk in _chunks(list(values)):
+        tasks.extend(await Task.filter(**{key: chunk}))
+    return tasks
+
+
+async def _insert_tasks(tasks: List[Task], conn):
+    """
+    Insert new tasks in batches. SQLite does not report the ids of a multi-row
+    insert, so they are assigned here like the log writer does.
+    """
+    if not tasks:
+        return
+    rows = await conn.execute_query_dict(
+        "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'tasks'), 0), "
+        "COALESCE((SELECT MAX(id) FROM tasks), 0)) AS last_id"
+    )
+    now = datetime.now(timezone.utc)
+    for offset, task in enumerate(tasks, start=rows[0]["last_id"] + 1):
+        task.id = offset
+        task._custom_generated_pk = True
+        task.created_at = task.updated_at = now
+    await Task.bulk_create(tasks, batch_size=1000, using_db=conn)
+
+
+@router.post("/bulk/create", response_model=BulkResult)
+async def bulk_create_tasks(tasks_in: List[TaskIn_Pydantic]):
+    """
+    Create many tasks in one transaction. Invalid items are reported as failed,
+    the others are created.
+    """
+    _check_bulk_size(len(tasks_in))
+    results = []
+    created = []
+    for index, task_in in enumerate(tasks_in):
+        error = _schedule_error(task_in.schedule_type, task_in.cron_expression, task_in.interval_seconds)
+        if error:
+            results.append(BulkItemResult(index=index, status="failed", error=error))
+            continue
+        created.append((index, Task(**task_in.model_dump(exclude_unset=True))))
+
+    since = change_version("tasks").key
+    async with in_transaction("default") as conn:
+        await _insert_tasks([task for _, task in created], conn)
+    scheduler.tasks_committed(since)
+    results.extend(BulkItemResult(index=index, id=task.id, status="created") for index, task in created)
+    await scheduler.apply_tasks([task for _, task in created], [])
+    return _bulk_result(results)
+
+
+@router.post("/bulk/upsert", response_model=BulkResult)
+async def bulk_upsert_tasks(tasks_in: List[TaskIn_Pydantic]):
+    """
+    Create or update many tasks by name in one transaction. An item updates the
+    task with its name, only the fields it sets are changed. Names shared by
+    several existing tasks, or repeated within the request, fail.
+    """
+    _check_bulk_size(len(tasks_in))
+    by_name: Dict[str, List[Task]] = {}
+    for task in await _fetch_tasks(name__in={task_in.name for task_in in tasks_in}):
+        by_name.setdefault(task.name, []).append(task)
+
+    results = []
+    created = []
+    updated = []
+    update_fields = {"updated_at"}
+    seen = set()
+    now = datetime.now(timezone.utc)
+    for index, task_in in enumerate(tasks_in):
+        if task_in.name in seen:
+            results.append(BulkItemResult(index=index, status="failed", error="Name repeated in the request"))
+            continue
+        seen.add(task_in.name)
+        data = task_in.model_dump(exclude_unset=True)
+        existing = by_name.get(task_in.name, [])
+        if len(existing) > 1:
+            results.append(BulkItemResult(index=index, status="failed",
+                                          error=f"Name matches {len(existing)} tasks"))
+            continue
+        if not existing:
+            error = _schedule_error(task_in.schedule_type, task_in.cron_expression, task_in.interval_seconds)
+            if error:
+                results.append(BulkItemResult(index=index, status="failed", error=error))
+            else:
+                created.append((index, Task(**data)))
+            continue
+
+        [task] = existing
+        error = _schedule_error(
+            data.get("schedule_type", task.schedule_type),
+            data.get("cron_expression", task.cron_expression),
+            data.get("interval_seconds", task.interval_seconds)
+        )
+        if error:
+            results.append(BulkItemResult(index=index, id=task.id, status="failed", error=error))
+            continue
+        changes = {field: value for field, value in data.items() if getattr(task, field) != value}
+        if not changes:
+            results.append(BulkItemResult(index=index, id=task.id, status="unchanged"))
+            continue
+        for field, value in changes.items():
+            setattr(task, field, value)
+        task.updated_at = now
+        update_fields.update(changes)
+        updated.append((index, task))
+
+    since = change_version("tasks").key
+    async with in_transaction("default") as conn:
+        await _insert_tasks([task for _, task in created], conn)
+        if updated:
+            await Task.bulk_update([task for _, task in updated], list(update_fields), batch_size=1000, using_db=conn)
+    scheduler.tasks_committed(since)
+    results.extend(BulkItemResult(index=index, id=task.id, status="created") for index, task in created)
+    results.extend(BulkItemResult(index=index, id=task.id, status="updated") for index, task in updated)
+    await scheduler.apply_tasks([task for _, task in created + updated], [])
+    return _bulk_result(results)
+
+
+async def _bulk_set_enabled(task_ids: List[int], enabled: bool) -> BulkResult:
+    _check_bulk_size(len(task_ids))
+    tasks = {task.id: task for task in await _fetch_tasks(id__in=set(task_ids))}
+    results = []
+    changed = []
+    seen = set()
+    for index, task_id in enumerate(task_ids):
+        task = tasks.get(task_id)
+        if task is None:
+            results.append(BulkItemResult(index=index, id=task_id, status="failed", error="Task not found"))
+        elif task_id in seen:
+            results.append(BulkItemResult(index=index, id=task_id, status="failed", error="Id repeated in the request"))
+        elif task.enabled == enabled:
+            results.append(BulkItemResult(index=index, id=task_id, status="unchanged"))
+        else:
+            changed.append((index, task))
+        seen.add(task_id)
+
+    now = datetime.now(timezone.utc)
+    since = change_version("tasks").key
+    async with in_transaction("default") as conn:
+        for chunk in _chunks([task.id for _, task in changed]):
+            await Task.filter(id__in=chunk).using_db(conn).update(enabled=enabled, updated_at=now)
+    scheduler.tasks_committed(since)
+    for index, task in changed:
+        task.enabled = enabled
+        task.updated_at = now
+        results.append(BulkItemResult(index=index, id=task.id, status="enabled" if enabled else "disabled"))
+    await scheduler.apply_tasks([task for _, task in changed], [])
+    return _bulk_result(results)
+
+
+@router.post("/bulk/enable", response_model=BulkResult)
+async def bulk_enable_tasks(body: BulkIds):
+    """
+    Enable many tasks in one transaction
+    """
+    return await _bulk_set_enabled(body.ids, True)
+
+
+@router.post("/bulk/disable", response_model=BulkResult)
+async def bulk_disable_tasks(body: BulkIds):
+    """
+    Disable many tasks in one transaction
+    """
+    return await _bulk_set_enabled(body.ids, False)
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+@bumps("task_logs")
+async def bulk_delete_tasks(body: BulkIds):
+    """
+    Delete many tasks and their logs, the tasks in one transaction
+    """
+    _check_bulk_size(len(body.ids))
+    found = set()
+    for chunk in _chunks(list(set(body.ids))):
+        found.update(await Task.filter(id__in=chunk).values_list("id", flat=True))
+    results = []
+    deleted = []
+    seen = set()
+    for index, task_id in enumerate(body.ids):
+        if task_id not in found:
+            results.append(BulkItemResult(index=index, id=task_id, status="failed", error="Task not found"))
+        elif task_id in seen:
+            results.append(BulkItemResult(index=index, id=task_id, status="failed", error="Id repeated in the request"))
+        else:
+            results.append(BulkItemResult(index=index, id=task_id, status="deleted"))
+            deleted.append(task_id)
+        seen.add(task_id)
+
+    await delete_tasks(deleted)
+    return _bulk_result(results)
+
+
+@router.get("/{task_id}/logs", response_model=PaginatedResponse[TaskLogSummary], response_model_exclude_unset=True)
+@query_budget(3)
 async def get_task_logs(
     task_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    status: Optional[int] = None
+    status: Optional[int] = None,
+    started_after: Optional[datetime] = Query(None, description="Only logs started at or after this time"),
+    started_before: Optional[datetime] = Query(None, description="Only logs started before this time"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
 ):
     """
-    Get execution logs for a specific task
+    Get execution log summaries for a specific task
     """
-    task = await Task.get_or_none(id=task_id)
-    if not task:
+    selected_fields = parse_summary_fields(fields)
+    if not await Task.exists(id=task_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
 
-    query = task.logs.all()
-    if status is not None:
-        query = query.filter(status=status)
-
-    total = await query.count()
-    logs_query = query.offset(skip).limit(limit).order_by("-started_at")
-    return PaginatedResponse(
-        total=total,
-        skip=skip,
-        limit=limit,
-        data=await TaskLog_Pydantic.from_queryset(logs_query)
+    log_filter = LogFilter(
+        task_id=task_id,
+        status=status,
+        started_after=started_after,
+        started_before=started_before
     )
+    return await log_router.page(log_filter, skip, limit, selected_fields)
 
 
 @router.post("/{task_id}/execute", status_code=status.HTTP_202_ACCEPTED)
@@ -7,6 +7,9 @@ from typing import Optional, List
 import os
 from pathlib import Path
 default_db_path = str(Path(__file__).parent.parent/'data'/'db.sqlite3').replace('\\', '/')
+default_partition_dir = str(Path(__file__).parent.parent/'data'/'partitions').replace('\\', '/')
+default_static_dir = str(Path(__file__).parent.parent/'static').replace('\\', '/')
+default_archive_dir = str(Path(__file__).parent.parent/'data'/'archive').replace('\\', '/')
 
 class Settings(BaseSettings):
     app_name: str = "Akari Task Scheduler"
@@ -17,6 +20,19 @@ class Settings(BaseSettings):
     # AKARI_PATH 为存放backend, frontend文件的目录
     db_url: str = f"sqlite://{default_db_path}"
     db_modules: dict = {"models": ["app.models.task", "app.models.log"]}
+    # SQLite performance profile: default, durable, balanced, see DB_PROFILES in app/db/database.py
+    db_profile: str = "balanced"
+    db_pragmas: dict = {}  # per-PRAGMA overrides on top of the profile, e.g. {"mmap_size": 0}
+    db_checkpoint_interval_seconds: int = 300  # 0 disables periodic WAL checkpoints
+    db_read_pool_size: int = 4  # read-only connections for API reads, 0 sends everything through the writer
+    # Keep logs of past months in one SQLite file per month, see app/db/partitions.py
+    log_partitioning: bool = False
+    log_partition_dir: str = default_partition_dir
+    # Move logs older than log_archive_after_days into compressed segment files, see app/db/archive.py
+    log_archive_enabled: bool = False
+    log_archive_dir: str = default_archive_dir
+    log_archive_after_days: int = 90
+    log_archive_segment_rows: int = 5000  # logs per segment file
 
     # Scheduler
     scheduler_max_workers: int = 10
@@ -29,6 +45,65 @@ class Settings(BaseSettings):
     # Task execution
     task_timeout_default: int = 300  # seconds
     task_max_concurrent: int = 5
+    # Event stream, see app/scheduler/event_bus.py
+    event_buffer_size: int = 1000  # recent events kept for clients resuming with Last-Event-ID
+    event_queue_size: int = 1000  # events queued per client before a slow client is disconnected
+    event_heartbeat_seconds: float = 15  # idle time after which a keep-alive comment is sent
+    task_registry_check_seconds: float = 5  # how often task edits made outside this process are looked for
+
+    # Output storage
+    output_compression: str = "auto"  # auto(zstd if installed, else zlib), zstd, zlib, none
+    output_compression_level: int = 6
+    output_compression_threshold: int = 1024  # bytes, smaller outputs are stored as plain text
+    output_compression_migrate: bool = True  # compress existing rows in the background at startup
+    output_compression_batch_size: int = 200
+    output_index_cache_mb: int = 256  # decoded outputs kept for paging, see app/db/output_index.py
+
+    # Response compression, see app/core/compression.py
+    response_compression_min_size: int = 1024  # bytes, smaller responses are sent as is, 0 disables
+    response_gzip_level: int = 6
+    response_brotli_quality: int = 4  # 0-11, higher levels cost too much CPU for dynamic responses
+
+    # Metrics served at GET /metrics, see app/core/metrics.py
+    metrics_loop_lag_interval_seconds: float = 0.5  # how often the event loop lag probe runs
+
+    # Event loop watchdog, see app/core/watchdog.py
+    loop_watchdog_enabled: bool = True
+    loop_watchdog_interval_seconds: float = 0.05  # heartbeat of the loop and check of the watchdog thread
+    loop_watchdog_threshold_seconds: float = 0.25  # blocked time after which the loop's stack is captured
+    loop_watchdog_history: int = 50  # stalls kept for GET /api/diagnostics/loop
+
+    # CPU and memory profiling endpoints, see app/core/profiling.py
+    profiling_enabled: bool = False  # can be switched at runtime with PUT /api/diagnostics/profiling
+    profiling_token: Optional[str] = None  # X-Profiling-Token that PUT requires, switching is refused while unset
+    profiling_max_seconds: float = 60  # longest CPU profile a request may ask for
+    profiling_max_snapshots: int = 5  # tracemalloc snapshots kept for diffs, the oldest is dropped first
+
+    # Per-request timing, see app/core/timing.py
+    server_timing_enabled: bool = True  # send a Server-Timing header with database, ORM and serialization time
+    slow_request_ms: float = 1000  # requests taking longer are logged with their slowest query
+    query_budget_strict: bool = False  # raise instead of logging when a route exceeds its query budget
+
+    # Rows fetched per query by GET /logs/export
+    log_export_batch_size: int = 1000
+
+    # Write-behind log persistence, see app/db/log_writer.py
+    log_write_behind: bool = True
+    log_writer_flush_ms: int = 50  # longest a queued log waits before its batch is written
+    log_writer_batch_size: int = 200  # logs written per transaction at most
+    log_writer_max_pending: int = 5000  # saves block once this many logs are queued
+    log_writer_max_retries: int = 3  # retries of a log whose write failed before it is dropped
+    log_writer_retry_seconds: float = 1.0  # delay before a failed log is written again
+
+    # Log retention, per-task settings on Task override these global defaults
+    retention_enabled: bool = True
+    retention_max_age_days: Optional[int] = None  # delete logs older than this
+    retention_max_runs: Optional[int] = None  # keep at most this many logs per task
+    retention_failure_max_age_days: Optional[int] = None  # keep failed/timed out logs this long instead
+    retention_interval_seconds: int = 3600
+    retention_batch_size: int = 500  # rows deleted per transaction
+    retention_batch_pause: float = 0.05  # seconds yielded to other writers between batches
+    retention_vacuum_pages: int = 1000  # pages reclaimed per incremental vacuum step
 
     # Logging
     log_level: str = "INFO"
@@ -36,6 +111,9 @@ class Settings(BaseSettings):
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
+    # Built frontend, see app/core/static.py
+    static_dir: str = default_static_dir
+    static_precompress: bool = True  # write missing .gz/.br siblings of the assets at startup
     allowed_ips: str = "127.0.0.1/32,192.168.0.0/16,172.17.0.1/32"  # IP和子网掩码标识，半角逗号分割，例如 "192.168.1.0/24,10.0.0.0/8"
 
     def get_allowed_ips(self) -> List[str]:
@@ -0,0 +1,70 @@
+"""
+Conditional GET helpers.
+
+Handlers build an ETag from something cheap, usually a change version from
+app.db.versions, and check it with :func:`is_fresh` before doing the real work,
+so a polling client that already has the current representation gets an empty
+304 instead of a recomputed body.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+# Revalidate on every use, for responses that change
+NO_CACHE = "no-cache"
+# Finished logs never change again
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def make_etag(*parts) -> str:
+    """
+    Weak ETag from the given parts, weak because the body may be re-encoded (e.g. compressed) on the way out
+    """
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Whether the client's cached copy is still current. If-None-Match takes precedence over If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [_opaque(tag) for tag in if_none_match.split(",")]
+        return "*" in tags or _opaque(etag) in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None, cache_control: str = NO_CACHE) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def set_cache_headers(response: Response, etag: str, last_modified: Optional[datetime] = None,
+                      cache_control: str = NO_CACHE):
+    response.headers.update(cache_headers(etag, last_modified, cache_control))
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None, cache_control: str = NO_CACHE) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag, last_modified, cache_control))
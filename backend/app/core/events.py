@@ -1,11 +1,23 @@
 from fastapi import FastAPI
-from app.db.database import init_db, close_db
+from app.config import settings
+from app.db.database import init_db, close_db, checkpoint_periodically
+from app.db.codec import compress_existing_outputs
+from app.db.log_writer import log_writer
+from app.db.partitions import partitions
+from app.db.retention import retention
+from app.db.rollups import rebuild_if_empty
+from app.core.metrics import monitor_event_loop
+from app.core.static import static_site
+from app.core.watchdog import loop_watchdog
 from app.scheduler.scheduler import scheduler
-from app.models.task import Task
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Background maintenance jobs started with the application, cancelled on shutdown
+background_tasks: list[asyncio.Task] = []
+
 
 async def startup_event():
     """
@@ -14,14 +26,33 @@ async def startup_event():
     # Initialize database
     await init_db()
 
+    if settings.log_write_behind:
+        log_writer.start()
+
     # Start scheduler
     await scheduler.start()
 
-    # Load all enabled tasks into scheduler
-    enabled_tasks = await Task.filter(enabled=True).all()
-    for task in enabled_tasks:
-        await scheduler.add_task(task)
-        logger.info(f"Loaded task {task.id} ({task.name}) into scheduler")
+    # Load all tasks into the registry and schedule the enabled ones
+    await scheduler.load_tasks()
+    for task in scheduler.tasks.values():
+        if task.enabled:
+            await scheduler.add_task(task)
+            logger.info(f"Loaded task {task.id} ({task.name}) into scheduler")
+
+    background_tasks.append(asyncio.create_task(scheduler.watch_tasks()))
+    background_tasks.append(asyncio.create_task(monitor_event_loop()))
+    if settings.loop_watchdog_enabled:
+        background_tasks.append(asyncio.create_task(loop_watchdog.run()))
+    static_site.load()
+    if settings.static_precompress:
+        background_tasks.append(asyncio.create_task(static_site.precompress()))
+    background_tasks.append(asyncio.create_task(rebuild_if_empty()))
+    if settings.output_compression_migrate:
+        background_tasks.append(asyncio.create_task(compress_existing_outputs()))
+    if settings.retention_enabled:
+        background_tasks.append(asyncio.create_task(retention.run_periodically()))
+    if settings.db_checkpoint_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(checkpoint_periodically()))
 
     logger.info("Application startup complete")
 
@@ -30,10 +61,20 @@ async def shutdown_event():
     """
     Application shutdown event handler
     """
+    # Stop background maintenance
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
     # Stop scheduler
     await scheduler.stop()
 
+    # Write queued logs before the connections go away
+    await log_writer.stop()
+
     # Close database connections
+    await partitions.close()
     await close_db()
 
     logger.info("Application shutdown complete")
\ No newline at end of file
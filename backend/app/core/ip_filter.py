@@ -0,0 +1,99 @@
+"""
+Client IP allowlist.
+
+``settings.allowed_ips`` is compiled once into sorted, merged integer ranges per
+address family, so checking a client is a binary search instead of parsing every
+CIDR again. The setting is compared on each request and recompiled when it
+changed. The middleware is pure ASGI: allowed requests go straight to the app, so
+streamed bodies and WebSockets are not buffered or wrapped.
+"""
+import ipaddress
+import json
+import logging
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code for a policy violation
+WS_POLICY_VIOLATION = 1008
+
+
+class IPAllowlist:
+    """
+    Compiled form of a list of CIDRs. An empty list allows every client.
+    """
+
+    def __init__(self, cidrs: List[str]):
+        self.empty = True
+        self._starts: Dict[int, List[int]] = {4: [], 6: []}
+        self._ends: Dict[int, List[int]] = {4: [], 6: []}
+        ranges: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        for cidr in cidrs:
+            try:
+                network = ipaddress.ip_network(cidr, strict=False)
+            except ValueError as e:
+                logger.warning(f"Invalid CIDR format '{cidr}': {e}")
+                continue
+            ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+            self.empty = False
+        for version, version_ranges in ranges.items():
+            for start, end in sorted(version_ranges):
+                ends = self._ends[version]
+                if ends and start <= ends[-1] + 1:
+                    # Overlapping or adjacent, extend the previous range
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    self._starts[version].append(start)
+                    ends.append(end)
+
+    def allows(self, host: Optional[str]) -> bool:
+        if self.empty:
+            return True
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        value = int(address)
+        index = bisect_right(self._starts[address.version], value) - 1
+        return index >= 0 and value <= self._ends[address.version][index]
+
+
+class IPFilterMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._source: Optional[str] = None
+        self._allowlist = IPAllowlist([])
+
+    @property
+    def allowlist(self) -> IPAllowlist:
+        if settings.allowed_ips != self._source:
+            self._source = settings.allowed_ips
+            self._allowlist = IPAllowlist(settings.get_allowed_ips())
+        return self._allowlist
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        client_ip = scope["client"][0] if scope.get("client") else None
+        if self.allowlist.allows(client_ip):
+            await self.app(scope, receive, send)
+            return
+
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": WS_POLICY_VIOLATION})
+            return
+        body = json.dumps({"detail": f"IP {client_ip} not allowed"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 403,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
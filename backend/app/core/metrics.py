@@ -0,0 +1,242 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms are plain in-memory collectors: recording a
+value is a dict lookup and an addition under a per-metric lock, so they can be
+updated from the event loop and from executor threads alike. Modules define the
+metrics they record at import time. Each metric registers itself in ``registry``,
+which GET /metrics renders, unless another registry is passed.
+
+Gauges of state that is cheap to read when scraped, like the number of running
+jobs, take a function instead of being set.
+
+Values are per process. akari runs its scheduler and SQLite writer inside the
+one application process, so that process sees every fire and write.
+"""
+import asyncio
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+# Seconds, for latencies of requests, writes and process spawns
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric"):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["Metric"]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, names, values, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+registry = Registry()
+
+
+def _global_registry() -> Registry:
+    return registry
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: Optional[Registry] = None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        (registry or _global_registry()).register(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if len(labels) == len(self.label_names):
+            try:
+                return tuple(str(labels[name]) for name in self.label_names)
+            except KeyError:
+                pass
+        raise ValueError(f"{self.name} takes the labels {', '.join(self.label_names) or 'none'}")
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], Sequence[str], float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: Optional[Registry] = None):
+        super().__init__(name, help, labels, registry)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "_total", self.label_names, key, value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None, registry: Optional[Registry] = None):
+        super().__init__(name, help, labels, registry)
+        if function is not None and labels:
+            raise ValueError("Gauges read from a function take no labels")
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            yield "", (), (), self._function()
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", self.label_names, key, value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS,
+                 registry: Optional[Registry] = None):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts with +Inf last, sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Upper bounds are inclusive, le="0.1" counts 0.1 itself
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bucket] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        names = (*self.label_names, "le")
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                yield "_bucket", names, (*key, _format_value(bound)), cumulative
+            yield "_sum", self.label_names, key, total
+            yield "_count", self.label_names, key, count
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "akari_http_request_duration_seconds", "HTTP request latency until the response is sent", ["method", "route"]
+)
+HTTP_REQUESTS = Counter("akari_http_requests", "HTTP requests by response status", ["method", "route", "status"])
+EVENT_LOOP_LAG = Gauge("akari_event_loop_lag_seconds", "Delay of the last event loop lag probe past its wake-up time")
+
+
+class MetricsMiddleware:
+    """
+    Times HTTP requests per route template, so /api/tasks/1 and /api/tasks/2 share a series
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=path)
+            HTTP_REQUESTS.inc(method=scope["method"], route=path, status=status_code)
+
+
+async def monitor_event_loop():
+    """
+    Background loop measuring how late a sleep wakes up, a busy or blocked loop wakes it late
+    """
+    interval = settings.metrics_loop_lag_interval_seconds
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(loop.time() - start - interval, 0))
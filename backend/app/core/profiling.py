@@ -0,0 +1,227 @@
+"""
+On-demand CPU and memory profiling of the running process.
+
+:meth:`Profiler.sample_cpu` is a statistical profiler: a worker thread reads
+the stack of every other thread with ``sys._current_frames()`` at a fixed
+interval for a bounded time, so it covers the event loop and the executor
+threads alike at a cost independent of what they run. Samples are aggregated
+into collapsed stacks (one ``thread;outer;...;inner count`` line per distinct
+stack, the input of flame graph tools) and into per-function counts of
+samples spent in the function itself and below it. Threads waiting for work
+are left out unless asked for.
+
+Memory profiling wraps ``tracemalloc``: it is started on request, snapshots are
+kept in memory under an id and any two of them can be compared.
+
+Both are off unless ``settings.profiling_enabled`` is set, which can be changed
+at runtime through PUT /api/diagnostics/profiling with ``settings.profiling_token``.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.config import settings
+
+# Innermost frames of threads waiting for work: the event loop in select(), idle
+# executor workers and threads waiting on a condition
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+}
+# Frames of the import system and of tracemalloc itself, left out of memory statistics
+MEMORY_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+
+class ProfilerBusy(Exception):
+    """
+    Raised when a CPU profile is requested while another one runs
+    """
+
+
+class FunctionSamples(BaseModel):
+    function: str
+    own: int  # samples with the function innermost
+    total: int  # samples with the function anywhere on the stack
+
+
+class CPUProfile(BaseModel):
+    seconds: float
+    samples: int
+    collapsed: Dict[str, int]
+    functions: List[FunctionSamples]
+
+
+class MemoryStatistic(BaseModel):
+    location: str
+    size: int
+    count: int
+    size_diff: Optional[int] = None
+    count_diff: Optional[int] = None
+
+
+class MemorySnapshot(BaseModel):
+    id: int
+    taken_at: datetime
+    traced_bytes: int
+    peak_bytes: int
+    top: List[MemoryStatistic]
+
+
+class MemoryDiff(BaseModel):
+    base: int
+    target: int
+    size_diff: int
+    top: List[MemoryStatistic]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+def _statistic(stat) -> MemoryStatistic:
+    frame = stat.traceback[0]
+    return MemoryStatistic(
+        location=f"{frame.filename}:{frame.lineno}",
+        size=stat.size,
+        count=stat.count,
+        size_diff=getattr(stat, "size_diff", None),
+        count_diff=getattr(stat, "count_diff", None),
+    )
+
+
+class Profiler:
+    def __init__(self):
+        self._cpu_lock = asyncio.Lock()
+        self._snapshots: "OrderedDict[int, Tuple[datetime, tracemalloc.Snapshot]]" = OrderedDict()
+        self._next_snapshot_id = 1
+
+    # CPU
+
+    async def sample_cpu(self, seconds: float, interval: float, idle: bool = False) -> CPUProfile:
+        """
+        Sample the stacks of every thread for ``seconds``, one sample per ``interval``
+        """
+        if self._cpu_lock.locked():
+            raise ProfilerBusy("A CPU profile is already running")
+        async with self._cpu_lock:
+            stacks, samples = await asyncio.to_thread(self._sample, seconds, interval, idle)
+        return self._aggregate(seconds, samples, stacks)
+
+    @staticmethod
+    def _sample(seconds: float, interval: float, idle: bool) -> Tuple[Counter, int]:
+        own = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (not idle and _is_idle(frame)):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks[tuple(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, samples
+
+    @staticmethod
+    def _aggregate(seconds: float, samples: int, stacks: Counter) -> CPUProfile:
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in stacks.items():
+            # The first entry is the thread name
+            own[stack[-1]] += count
+            for function in set(stack[1:]):
+                total[function] += count
+        functions = [
+            FunctionSamples(function=function, own=own[function], total=count)
+            for function, count in total.most_common()
+        ]
+        return CPUProfile(
+            seconds=seconds,
+            samples=samples,
+            collapsed={";".join(stack): count for stack, count in stacks.most_common()},
+            functions=functions,
+        )
+
+    # Memory
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    @property
+    def traceback_limit(self) -> int:
+        return tracemalloc.get_traceback_limit()
+
+    def start_tracing(self, frames: int):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self._snapshots.clear()
+
+    def take_snapshot(self, limit: int) -> MemorySnapshot:
+        """
+        Snapshot the traced allocations, kept for :meth:`compare` until more than
+        ``settings.profiling_max_snapshots`` were taken
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        traced, peak = tracemalloc.get_traced_memory()
+        snapshot_id = self._next_snapshot_id
+        self._next_snapshot_id += 1
+        taken_at = datetime.now(timezone.utc)
+        self._snapshots[snapshot_id] = (taken_at, snapshot)
+        while len(self._snapshots) > settings.profiling_max_snapshots:
+            self._snapshots.popitem(last=False)
+        return MemorySnapshot(
+            id=snapshot_id,
+            taken_at=taken_at,
+            traced_bytes=traced,
+            peak_bytes=peak,
+            top=[_statistic(stat) for stat in snapshot.statistics("lineno")[:limit]],
+        )
+
+    def snapshot_ids(self) -> List[int]:
+        return list(self._snapshots)
+
+    def compare(self, base: int, target: int, limit: int) -> Optional[MemoryDiff]:
+        """
+        Allocation growth from snapshot ``base`` to ``target``, largest first. None if either is not kept.
+        """
+        if base not in self._snapshots or target not in self._snapshots:
+            return None
+        differences = self._snapshots[target][1].compare_to(self._snapshots[base][1], "lineno")
+        return MemoryDiff(
+            base=base,
+            target=target,
+            size_diff=sum(stat.size_diff for stat in differences),
+            top=[_statistic(stat) for stat in differences[:limit]],
+        )
+
+
+# Global profiler instance
+profiler = Profiler()
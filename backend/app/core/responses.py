@@ -0,0 +1,17 @@
+"""
+JSON response class of the API routers.
+
+FastAPI validates and converts the response through its response model first, the
+response class only renders the result to bytes. orjson does that four to five
+times faster than the standard library encoder, which adds up on 1000-row log
+pages and large outputs (see benchmarks/bench_responses.py). It is optional,
+without it the routers use the standard JSONResponse.
+"""
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+FastJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
@@ -0,0 +1,211 @@
+"""
+Serving of the built frontend.
+
+The files under ``settings.static_dir`` are indexed once: the size, mtime and
+ETag of every asset, and ``index.html`` itself, kept in memory along with its
+compressed forms. Requests do not touch the filesystem except to send an asset's
+bytes. Assets are sent from a precompressed ``.br``/``.gz`` sibling when the
+client accepts it, :meth:`StaticSite.precompress` builds missing ones at startup.
+Vite's hashed asset names change with their content and are cached as immutable,
+``index.html`` is revalidated by ETag. The index is rebuilt when a requested
+asset is missing and the assets directory changed, e.g. after a redeploy.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import Request, Response, status
+from fastapi.responses import FileResponse
+
+from app.config import settings
+from app.core.caching import make_etag, is_fresh, not_modified, cache_headers, IMMUTABLE, NO_CACHE
+from app.core.compression import COMPRESSIBLE_TYPES, brotli, negotiate_encoding
+
+logger = logging.getLogger(__name__)
+
+# Vite names assets <name>-<hash>.<ext>
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+# Sibling suffix of each precompressed encoding
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class StaticFile(NamedTuple):
+    path: Path
+    stat: os.stat_result
+    media_type: str
+    etag: str
+    cache_control: str
+    # encoding -> (path, stat) of the precompressed sibling
+    variants: Dict[str, tuple]
+
+
+class IndexPage(NamedTuple):
+    etag: str
+    # encoding -> body, "identity" is the plain page
+    bodies: Dict[str, bytes]
+
+
+def _media_type(path: Path) -> str:
+    return mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+
+def _compressible(media_type: str) -> bool:
+    return media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class StaticSite:
+    def __init__(self):
+        self.directory: Optional[Path] = None
+        self.assets: Dict[str, StaticFile] = {}
+        self.index: Optional[IndexPage] = None
+        self._assets_mtime: Optional[float] = None
+
+    @property
+    def assets_dir(self) -> Path:
+        return self.directory / "assets"
+
+    def load(self):
+        """
+        (Re)index the static directory
+        """
+        self.directory = Path(settings.static_dir)
+        self.assets = {}
+        self.index = None
+        self._assets_mtime = None
+        try:
+            self._assets_mtime = self.assets_dir.stat().st_mtime
+        except FileNotFoundError:
+            logger.warning(f"No frontend assets in {self.assets_dir}")
+        else:
+            for path in self.assets_dir.rglob("*"):
+                if path.is_file() and path.suffix not in (".br", ".gz", ".tmp"):
+                    self._index_asset(path)
+        try:
+            page = (self.directory / "index.html").read_bytes()
+        except FileNotFoundError:
+            logger.warning(f"No frontend index.html in {self.directory}")
+            return
+        bodies = {"identity": page}
+        if len(page) >= settings.response_compression_min_size:
+            for encoding in self._encodings():
+                bodies[encoding] = _compress(page, encoding)
+        self.index = IndexPage(make_etag("index", hashlib.sha1(page).hexdigest()), bodies)
+
+    @staticmethod
+    def _encodings() -> list:
+        return [encoding for encoding in ENCODING_SUFFIXES if encoding != "br" or brotli is not None]
+
+    def _index_asset(self, path: Path):
+        stat = path.stat()
+        variants = {}
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            sibling = path.with_name(path.name + suffix)
+            try:
+                sibling_stat = sibling.stat()
+            except FileNotFoundError:
+                continue
+            # Stale siblings of a replaced file are ignored
+            if sibling_stat.st_mtime >= stat.st_mtime:
+                variants[encoding] = (sibling, sibling_stat)
+        name = path.relative_to(self.assets_dir).as_posix()
+        self.assets[name] = StaticFile(
+            path=path,
+            stat=stat,
+            media_type=_media_type(path),
+            etag=make_etag("asset", name, stat.st_mtime_ns, stat.st_size),
+            cache_control=IMMUTABLE if HASHED_NAME.search(path.name) else NO_CACHE,
+            variants=variants,
+        )
+
+    async def precompress(self):
+        """
+        Write the missing ``.gz`` (and ``.br`` with brotli installed) siblings of
+        compressible assets, then reindex
+        """
+        if self.directory is None:
+            self.load()
+        encodings = self._encodings()
+        written = 0
+        for asset in list(self.assets.values()):
+            if not _compressible(asset.media_type) or asset.stat.st_size < settings.response_compression_min_size:
+                continue
+            for encoding in encodings:
+                if encoding not in asset.variants:
+                    try:
+                        await asyncio.to_thread(self._write_variant, asset.path, encoding)
+                        written += 1
+                    except OSError as e:
+                        logger.warning(f"Cannot precompress {asset.path}: {e}")
+        if written:
+            logger.info(f"Precompressed {written} frontend assets")
+            self.load()
+
+    @staticmethod
+    def _write_variant(path: Path, encoding: str):
+        target = path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+        temporary = target.with_name(target.name + ".tmp")
+        temporary.write_bytes(_compress(path.read_bytes(), encoding))
+        os.replace(temporary, target)
+
+    def _find_asset(self, name: str) -> Optional[StaticFile]:
+        if self.directory is None:
+            self.load()
+        asset = self.assets.get(name)
+        if asset is None:
+            try:
+                changed = self.assets_dir.stat().st_mtime != self._assets_mtime
+            except FileNotFoundError:
+                changed = False
+            if changed:
+                self.load()
+                asset = self.assets.get(name)
+        return asset
+
+    def asset_response(self, name: str, request: Request) -> Response:
+        asset = self._find_asset(name)
+        if asset is None:
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        if is_fresh(request, asset.etag):
+            return not_modified(asset.etag, cache_control=asset.cache_control)
+        headers = cache_headers(asset.etag, cache_control=asset.cache_control)
+        path, stat = asset.path, asset.stat
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+            encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+            if encoding in asset.variants:
+                path, stat = asset.variants[encoding]
+                headers["Content-Encoding"] = encoding
+        return FileResponse(path, headers=headers, media_type=asset.media_type, stat_result=stat)
+
+    def index_response(self, request: Request) -> Response:
+        if self.directory is None:
+            self.load()
+        if self.index is None:
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        if is_fresh(request, self.index.etag):
+            return not_modified(self.index.etag)
+        headers = cache_headers(self.index.etag)
+        headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        body = self.index.bodies.get(encoding)
+        if body is None:
+            body = self.index.bodies["identity"]
+        else:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type="text/html", headers=headers)
+
+
+# Global static site instance
+static_site = StaticSite()
@@ -0,0 +1,240 @@
+"""
+Per-request accounting of database, ORM and serialization time.
+
+:class:`ServerTimingMiddleware` starts a :class:`RequestTiming` for every HTTP
+request in a context variable. :func:`instrument_queries` wraps the query
+methods of Tortoise's SQLite client once, so every query run on behalf of the
+request is counted and timed. That includes waiting for the connection, which
+is time the request spends on the database too. It also wraps the ORM
+executor's select, whose time beyond its query is the hydration of model
+instances. Routers built with ``route_class=TimedRoute`` time their response
+serialization: everything from the endpoint's return to the finished
+Response, that is response model validation, encoding and rendering.
+
+The totals go out in a ``Server-Timing`` header, which browser dev tools
+show per request. Requests slower than ``settings.slow_request_ms`` are
+logged with the slowest query. Routes can declare how many queries they
+may run with :func:`query_budget`. Going over the budget is logged, or
+raises :class:`QueryBudgetExceeded` with ``settings.query_budget_strict``,
+which tests turn on.
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise.backends.base.executor import BaseExecutor
+from tortoise.backends.sqlite.client import SqliteClient, TransactionWrapper
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUERY_METHODS = ("execute_insert", "execute_many", "execute_query", "execute_query_dict", "execute_script")
+# Characters of the slowest query kept for the slow request log
+SLOW_QUERY_TEXT_LENGTH = 1000
+
+_current: ContextVar[Optional["RequestTiming"]] = ContextVar("request_timing", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised in strict mode when a route runs more queries than its budget
+    """
+
+
+class RequestTiming:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total: Optional[float] = None  # until the response started
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.orm_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.endpoint_returned: Optional[float] = None
+        self.slowest_query: Optional[str] = None
+        self.slowest_query_seconds = 0.0
+
+    def add_query(self, sql: str, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        if seconds >= self.slowest_query_seconds:
+            self.slowest_query, self.slowest_query_seconds = sql, seconds
+
+    def finish(self):
+        if self.total is None:
+            self.total = time.perf_counter() - self.start
+
+    def header(self) -> str:
+        metrics = [
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"',
+            f"orm;dur={self.orm_seconds * 1000:.1f}",
+            f"serialize;dur={self.serialize_seconds * 1000:.1f}",
+            f"total;dur={self.total * 1000:.1f}",
+        ]
+        return ", ".join(metrics)
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            "queries": self.queries,
+            "db_ms": round(self.db_seconds * 1000, 1),
+            "orm_ms": round(self.orm_seconds * 1000, 1),
+            "serialize_ms": round(self.serialize_seconds * 1000, 1),
+            "slowest_query_ms": round(self.slowest_query_seconds * 1000, 1),
+            "slowest_query": (self.slowest_query or "")[:SLOW_QUERY_TEXT_LENGTH] or None,
+        }
+
+
+def current_timing() -> Optional[RequestTiming]:
+    """
+    Timing of the request being handled, None outside requests
+    """
+    return _current.get()
+
+
+def _timed_query(method: Callable) -> Callable:
+    @functools.wraps(method)
+    async def wrapper(self, query: str, *args, **kwargs):
+        timing = _current.get()
+        if timing is None:
+            return await method(self, query, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            timing.add_query(query, time.perf_counter() - start)
+    wrapper._timed = True
+    return wrapper
+
+
+def _timed_select(method: Callable) -> Callable:
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        timing = _current.get()
+        if timing is None:
+            return await method(self, *args, **kwargs)
+        start, db_before = time.perf_counter(), timing.db_seconds
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            timing.orm_seconds += time.perf_counter() - start - (timing.db_seconds - db_before)
+    wrapper._timed = True
+    return wrapper
+
+
+def instrument_queries():
+    """
+    Wrap the client and executor methods timed per request, safe to call repeatedly
+    """
+    targets = [(cls, name, _timed_query) for cls in (SqliteClient, TransactionWrapper) for name in QUERY_METHODS]
+    targets.append((BaseExecutor, "execute_select", _timed_select))
+    for cls, name, wrap in targets:
+        # Only methods the class defines itself, inherited ones are wrapped on their class
+        method = cls.__dict__.get(name)
+        if method is not None and not getattr(method, "_timed", False):
+            setattr(cls, name, wrap(method))
+
+
+def query_budget(queries: int):
+    """
+    Declare the most queries an endpoint may run, checked by TimedRoute
+    """
+    def decorate(endpoint: Callable) -> Callable:
+        endpoint.query_budget = queries
+        return endpoint
+    return decorate
+
+
+def _endpoint_returned():
+    timing = _current.get()
+    if timing is not None:
+        timing.endpoint_returned = time.perf_counter()
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _endpoint_returned()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _endpoint_returned()
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """
+    Route timing its response serialization and checking its query budget
+    """
+
+    def get_route_handler(self) -> Callable:
+        # The request handler calls dependant.call, which is the endpoint
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+        budget = getattr(self.endpoint, "query_budget", None)
+
+        async def timed_handler(request: Request):
+            response = await handler(request)
+            timing = _current.get()
+            if timing is None:
+                return response
+            if timing.endpoint_returned is not None:
+                timing.serialize_seconds += time.perf_counter() - timing.endpoint_returned
+            if budget is not None and timing.queries > budget:
+                message = f"{request.method} {self.path} ran {timing.queries} queries, over its budget of {budget}"
+                if settings.query_budget_strict:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        return timed_handler
+
+
+class ServerTimingMiddleware:
+    """
+    Times every HTTP request, sends the Server-Timing header and logs slow requests
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.server_timing_enabled:
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming()
+        token = _current.set(timing)
+        status_code = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timing.finish()
+                MutableHeaders(scope=message).append("Server-Timing", timing.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            timing.finish()
+            if timing.total * 1000 >= settings.slow_request_ms:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                details = {"method": scope["method"], "route": route, "path": scope["path"],
+                           "status": status_code, **timing.summary()}
+                logger.warning(f"Slow request {json.dumps(details)}", extra={"request_timing": details})
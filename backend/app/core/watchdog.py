@@ -0,0 +1,135 @@
+"""
+Watchdog for a blocked event loop.
+
+The scheduler fires tasks from the same event loop that serves requests, so a
+slow query, a large serialization or a blocking call in a coroutine delays every
+fire behind it. :meth:`LoopWatchdog.run` keeps a heartbeat on the loop, and a
+separate thread checks that the heartbeat keeps coming. When it is more than
+``loop_watchdog_threshold_seconds`` late the thread captures the stack of the
+loop's thread, which is the code blocking it at that moment, along with the
+asyncio task being run. Stalls are logged and the most recent ones are served
+by GET /api/diagnostics/loop.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional
+
+from pydantic import BaseModel
+
+from app.config import settings
+from app.core.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+LOOP_STALLS = Counter("akari_event_loop_stalls", "Times the event loop was blocked past the watchdog threshold")
+
+
+class LoopStall(BaseModel):
+    detected_at: datetime
+    blocked_seconds: float = 0  # updated until the loop runs again
+    resolved: bool = False
+    task: Optional[str] = None  # asyncio task running when detected, none for a plain callback
+    stack: List[str] = []
+
+
+class LoopReport(BaseModel):
+    running: bool
+    threshold_seconds: float
+    lag_seconds: float
+    stalls: List[LoopStall]
+
+
+def _describe_task(task: Optional[asyncio.Task]) -> Optional[str]:
+    if task is None:
+        return None
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', repr(coro))})"
+
+
+class LoopWatchdog:
+    def __init__(self):
+        self.stalls: Deque[LoopStall] = deque(maxlen=settings.loop_watchdog_history)
+        # Lateness of the last heartbeat, in seconds
+        self.lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._beat = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def run(self):
+        """
+        Background loop started with the application, beats until cancelled while a
+        thread watches the beats
+        """
+        interval = settings.loop_watchdog_interval_seconds
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        stop = threading.Event()
+        threading.Thread(target=self._watch, args=(stop,), name="loop-watchdog", daemon=True).start()
+        try:
+            while True:
+                start = time.monotonic()
+                await asyncio.sleep(interval)
+                self._beat = time.monotonic()
+                self.lag = max(self._beat - start - interval, 0)
+        finally:
+            stop.set()
+            self._loop = None
+
+    def report(self) -> LoopReport:
+        return LoopReport(
+            running=self.running,
+            threshold_seconds=settings.loop_watchdog_threshold_seconds,
+            lag_seconds=self.lag,
+            stalls=list(reversed(self.stalls)),
+        )
+
+    def _watch(self, stop: threading.Event):
+        # Runs in the watchdog thread
+        interval = settings.loop_watchdog_interval_seconds
+        threshold = settings.loop_watchdog_threshold_seconds
+        stall: Optional[LoopStall] = None
+        while not stop.wait(interval):
+            # A healthy loop beats every interval
+            blocked = time.monotonic() - self._beat - interval
+            if blocked > threshold:
+                if stall is None:
+                    stall = self._capture(blocked)
+                else:
+                    stall.blocked_seconds = blocked
+            elif stall is not None:
+                # The beat that ended the stall measured how late it was
+                stall.blocked_seconds = max(stall.blocked_seconds, self.lag)
+                stall.resolved = True
+                logger.warning(f"Event loop was blocked for {stall.blocked_seconds:.3f}s")
+                stall = None
+
+    def _capture(self, blocked: float) -> LoopStall:
+        frame = sys._current_frames().get(self._thread_id)
+        loop = self._loop
+        stall = LoopStall(
+            detected_at=datetime.now(timezone.utc),
+            blocked_seconds=blocked,
+            task=_describe_task(asyncio.current_task(loop)) if loop is not None else None,
+            stack=traceback.format_stack(frame) if frame is not None else [],
+        )
+        self.stalls.append(stall)
+        LOOP_STALLS.inc()
+        logger.warning(
+            f"Event loop blocked for {blocked:.3f}s, running {stall.task or 'a callback'}:\n{''.join(stall.stack)}"
+        )
+        return stall
+
+
+# Global event loop watchdog
+loop_watchdog = LoopWatchdog()
@@ -0,0 +1,457 @@
+"""
+Cold archive of old task logs.
+
+When ``settings.log_archive_enabled`` is on, finished logs older than
+``log_archive_after_days`` are moved out of SQLite, from the live table and from
+whole monthly partitions, into immutable gzip compressed JSON Lines segments in
+``log_archive_dir``. Each segment is two files, ``logs_<n>.jsonl.gz`` with the
+log summaries and ``outputs_<n>.jsonl.gz`` with their full output in the same
+order, so listing and counting archived logs never decompresses any output.
+
+``manifest.json`` indexes the segments by id range, time range and per-task
+counts. app.db.log_router uses it to skip every segment a query cannot match and
+to count many queries without opening a segment at all. Segments are never
+rewritten, deleting an archived log records a tombstone in the manifest instead.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from tortoise.expressions import Q
+
+from app.config import settings
+from app.db.blobs import delete_logs, resolve_outputs
+from app.db.partitions import partitions, Partition, FINISHED_STATUSES, as_utc
+from app.models.log import TaskLog, LOG_SUMMARY_FIELDS, LIFECYCLE_FIELDS
+
+if TYPE_CHECKING:
+    from app.db.log_router import LogFilter
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+OUTPUT_FIELDS = ("stdout", "stderr")
+DATETIME_FIELDS = ("started_at", "finished_at", "created_at", *LIFECYCLE_FIELDS)
+# Summary of a log with every field empty, segments written before a field existed lack it
+EMPTY_SUMMARY = dict.fromkeys(LOG_SUMMARY_FIELDS)
+
+
+def _timestamp(value) -> Optional[str]:
+    # The ORM returns datetimes, partitions return the stored text
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return as_utc(value).astimezone(timezone.utc).isoformat()
+
+
+def _log_time(row: dict) -> datetime:
+    """
+    Time a log is archived and pruned by, logs created without a start time fall back to created_at
+    """
+    return datetime.fromisoformat(row["started_at"] or row["created_at"])
+
+
+class Segment(BaseModel):
+    """
+    Manifest entry of one archive segment
+    """
+    name: str
+    rows: int
+    min_id: int
+    max_id: int
+    start: datetime
+    end: datetime
+    task_counts: Dict[int, int]
+    bytes: int = 0
+    # Tombstones, archived log id -> task id
+    deleted: Dict[int, int] = {}
+
+    @property
+    def logs_file(self) -> str:
+        return f"logs_{self.name}.jsonl.gz"
+
+    @property
+    def outputs_file(self) -> str:
+        return f"outputs_{self.name}.jsonl.gz"
+
+    def overlaps(self, after: Optional[datetime], before: Optional[datetime]) -> bool:
+        if after is not None and self.end < as_utc(after):
+            return False
+        if before is not None and self.start >= as_utc(before):
+            return False
+        return True
+
+    def inside(self, after: Optional[datetime], before: Optional[datetime]) -> bool:
+        return (after is None or self.start >= as_utc(after)) and (before is None or self.end < as_utc(before))
+
+    def may_match(self, log_filter: LogFilter) -> bool:
+        if log_filter.filters_tasks and not any(log_filter.matches_task(task_id) for task_id in self.task_counts):
+            return False
+        return self.overlaps(log_filter.started_after, log_filter.started_before)
+
+    def known_count(self, log_filter: LogFilter) -> Optional[int]:
+        """
+        Number of matching logs if the manifest alone can tell, None if the segment has to be read
+        """
+        if log_filter.status is not None or log_filter.search:
+            return None
+        if not self.inside(log_filter.started_after, log_filter.started_before):
+            return None
+        if not log_filter.filters_tasks:
+            return self.rows - len(self.deleted)
+        count = sum(rows for task_id, rows in self.task_counts.items() if log_filter.matches_task(task_id))
+        return count - sum(1 for task_id in self.deleted.values() if log_filter.matches_task(task_id))
+
+
+class ArchiveManifest(BaseModel):
+    version: int = 1
+    next_segment: int = 1
+    segments: List[Segment] = []
+
+
+def _matches(row: dict, output: Optional[dict], log_filter: LogFilter) -> bool:
+    if not log_filter.matches_task(row["task_id"]):
+        return False
+    if log_filter.status is not None and row["status"] != log_filter.status:
+        return False
+    if log_filter.started_after is not None or log_filter.started_before is not None:
+        log_time = _log_time(row)
+        if log_filter.started_after is not None and log_time < as_utc(log_filter.started_after):
+            return False
+        if log_filter.started_before is not None and log_time >= as_utc(log_filter.started_before):
+            return False
+    if log_filter.search:
+        search = log_filter.search.lower()
+        texts = [row["command_executed"], row["error_message"]]
+        if output is not None:
+            texts += [output["stdout"], output["stderr"]]
+        if not any(text and search in text.lower() for text in texts):
+            return False
+    return True
+
+
+class LogArchive:
+    """
+    Writes, indexes and reads the archive segments
+    """
+
+    def __init__(self):
+        self._manifest: Optional[ArchiveManifest] = None
+        self._manifest_dir: Optional[Path] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.log_archive_enabled
+
+    @property
+    def directory(self) -> Path:
+        return Path(settings.log_archive_dir)
+
+    @property
+    def manifest(self) -> ArchiveManifest:
+        directory = self.directory
+        if self._manifest is None or self._manifest_dir != directory:
+            path = directory / MANIFEST_FILE
+            if path.is_file():
+                self._manifest = ArchiveManifest.model_validate_json(path.read_text(encoding="utf-8"))
+            else:
+                self._manifest = ArchiveManifest()
+            self._manifest_dir = directory
+        return self._manifest
+
+    def _save_manifest(self):
+        path = self.directory / MANIFEST_FILE
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(self.manifest.model_dump_json(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def segments(self, log_filter: Optional[LogFilter] = None) -> List[Segment]:
+        """
+        Segments the filter may match, newest first. Empty when archiving is disabled.
+        """
+        if not self.enabled:
+            return []
+        found = [
+            segment for segment in self.manifest.segments
+            if log_filter is None or segment.may_match(log_filter)
+        ]
+        return sorted(found, key=lambda segment: segment.end, reverse=True)
+
+    def stats(self) -> dict:
+        segments = self.segments()
+        return {
+            "enabled": self.enabled,
+            "segments": len(segments),
+            "logs": sum(segment.rows - len(segment.deleted) for segment in segments),
+            "bytes": sum(segment.bytes for segment in segments),
+            "oldest": min((segment.start for segment in segments), default=None),
+            "newest": max((segment.end for segment in segments), default=None),
+        }
+
+    # Reading
+
+    def _read(self, segment: Segment, log_filter: Optional[LogFilter], with_output: bool,
+              log_id: Optional[int] = None) -> List[dict]:
+        read_outputs = with_output or bool(log_filter is not None and log_filter.search)
+        matched = []
+        with gzip.open(self.directory / segment.logs_file, "rt", encoding="utf-8") as logs:
+            outputs = gzip.open(self.directory / segment.outputs_file, "rt", encoding="utf-8") if read_outputs else None
+            try:
+                for line in logs:
+                    output = json.loads(next(outputs)) if outputs is not None else None
+                    row = {**EMPTY_SUMMARY, **json.loads(line)}
+                    if row["id"] in segment.deleted or (log_id is not None and row["id"] != log_id):
+                        continue
+                    if log_filter is not None and not _matches(row, output, log_filter):
+                        continue
+                    if with_output:
+                        row.update(stdout=output["stdout"], stderr=output["stderr"])
+                    matched.append(row)
+                    if log_id is not None:
+                        break
+            finally:
+                if outputs is not None:
+                    outputs.close()
+        return matched
+
+    async def scan(self, segment: Segment, log_filter: Optional[LogFilter] = None,
+                   with_output: bool = False) -> List[dict]:
+        """
+        Matching logs of a segment, newest first. Decompression runs in a worker thread.
+        """
+        return await asyncio.to_thread(self._read, segment, log_filter, with_output)
+
+    async def get(self, log_id: int, with_output: bool = True) -> Optional[dict]:
+        """
+        Archived log, including its output unless ``with_output`` is False
+        """
+        for segment in self.segments():
+            if segment.min_id <= log_id <= segment.max_id and log_id not in segment.deleted:
+                rows = await asyncio.to_thread(self._read, segment, None, with_output, log_id)
+                if rows:
+                    return rows[0]
+        return None
+
+    # Deleting
+
+    async def delete(self, log_id: int) -> bool:
+        """
+        Tombstone one archived log
+        """
+        for segment in self.segments():
+            if segment.min_id <= log_id <= segment.max_id and log_id not in segment.deleted:
+                rows = await asyncio.to_thread(self._read, segment, None, False, log_id)
+                if rows:
+                    async with self._lock:
+                        segment.deleted[log_id] = rows[0]["task_id"]
+                        await self._settle(segment)
+                    return True
+        return False
+
+    async def delete_matching(self, log_filter: LogFilter) -> int:
+        """
+        Delete every archived log matching the filter. Segments entirely inside a pure
+        time range are dropped whole, others get tombstones. Returns the number of logs deleted.
+        """
+        deleted = 0
+        for segment in self.segments(log_filter):
+            if log_filter.is_time_range_only and segment.inside(log_filter.started_after, log_filter.started_before):
+                deleted += await self.drop(segment)
+                continue
+            rows = await self.scan(segment, log_filter)
+            if rows:
+                async with self._lock:
+                    segment.deleted.update({row["id"]: row["task_id"] for row in rows})
+                    await self._settle(segment)
+                deleted += len(rows)
+        return deleted
+
+    async def _settle(self, segment: Segment):
+        # Called with the lock held, a segment without live logs left is removed
+        if len(segment.deleted) >= segment.rows:
+            self._remove(segment)
+        self._save_manifest()
+
+    def _remove(self, segment: Segment):
+        self.manifest.segments = [entry for entry in self.manifest.segments if entry.name != segment.name]
+        for name in (segment.logs_file, segment.outputs_file):
+            try:
+                os.remove(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+    async def drop(self, segment: Segment) -> int:
+        """
+        Drop a whole segment. Returns the number of logs it still held.
+        """
+        async with self._lock:
+            self._remove(segment)
+            self._save_manifest()
+        logger.info(f"Dropped archive segment {segment.name} with {segment.rows - len(segment.deleted)} logs")
+        return segment.rows - len(segment.deleted)
+
+    # Archiving
+
+    def _write_segment(self, name: str, rows: List[dict]) -> Segment:
+        """
+        Write rows (newest first) as an immutable segment. Files are written under a
+        temporary name and renamed, so a segment is either complete or absent.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        size = 0
+        for filename, fields in (
+            (f"logs_{name}.jsonl.gz", LOG_SUMMARY_FIELDS),
+            (f"outputs_{name}.jsonl.gz", ["id", *OUTPUT_FIELDS]),
+        ):
+            path = self.directory / filename
+            tmp = path.with_name(f"{filename}.tmp")
+            with open(tmp, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as compressed:
+                    for row in rows:
+                        line = json.dumps({field: row[field] for field in fields}, separators=(",", ":"))
+                        compressed.write(line.encode("utf-8") + b"\n")
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp, path)
+            size += path.stat().st_size
+        task_counts: Dict[int, int] = {}
+        for row in rows:
+            task_counts[row["task_id"]] = task_counts.get(row["task_id"], 0) + 1
+        times = [_log_time(row) for row in rows]
+        return Segment(
+            name=name,
+            rows=len(rows),
+            min_id=min(row["id"] for row in rows),
+            max_id=max(row["id"] for row in rows),
+            start=min(times),
+            end=max(times),
+            task_counts=task_counts,
+            bytes=size,
+        )
+
+    async def _seal(self, rows: List[dict]) -> Segment:
+        """
+        Write buffered rows as the next segment and record it in the manifest
+        """
+        rows = sorted(rows, key=lambda row: (_log_time(row), row["id"]), reverse=True)
+        manifest = self.manifest
+        name = f"{manifest.next_segment:06d}"
+        segment = await asyncio.to_thread(self._write_segment, name, rows)
+        manifest.next_segment += 1
+        manifest.segments.append(segment)
+        self._save_manifest()
+        return segment
+
+    @staticmethod
+    def _full_segments(buffer: List[dict], final: bool) -> List[List[dict]]:
+        """
+        Take every full segment off the front of the buffer, and the remainder once the source is exhausted
+        """
+        size = settings.log_archive_segment_rows
+        taken = []
+        while len(buffer) >= size or (final and buffer):
+            taken.append(buffer[:size])
+            del buffer[:size]
+        return taken
+
+    @staticmethod
+    def _archive_row(row: dict) -> dict:
+        archived = {field: row[field] for field in (*LOG_SUMMARY_FIELDS, *OUTPUT_FIELDS)}
+        for field in DATETIME_FIELDS:
+            archived[field] = _timestamp(archived[field])
+        return archived
+
+    async def archive(self, now: Optional[datetime] = None, batch_size: Optional[int] = None,
+                      pause: Optional[float] = None) -> int:
+        """
+        Move finished logs older than ``log_archive_after_days`` into new segments.
+        Partitions are archived once they lie entirely before the cutoff and then
+        dropped, live rows are deleted after the segment holding them is written.
+        Returns the number of logs archived.
+        """
+        if not self.enabled:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=settings.log_archive_after_days)
+        batch_size = batch_size or settings.retention_batch_size
+        pause = settings.retention_batch_pause if pause is None else pause
+        archived = 0
+        async with self._lock:
+            for partition in reversed(partitions.partitions(before=cutoff)):
+                if partition.end <= cutoff:
+                    archived += await self._archive_partition(partition, batch_size, pause)
+            archived += await self._archive_live(cutoff, batch_size, pause)
+        if archived:
+            logger.info(f"Archived {archived} logs older than {cutoff.isoformat()}")
+        return archived
+
+    async def _archive_partition(self, partition: Partition, batch_size: int, pause: float) -> int:
+        buffer: List[dict] = []
+        last_id = 0
+        archived = 0
+        while True:
+            rows = await partitions.fetch(
+                partition, "SELECT * FROM task_logs WHERE id > ? ORDER BY id LIMIT ?", [last_id, batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            buffer.extend(self._archive_row(row) for row in await resolve_outputs(rows))
+            for segment_rows in self._full_segments(buffer, final=False):
+                archived += (await self._seal(segment_rows)).rows
+            await asyncio.sleep(pause)
+        for segment_rows in self._full_segments(buffer, final=True):
+            archived += (await self._seal(segment_rows)).rows
+        # Every row is in a written segment now
+        await partitions.drop(partition)
+        return archived
+
+    async def _archive_live(self, cutoff: datetime, batch_size: int, pause: float) -> int:
+        query = TaskLog.filter(status__in=FINISHED_STATUSES).filter(
+            Q(started_at__lt=cutoff) | Q(started_at__isnull=True, created_at__lt=cutoff)
+        )
+        columns = [*LOG_SUMMARY_FIELDS, *OUTPUT_FIELDS, *(f"{stream}_hash" for stream in OUTPUT_FIELDS)]
+        buffer: List[dict] = []
+        last_id = 0
+        archived = 0
+        while True:
+            rows = await query.filter(id__gt=last_id).order_by("id").limit(batch_size).values(*columns)
+            if rows:
+                last_id = rows[-1]["id"]
+                buffer.extend(self._archive_row(row) for row in await resolve_outputs(rows))
+            for segment_rows in self._full_segments(buffer, final=not rows):
+                await self._seal(segment_rows)
+                ids = [row["id"] for row in segment_rows]
+                for start in range(0, len(ids), batch_size):
+                    await delete_logs(TaskLog.filter(id__in=ids[start:start + batch_size]))
+                archived += len(ids)
+            if not rows:
+                break
+            await asyncio.sleep(pause)
+        return archived
+
+    async def drop_before(self, cutoff: datetime) -> Tuple[int, int]:
+        """
+        Drop segments whose newest log is older than ``cutoff``.
+        Returns the number of segments dropped and the number of logs they held.
+        """
+        dropped = logs = 0
+        for segment in self.segments():
+            if segment.end < cutoff:
+                logs += await self.drop(segment)
+                dropped += 1
+        return dropped, logs
+
+
+# Global log archive instance
+archive = LogArchive()
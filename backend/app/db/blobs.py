@@ -0,0 +1,161 @@
+"""
+Content-addressed storage for task output.
+
+Each distinct stdout/stderr text is stored once in ``output_blobs`` keyed by its
+sha256 and reference counted by the logs pointing at it, so frequently repeated
+outputs (health checks, interval tasks) only cost one row no matter how many runs
+produced them. Blobs are deleted as soon as their last log is deleted.
+"""
+from __future__ import annotations
+
+import hashlib
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Optional, Union
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from app.db.codec import compress_output, decompress_output
+from app.db.versions import bump
+
+if TYPE_CHECKING:
+    from tortoise.queryset import QuerySet
+    from app.models.log import TaskLog
+
+BLOB_TABLE = "output_blobs"
+
+
+def output_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def acquire_blob(text: str, conn: BaseDBAsyncClient, digest: Optional[str] = None) -> str:
+    """
+    Add a reference to the blob holding ``text``, storing it if it is new. Returns its hash.
+    """
+    digest = digest or output_hash(text)
+    updated, _ = await conn.execute_query(
+        f"UPDATE {BLOB_TABLE} SET refcount = refcount + 1 WHERE hash = ?", [digest]
+    )
+    if not updated:
+        # Only new outputs pay for compression
+        await conn.execute_query(
+            f"INSERT INTO {BLOB_TABLE} (hash, data, size, refcount) VALUES (?, ?, ?, 1)",
+            [digest, compress_output(text), len(text.encode("utf-8"))]
+        )
+    return digest
+
+
+async def release_blobs(hashes: Union[Iterable[Optional[str]], Mapping[str, int]], conn: BaseDBAsyncClient) -> int:
+    """
+    Drop one reference per hash occurrence, or the given number of references per hash
+    when a mapping is passed, and delete blobs nobody references anymore.
+    Returns the number of blobs deleted.
+    """
+    if isinstance(hashes, Mapping):
+        counts = Counter({digest: count for digest, count in hashes.items() if digest})
+    else:
+        counts = Counter(digest for digest in hashes if digest)
+    if not counts:
+        return 0
+    await conn.execute_many(
+        f"UPDATE {BLOB_TABLE} SET refcount = refcount - ? WHERE hash = ?",
+        [[count, digest] for digest, count in counts.items()]
+    )
+    digests = list(counts)
+    deleted = 0
+    # Stay well below SQLite's bound parameter limit
+    for start in range(0, len(digests), 500):
+        chunk = digests[start:start + 500]
+        placeholders = ", ".join("?" for _ in chunk)
+        removed, _ = await conn.execute_query(
+            f"DELETE FROM {BLOB_TABLE} WHERE refcount <= 0 AND hash IN ({placeholders})", chunk
+        )
+        deleted += removed
+    return deleted
+
+
+async def load_blobs(hashes: Iterable[Optional[str]], conn: Optional[BaseDBAsyncClient] = None) -> Dict[str, str]:
+    """
+    Fetch and decode blobs by hash
+    """
+    digests = list({digest for digest in hashes if digest})
+    if not digests:
+        return {}
+    conn = conn or Tortoise.get_connection("default")
+    placeholders = ", ".join("?" for _ in digests)
+    rows = await conn.execute_query_dict(
+        f"SELECT hash, data FROM {BLOB_TABLE} WHERE hash IN ({placeholders})", digests
+    )
+    return {row["hash"]: decompress_output(row["data"]) for row in rows}
+
+
+async def resolve_outputs(rows: List[dict], streams: Iterable[str] = ("stdout", "stderr")) -> List[dict]:
+    """
+    Replace the stored output columns of raw ``task_logs`` rows with the decoded text.
+    Rows need the output and ``<stream>_hash`` columns. Repeated outputs are fetched
+    and decoded once, with one lookup for all rows.
+    """
+    streams = list(streams)
+    blobs = await load_blobs(row[f"{stream}_hash"] for row in rows for stream in streams)
+    for row in rows:
+        for stream in streams:
+            digest = row[f"{stream}_hash"]
+            row[stream] = blobs.get(digest) if digest else decompress_output(row[stream])
+    return rows
+
+
+async def referenced_blobs(query: QuerySet[TaskLog], conn: BaseDBAsyncClient) -> Counter:
+    """
+    Number of references the logs matched by ``query`` hold on each blob, for
+    :func:`release_blobs` once they are deleted
+    """
+    hashes = Counter()
+    for column in ("stdout_hash", "stderr_hash"):
+        rows = await (
+            query.filter(**{f"{column}__isnull": False})
+            .annotate(references=Count("id"))
+            .group_by(column)
+            .using_db(conn)
+            .values_list(column, "references")
+        )
+        hashes.update(dict(rows))
+    return hashes
+
+
+async def delete_logs(query: QuerySet[TaskLog]) -> int:
+    """
+    Delete the logs matched by ``query`` and release the blobs they reference.
+    Use this instead of ``query.delete()``, which would leak blob references.
+    Returns the number of logs deleted.
+    """
+    async with in_transaction("default") as conn:
+        hashes = await referenced_blobs(query, conn)
+        deleted = await query.using_db(conn).delete()
+        await release_blobs(hashes, conn)
+    bump(query.model._meta.db_table)
+    return deleted
+
+
+async def storage_stats() -> dict:
+    """
+    Summarise output storage: how many bytes the logs reference versus how many are stored
+    """
+    conn = Tortoise.get_connection("default")
+    rows = await conn.execute_query_dict(
+        f"SELECT COUNT(*) AS blobs, COALESCE(SUM(refcount), 0) AS refs, "
+        f"COALESCE(SUM(size), 0) AS unique_bytes, COALESCE(SUM(size * refcount), 0) AS logical_bytes, "
+        f"COALESCE(SUM(length(CAST(data AS BLOB))), 0) AS stored_bytes FROM {BLOB_TABLE}"
+    )
+    stats = rows[0]
+    return {
+        "blobs": stats["blobs"],
+        "references": stats["refs"],
+        "logical_bytes": stats["logical_bytes"],
+        "unique_bytes": stats["unique_bytes"],
+        "stored_bytes": stats["stored_bytes"],
+        "dedup_ratio": round(stats["logical_bytes"] / stats["unique_bytes"], 2) if stats["unique_bytes"] else 1.0,
+        "compression_ratio": round(stats["unique_bytes"] / stats["stored_bytes"], 2) if stats["stored_bytes"] else 1.0,
+    }
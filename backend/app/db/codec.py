@@ -0,0 +1,168 @@
+"""
+Compressed storage codec for task output columns.
+
+Outputs below ``settings.output_compression_threshold`` are stored as plain TEXT.
+Larger ones are compressed and stored as a BLOB whose first byte identifies the codec,
+SQLite keeps both storage classes in the same column so no schema change is needed.
+"""
+import asyncio
+import logging
+import zlib
+from typing import Optional, Union
+
+from tortoise import Tortoise
+from tortoise.connection import connections
+from tortoise.fields import TextField
+from tortoise.functions import Function
+from pypika.terms import Function as PypikaFunction
+
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+
+def _selected_codec() -> Optional[int]:
+    name = settings.output_compression.lower()
+    if name == "none":
+        return None
+    if name == "zstd" or (name == "auto" and zstandard is not None):
+        if zstandard is None:
+            logger.warning("zstandard is not installed, falling back to zlib output compression")
+            return CODEC_ZLIB
+        return CODEC_ZSTD
+    return CODEC_ZLIB
+
+
+def compress_output(text: Optional[str]) -> Union[str, bytes, None]:
+    """
+    Encode an output for storage, returns the text unchanged when it is small
+    or does not compress
+    """
+    if text is None:
+        return None
+    codec = _selected_codec()
+    raw = text.encode("utf-8")
+    if codec is None or len(raw) < settings.output_compression_threshold:
+        return text
+    if codec == CODEC_ZSTD:
+        packed = zstandard.ZstdCompressor(level=settings.output_compression_level).compress(raw)
+    else:
+        packed = zlib.compress(raw, settings.output_compression_level)
+    if len(packed) + 1 >= len(raw):
+        return text
+    return bytes([codec]) + packed
+
+
+def decompress_output(value: Union[str, bytes, None]) -> Optional[str]:
+    """
+    Decode a stored output, plain text values are returned as is
+    """
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    codec, packed = value[0], value[1:]
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Output was compressed with zstd but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(packed)
+    elif codec == CODEC_ZLIB:
+        raw = zlib.decompress(packed)
+    else:
+        raise ValueError(f"Unknown output codec {codec}")
+    return raw.decode("utf-8", errors="replace")
+
+
+class CompressedTextField(TextField):
+    """
+    Text field stored through the output codec, decompressed only when the column is loaded
+    """
+
+    def to_db_value(self, value, instance):
+        return compress_output(value)
+
+    def to_python_value(self, value):
+        return decompress_output(value)
+
+
+class _DecodeOutputSQL(PypikaFunction):
+    def __init__(self, term, alias=None):
+        super().__init__("akari_output", term, alias=alias)
+
+
+class DecodedOutput(Function):
+    """
+    Decompressed output column usable in filters, e.g. ``annotate(text=DecodedOutput("stdout"))``,
+    the connection needs :func:`ensure_sql_functions` first
+    """
+    database_func = _DecodeOutputSQL
+
+
+async def ensure_sql_functions(connection_name: Optional[str] = None):
+    """
+    Register ``akari_output()`` on the SQLite connection, or on all of them, if it is not already there
+    """
+    names = [connection_name] if connection_name else list(connections.db_config)
+    for name in names:
+        client = Tortoise.get_connection(name)
+        await client.create_connection(with_db=True)
+        raw = getattr(client, "_connection", None)
+        if raw is None or getattr(raw, "_akari_functions", False):
+            continue
+        await raw.create_function("akari_output", 1, decompress_output, deterministic=True)
+        raw._akari_functions = True
+
+
+async def compress_existing_outputs(batch_size: Optional[int] = None, pause: float = 0.05) -> int:
+    """
+    Compress plain text outputs written before compression was enabled, in small batches.
+    Returns the number of rows rewritten.
+    """
+    if _selected_codec() is None:
+        return 0
+    batch_size = batch_size or settings.output_compression_batch_size
+    conn = Tortoise.get_connection("default")
+    loop = asyncio.get_running_loop()
+    last_id = 0
+    rewritten = 0
+    while True:
+        rows = await conn.execute_query_dict(
+            "SELECT id, stdout, stderr FROM task_logs "
+            "WHERE id > ? AND ((typeof(stdout) = 'text' AND length(CAST(stdout AS BLOB)) >= ?) "
+            "OR (typeof(stderr) = 'text' AND length(CAST(stderr AS BLOB)) >= ?)) "
+            "ORDER BY id LIMIT ?",
+            [last_id, settings.output_compression_threshold, settings.output_compression_threshold, batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        updates = await loop.run_in_executor(None, _compress_rows, rows)
+        updates = [update for update in updates if update is not None]
+        if updates:
+            await conn.execute_many("UPDATE task_logs SET stdout = ?, stderr = ? WHERE id = ?", updates)
+            rewritten += len(updates)
+        # Yield to the scheduler's log writes between batches
+        await asyncio.sleep(pause)
+    if rewritten:
+        logger.info(f"Compressed output of {rewritten} existing logs")
+    return rewritten
+
+
+def _compress_rows(rows):
+    updates = []
+    for row in rows:
+        stdout = compress_output(row["stdout"])
+        stderr = compress_output(row["stderr"])
+        if stdout is row["stdout"] and stderr is row["stderr"]:
+            # Nothing shrank, leave the row untouched
+            updates.append(None)
+        else:
+            updates.append([stdout, stderr, row["id"]])
+    return updates
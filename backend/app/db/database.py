@@ -1,27 +1,202 @@
 from tortoise import Tortoise
+from tortoise.backends.base.client import BaseTransactionWrapper
+from tortoise.backends.base.config_generator import expand_db_url
+from tortoise.connection import connections
 from app.config import settings
+from app.models.log import OUTPUT_PREVIEW_LENGTH
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# PRAGMAs applied on every new SQLite connection, selected by settings.db_profile.
+# "default" keeps what Tortoise sets on its own (WAL, synchronous=FULL).
+DB_PROFILES = {
+    "default": {},
+    # WAL with full fsync on every commit, for databases on unreliable storage
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+    },
+    # WAL only needs fsync at checkpoints to stay consistent, a power loss can
+    # at worst lose the last commits
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -32000,  # KiB when negative
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+    },
+}
+
+# Name of the read-only connections added by db_config, read_0 .. read_{n-1}
+READ_CONNECTION_PREFIX = "read_"
+
+# SQL run once after a column is added to an existing table, to backfill its values
+COLUMN_BACKFILLS = {
+    ("task_logs", "stdout_size"): "UPDATE task_logs SET stdout_size = COALESCE(length(CAST(stdout AS BLOB)), 0)",
+    ("task_logs", "stderr_size"): "UPDATE task_logs SET stderr_size = COALESCE(length(CAST(stderr AS BLOB)), 0)",
+    ("task_logs", "output_preview"): (
+        "UPDATE task_logs SET output_preview = "
+        f"substr(COALESCE(NULLIF(stdout, ''), NULLIF(stderr, ''), error_message), 1, {OUTPUT_PREVIEW_LENGTH})"
+    ),
+}
+
 
 async def init_db():
     """
     Initialize database connection
     """
-    await Tortoise.init(
-        db_url=settings.db_url,
-        modules=settings.db_modules,
-        use_tz=True,
-    )
+    await Tortoise.init(config=db_config())
+    # Let retention hand freed pages back with incremental vacuum, this only
+    # takes effect before the first table is created
+    await Tortoise.get_connection("default").execute_script("PRAGMA auto_vacuum = INCREMENTAL")
     # Generate the schema
     await Tortoise.generate_schemas()
+    await upgrade_schema()
     logger.info("Database initialized")
 
 
+def db_pragmas(profile: str = None, overrides: dict = None) -> dict:
+    """
+    PRAGMAs of a performance profile with per-pragma overrides applied on top
+    """
+    profile = profile or settings.db_profile
+    if profile not in DB_PROFILES:
+        raise ValueError(f"Unknown db_profile {profile!r}, expected one of {', '.join(DB_PROFILES)}")
+    overrides = settings.db_pragmas if overrides is None else overrides
+    return {**DB_PROFILES[profile], **overrides}
+
+
+def db_config(db_url: str = None, profile: str = None, overrides: dict = None, read_pool_size: int = None) -> dict:
+    """
+    Tortoise config for ``db_url``, SQLite connections get the profile's PRAGMAs.
+    File databases also get ``read_pool_size`` read-only connections that
+    :class:`ReadWriteRouter` sends ORM reads to, while ``default`` stays the only writer.
+    """
+    connection = expand_db_url(db_url or settings.db_url)
+    read_pool_size = settings.db_read_pool_size if read_pool_size is None else read_pool_size
+    connections_config = {"default": connection}
+    routers = []
+    if connection["engine"] == "tortoise.backends.sqlite":
+        # The SQLite client runs every extra credential as a PRAGMA when it connects
+        connection["credentials"].update(db_pragmas(profile, overrides))
+        # Every connection to :memory: opens its own empty database
+        if read_pool_size > 0 and connection["credentials"]["file_path"] != ":memory:":
+            for index in range(read_pool_size):
+                connections_config[f"{READ_CONNECTION_PREFIX}{index}"] = {
+                    "engine": connection["engine"],
+                    "credentials": {**connection["credentials"], "query_only": "ON"},
+                }
+            routers.append(ReadWriteRouter)
+    return {
+        "connections": connections_config,
+        "apps": {
+            app_name: {"models": modules, "default_connection": "default"}
+            for app_name, modules in settings.db_modules.items()
+        },
+        "routers": routers,
+        "use_tz": True,
+    }
+
+
+class ReadWriteRouter:
+    """
+    Sends ORM reads to an idle read-only connection and writes to ``default``.
+    In WAL mode readers never block the writer, so slow log searches from the UI
+    cannot hold up the scheduler's log writes. Reads inside a transaction stay on
+    ``default`` so they see the transaction's own uncommitted writes.
+    """
+
+    def __init__(self):
+        self._next = 0
+
+    def db_for_read(self, model):
+        if isinstance(connections.get("default"), BaseTransactionWrapper):
+            return "default"
+        readers = [name for name in connections.db_config if name.startswith(READ_CONNECTION_PREFIX)]
+        if not readers:
+            return "default"
+        # Prefer a connection that is not running a query, else rotate through all of them
+        for offset in range(len(readers)):
+            name = readers[(self._next + offset) % len(readers)]
+            if not connections.get(name)._lock.locked():
+                break
+        self._next = (readers.index(name) + 1) % len(readers)
+        return name
+
+    def db_for_write(self, model):
+        return "default"
+
+
+async def checkpoint_wal(mode: str = "PASSIVE"):
+    """
+    Copy WAL frames back into the database file. PASSIVE never waits on readers,
+    TRUNCATE also resets the WAL file but has to wait for them.
+    """
+    conn = Tortoise.get_connection("default")
+    _, rows = await conn.execute_query("PRAGMA journal_mode")
+    if rows and rows[0][0] == "wal":
+        await conn.execute_query(f"PRAGMA wal_checkpoint({mode})")
+
+
+async def checkpoint_periodically():
+    """
+    Background loop started with the application. SQLite checkpoints on its own
+    after commits, but only when the WAL is not being read; a long stream of
+    readers would otherwise let it grow without bound.
+    """
+    while True:
+        await asyncio.sleep(settings.db_checkpoint_interval_seconds)
+        try:
+            await checkpoint_wal()
+        except Exception:
+            logger.exception("WAL checkpoint failed")
+
+
+async def upgrade_schema():
+    """
+    Add nullable columns introduced after a table was created.
+    ``generate_schemas`` only creates missing tables, so databases created by an
+    older version would otherwise lack the new columns.
+    """
+    for app_models in Tortoise.apps.values():
+        for model in app_models.values():
+            meta = model._meta
+            conn = meta.db
+            _, rows = await conn.execute_query(f'PRAGMA table_info("{meta.db_table}")')
+            existing = {row["name"] for row in rows}
+            for field in meta.fields_map.values():
+                column = field.source_field or field.model_field_name
+                if column in existing or field.has_db_field is False:
+                    continue
+                if not field.null:
+                    logger.warning(f"Cannot add non-nullable column {meta.db_table}.{column}, migrate it manually")
+                    continue
+                sql_type = field.get_for_dialect("sqlite", "SQL_TYPE")
+                await conn.execute_script(f'ALTER TABLE "{meta.db_table}" ADD COLUMN "{column}" {sql_type}')
+                if field.index:
+                    await conn.execute_script(
+                        f'CREATE INDEX "idx_{meta.db_table}_{column}" ON "{meta.db_table}" ("{column}")'
+                    )
+                backfill = COLUMN_BACKFILLS.get((meta.db_table, column))
+                if backfill:
+                    await conn.execute_script(backfill)
+                logger.info(f"Added column {meta.db_table}.{column}")
+
+
 async def close_db():
     """
     Close database connection
     """
+    try:
+        await checkpoint_wal("TRUNCATE")
+    except Exception:
+        logger.exception("Final WAL checkpoint failed")
     await Tortoise.close_connections()
-    logger.info("Database connections closed")
\ No newline at end of file
+    logger.info("Database connections closed")
@@ -0,0 +1,443 @@
+"""
+Routes log queries to the storage holding the requested time range.
+
+The live ``task_logs`` table always takes part, monthly partitions (see
+app.db.partitions) and archive segments (see app.db.archive) only when they
+overlap the requested ``started_after`` / ``started_before`` range. Pages are
+assembled newest first across the sources: the live table is read through the
+ORM, partitions through plain SQL and archive segments by decompressing them.
+"""
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from pydantic import BaseModel
+from tortoise.expressions import Q, Subquery
+from tortoise.functions import Count, Max
+from tortoise.queryset import QuerySet
+from tortoise.transactions import in_transaction
+
+from app.core.schemas import PaginatedResponse
+from app.db.archive import archive
+from app.db.blobs import load_blobs, release_blobs, resolve_outputs
+from app.db.codec import DecodedOutput, decompress_output, ensure_sql_functions
+from app.db.log_writer import log_writer
+from app.db.output_index import OutputIndex, output_indexes
+from app.db.partitions import partitions, Partition, PARTITION_KEY, FINISHED_STATUSES, db_timestamp, as_utc
+from app.db.retention import delete_in_batches
+from app.models.log import TaskLog, TaskLog_Pydantic, TaskLogSummary, OutputBlob, ExecutionStatus, LOG_SUMMARY_FIELDS
+from app.config import settings
+
+# Columns an export may select, the summary plus the full output
+LOG_EXPORT_FIELDS = [*LOG_SUMMARY_FIELDS, "stdout", "stderr"]
+OUTPUT_FIELDS = ("stdout", "stderr")
+
+
+class LogFilter(BaseModel):
+    """
+    Filters shared by log list, export and delete requests
+    """
+    task_id: Optional[int] = None
+    # Logs of any of these tasks, e.g. of tasks deleted together
+    task_ids: Optional[Set[int]] = None
+    status: Optional[int] = None
+    search: Optional[str] = None
+    started_after: Optional[datetime] = None
+    started_before: Optional[datetime] = None
+
+    @property
+    def filters_tasks(self) -> bool:
+        return self.task_id is not None or self.task_ids is not None
+
+    @property
+    def is_time_range_only(self) -> bool:
+        return not self.filters_tasks and self.status is None and not self.search
+
+    def matches_task(self, task_id: int) -> bool:
+        return (self.task_id is None or task_id == self.task_id) and (self.task_ids is None or task_id in self.task_ids)
+
+
+class TaskLogStats(BaseModel):
+    """
+    Log count and latest run of one task across every log source
+    """
+    log_count: int = 0
+    last_started_at: Optional[datetime] = None
+    last_status: Optional[ExecutionStatus] = None
+
+    def add_latest(self, started_at: Union[datetime, str, None], status: Optional[int]):
+        if started_at is None:
+            return
+        if isinstance(started_at, str):
+            # Timestamps read from partitions and the archive are stored text
+            started_at = datetime.fromisoformat(started_at)
+        started_at = as_utc(started_at)
+        if self.last_started_at is None or started_at > self.last_started_at:
+            self.last_started_at, self.last_status = started_at, status
+
+
+def _like_pattern(search: str) -> str:
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class LogRouter:
+    """
+    Fans log reads and deletes out over the live table, the overlapping partitions and archive segments
+    """
+
+    async def live_query(self, log_filter: LogFilter) -> QuerySet[TaskLog]:
+        """
+        ORM query over the live table
+        """
+        query = TaskLog.all()
+        if log_filter.task_id is not None:
+            query = query.filter(task_id=log_filter.task_id)
+        if log_filter.task_ids is not None:
+            query = query.filter(task_id__in=list(log_filter.task_ids))
+        if log_filter.status is not None:
+            query = query.filter(status=log_filter.status)
+        if log_filter.started_after is not None:
+            query = query.filter(started_at__gte=log_filter.started_after)
+        if log_filter.started_before is not None:
+            query = query.filter(started_at__lt=log_filter.started_before)
+        if log_filter.search:
+            search = log_filter.search
+            # Outputs may be stored compressed, match against the decoded text. Deduplicated
+            # outputs are searched once per distinct blob rather than once per log.
+            await ensure_sql_functions()
+            matching_blobs = Subquery(
+                OutputBlob.annotate(text=DecodedOutput("data")).filter(text__icontains=search).values("hash")
+            )
+            query = query.annotate(
+                stdout_text=DecodedOutput("stdout"),
+                stderr_text=DecodedOutput("stderr")
+            ).filter(
+                Q(stdout_hash__in=matching_blobs) |
+                Q(stderr_hash__in=matching_blobs) |
+                Q(stdout_text__icontains=search) |
+                Q(stderr_text__icontains=search) |
+                Q(error_message__icontains=search) |
+                Q(command_executed__icontains=search)
+            )
+        return query
+
+    def partitions_for(self, log_filter: LogFilter) -> List[Partition]:
+        return partitions.partitions(log_filter.started_after, log_filter.started_before)
+
+    async def _partition_where(self, log_filter: LogFilter) -> Tuple[str, list]:
+        clauses, params = [], []
+        if log_filter.task_id is not None:
+            clauses.append("task_id = ?")
+            params.append(log_filter.task_id)
+        if log_filter.task_ids is not None:
+            clauses.append("task_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(sorted(log_filter.task_ids)))
+        if log_filter.status is not None:
+            clauses.append("status = ?")
+            params.append(log_filter.status)
+        if log_filter.started_after is not None:
+            clauses.append(f"{PARTITION_KEY} >= ?")
+            params.append(db_timestamp(as_utc(log_filter.started_after)))
+        if log_filter.started_before is not None:
+            clauses.append(f"{PARTITION_KEY} < ?")
+            params.append(db_timestamp(as_utc(log_filter.started_before)))
+        if log_filter.search:
+            await ensure_sql_functions()
+            hashes = await (
+                OutputBlob.annotate(text=DecodedOutput("data"))
+                .filter(text__icontains=log_filter.search)
+                .values_list("hash", flat=True)
+            )
+            pattern = _like_pattern(log_filter.search)
+            matches = [
+                f"{column} LIKE ? ESCAPE '\\'"
+                for column in ("akari_output(stdout)", "akari_output(stderr)", "error_message", "command_executed")
+            ]
+            params.extend([pattern] * len(matches))
+            if hashes:
+                # One JSON array parameter however many blobs match, SQLite caps bound variables
+                matching = "SELECT value FROM json_each(?)"
+                matches.append(f"stdout_hash IN ({matching}) OR stderr_hash IN ({matching})")
+                params.extend([json.dumps(hashes)] * 2)
+            clauses.append(f"({' OR '.join(matches)})")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    async def page(self, log_filter: LogFilter, skip: int, limit: int, fields: List[str]) -> PaginatedResponse[TaskLogSummary]:
+        """
+        Count and fetch one page of log summaries, newest first, selecting only the requested columns
+        """
+        query = await self.live_query(log_filter)
+        total = await query.count()
+        rows = []
+        if skip < total:
+            rows = await query.offset(skip).limit(limit).order_by("-started_at").values(*fields)
+        remaining_skip = max(0, skip - total)
+
+        selected_partitions = self.partitions_for(log_filter)
+        if selected_partitions:
+            where, params = await self._partition_where(log_filter)
+            columns = ", ".join(fields)
+            for partition in selected_partitions:
+                count = (await partitions.fetch(partition, f"SELECT COUNT(*) AS n FROM task_logs{where}", params))[0]["n"]
+                total += count
+                if len(rows) < limit and remaining_skip < count:
+                    rows.extend(await partitions.fetch(
+                        partition,
+                        f"SELECT {columns} FROM task_logs{where} ORDER BY started_at DESC LIMIT ? OFFSET ?",
+                        [*params, limit - len(rows), remaining_skip]
+                    ))
+                remaining_skip = max(0, remaining_skip - count)
+
+        for segment in archive.segments(log_filter):
+            # The manifest counts pure time range and task queries, others read the segment
+            matched = None
+            count = segment.known_count(log_filter)
+            if count is None:
+                matched = await archive.scan(segment, log_filter)
+                count = len(matched)
+            total += count
+            if len(rows) < limit and remaining_skip < count:
+                if matched is None:
+                    matched = await archive.scan(segment, log_filter)
+                end = remaining_skip + limit - len(rows)
+                rows.extend({field: row[field] for field in fields} for row in matched[remaining_skip:end])
+            remaining_skip = max(0, remaining_skip - count)
+
+        return PaginatedResponse(
+            total=total,
+            skip=skip,
+            limit=limit,
+            data=[TaskLogSummary(**row) for row in rows]
+        )
+
+    async def task_stats(self, task_ids: List[int]) -> Dict[int, TaskLogStats]:
+        """
+        Log count and latest run of each task over the live table, the partitions and
+        the archive, so they agree with :meth:`page` totals. The live table and each
+        partition take one grouped query, the archive counts come from its manifest.
+        Archive segments are only read for tasks without a log anywhere else.
+        """
+        stats = {task_id: TaskLogStats() for task_id in task_ids}
+        if not task_ids:
+            return stats
+        # SQLite takes the bare ``status`` column from the row holding MAX(started_at)
+        rows = await (
+            TaskLog.filter(task_id__in=task_ids)
+            .annotate(log_count=Count("id"), last_started_at=Max("started_at"))
+            .group_by("task_id")
+            .values("task_id", "status", "log_count", "last_started_at")
+        )
+        ids = json.dumps(task_ids)
+        for partition in partitions.partitions():
+            rows += await partitions.fetch(
+                partition,
+                "SELECT task_id, status, COUNT(*) AS log_count, MAX(started_at) AS last_started_at "
+                "FROM task_logs WHERE task_id IN (SELECT value FROM json_each(?)) GROUP BY task_id",
+                [ids]
+            )
+        for row in rows:
+            stats[row["task_id"]].log_count += row["log_count"]
+            stats[row["task_id"]].add_latest(row["last_started_at"], row["status"])
+
+        unseen = {task_id for task_id, task_stats in stats.items() if task_stats.last_started_at is None}
+        for segment in archive.segments():
+            archived = [task_id for task_id in task_ids if task_id in segment.task_counts]
+            for task_id in archived:
+                stats[task_id].log_count += segment.known_count(LogFilter(task_id=task_id))
+            # Segments come newest first, the first one holding a task has its latest run
+            missing = unseen.intersection(archived)
+            if missing:
+                for row in await archive.scan(segment):
+                    if row["task_id"] in missing:
+                        stats[row["task_id"]].add_latest(row["started_at"] or row["created_at"], row["status"])
+                unseen -= missing
+        return stats
+
+    async def export(self, log_filter: LogFilter, fields: List[str],
+                     batch_size: Optional[int] = None) -> AsyncIterator[List[dict]]:
+        """
+        Yield every matching log in batches, oldest source first (archive segments, partitions,
+        then the live table) and by id within a source.
+        Each batch is one keyset query (``id > last``), so memory stays bounded and no read
+        transaction is held open between batches however many rows are exported.
+        """
+        batch_size = batch_size or settings.log_export_batch_size
+        outputs = [field for field in OUTPUT_FIELDS if field in fields]
+        columns = [field for field in fields if field not in OUTPUT_FIELDS]
+        for stream in outputs:
+            columns += [stream, f"{stream}_hash"]
+
+        for segment in reversed(archive.segments(log_filter)):
+            rows = sorted(await archive.scan(segment, log_filter, with_output=bool(outputs)), key=lambda row: row["id"])
+            for start in range(0, len(rows), batch_size):
+                yield [{field: row[field] for field in fields} for row in rows[start:start + batch_size]]
+
+        selected_partitions = self.partitions_for(log_filter)
+        if selected_partitions:
+            where, params = await self._partition_where(log_filter)
+            where = f"{where} AND id > ?" if where else " WHERE id > ?"
+            column_list = ", ".join(columns)
+            for partition in reversed(selected_partitions):
+                last_id = 0
+                while True:
+                    rows = await partitions.fetch(
+                        partition,
+                        f"SELECT {column_list} FROM task_logs{where} ORDER BY id LIMIT ?",
+                        [*params, last_id, batch_size]
+                    )
+                    if not rows:
+                        break
+                    yield await self._export_rows(rows, fields, outputs)
+                    last_id = rows[-1]["id"]
+
+        query = await self.live_query(log_filter)
+        last_id = 0
+        while True:
+            rows = await query.filter(id__gt=last_id).order_by("id").limit(batch_size).values(*columns)
+            if not rows:
+                break
+            yield await self._export_rows(rows, fields, outputs)
+            last_id = rows[-1]["id"]
+
+    async def _export_rows(self, rows: List[dict], fields: List[str], outputs: List[str]) -> List[dict]:
+        if outputs:
+            await resolve_outputs(rows, outputs)
+        return [{field: row[field] for field in fields} for row in rows]
+
+    async def _find_partition_row(self, log_id: int) -> Tuple[Optional[Partition], Optional[dict]]:
+        for partition in partitions.partitions():
+            rows = await partitions.fetch(partition, "SELECT * FROM task_logs WHERE id = ?", [log_id])
+            if rows:
+                return partition, rows[0]
+        return None, None
+
+    async def get(self, log_id: int) -> Optional[TaskLog_Pydantic]:
+        """
+        Full log including output, wherever it is stored
+        """
+        # Queued changes are newer than the stored row
+        pending = log_writer.get(log_id)
+        if pending is not None:
+            return pending
+        log = await TaskLog.get_or_none(id=log_id)
+        if log:
+            await log.load_outputs()
+            # Validated from the attributes directly, from_tortoise_orm would also look for relations to prefetch
+            return TaskLog_Pydantic.model_validate(log)
+        _, row = await self._find_partition_row(log_id)
+        if row is not None:
+            await resolve_outputs([row])
+        else:
+            row = await archive.get(log_id)
+            if row is None:
+                return None
+        return TaskLog_Pydantic.model_validate({
+            field: value for field, value in row.items() if field in TaskLog_Pydantic.model_fields
+        })
+
+    async def output_index(self, log_id: int, stream: str) -> Optional[Tuple[OutputIndex, ExecutionStatus]]:
+        """
+        Line index of one output stream of a log wherever it is stored, and the log's status.
+        Only the log's status and output hash are read when the index is already cached.
+        """
+        pending = log_writer.get(log_id)
+        if pending is not None:
+            async def load_pending():
+                return getattr(pending, stream)
+            return await output_indexes.get(None, load_pending), pending.status
+
+        hash_column = f"{stream}_hash"
+        rows = await TaskLog.filter(id=log_id).values("status", hash_column)
+        if rows:
+            status, digest = rows[0]["status"], rows[0][hash_column]
+
+            async def load_inline():
+                # Logs written before deduplication keep their output inline
+                log = await TaskLog.get(id=log_id).only("id", stream)
+                return getattr(log, stream)
+        else:
+            _, row = await self._find_partition_row(log_id)
+            if row is not None:
+                status, digest = row["status"], row[hash_column]
+
+                async def load_inline():
+                    return decompress_output(row[stream])
+            else:
+                row = await archive.get(log_id, with_output=False)
+                if row is None:
+                    return None
+                status, digest = row["status"], None
+
+                async def load_inline():
+                    return (await archive.get(log_id))[stream]
+
+        if digest:
+            # Content addressed, the same output of every log shares one index
+            async def load_blob():
+                return (await load_blobs([digest])).get(digest)
+            index = await output_indexes.get(("blob", digest), load_blob)
+        else:
+            key = ("log", log_id, stream) if status in FINISHED_STATUSES else None
+            index = await output_indexes.get(key, load_inline)
+        return index, ExecutionStatus(status)
+
+    async def delete(self, log_id: int) -> bool:
+        """
+        Delete one log wherever it is stored
+        """
+        queued = log_writer.discard(log_id)
+        log = await TaskLog.get_or_none(id=log_id)
+        if queued and not log:
+            return True
+        if log:
+            await log.delete()
+            return True
+        partition, row = await self._find_partition_row(log_id)
+        if row is None:
+            return await archive.delete(log_id)
+        async with partitions.attached(partition) as conn:
+            async with in_transaction("default") as trx:
+                await trx.execute_query("DELETE FROM part.task_logs WHERE id = ?", [log_id])
+                await release_blobs([row["stdout_hash"], row["stderr_hash"]], trx)
+        return True
+
+    async def delete_matching(self, log_filter: LogFilter) -> int:
+        """
+        Delete every log matching the filter in batches, partitions and archive segments
+        entirely inside a pure time range are dropped whole. Returns the number of logs deleted.
+        """
+        deleted = await delete_in_batches(await self.live_query(log_filter))
+        after = as_utc(log_filter.started_after) if log_filter.started_after else None
+        before = as_utc(log_filter.started_before) if log_filter.started_before else None
+        for partition in self.partitions_for(log_filter):
+            inside = (after is None or partition.start >= after) and (before is None or partition.end <= before)
+            if log_filter.is_time_range_only and inside:
+                deleted += await partitions.drop(partition)
+            else:
+                deleted += await self._delete_partition_rows(partition, log_filter)
+        deleted += await archive.delete_matching(log_filter)
+        return deleted
+
+    async def _delete_partition_rows(self, partition: Partition, log_filter: LogFilter) -> int:
+        where, params = await self._partition_where(log_filter)
+        deleted = 0
+        while True:
+            rows = await partitions.fetch(
+                partition,
+                f"SELECT id, stdout_hash, stderr_hash FROM task_logs{where} ORDER BY id LIMIT ?",
+                [*params, settings.retention_batch_size]
+            )
+            if not rows:
+                return deleted
+            ids = [row["id"] for row in rows]
+            placeholders = ", ".join("?" for _ in ids)
+            async with partitions.attached(partition):
+                async with in_transaction("default") as trx:
+                    await trx.execute_query(f"DELETE FROM part.task_logs WHERE id IN ({placeholders})", ids)
+                    await release_blobs([row[column] for row in rows for column in ("stdout_hash", "stderr_hash")], trx)
+            deleted += len(ids)
+
+
+# Global log router instance
+log_router = LogRouter()
@@ -0,0 +1,303 @@
+"""
+Write-behind persistence for task logs.
+
+Every execution saves its log twice, once when it starts and once when it
+finishes. Instead of one transaction (and one fsync) per save, the scheduler
+hands the log to :data:`log_writer`, which queues it and writes everything
+queued within ``log_writer_flush_ms`` (or ``log_writer_batch_size`` logs) in a
+single transaction. Ids are assigned up front so callers can refer to a log
+before it is written, and :meth:`LogWriter.get` serves the queued state so reads
+of running executions stay consistent until they are flushed. They come from
+blocks reserved in ``sqlite_sequence``, so rows inserted meanwhile by anyone
+else, another process included, never take an id handed out here. A log whose
+write fails is written again a few times before it is dropped.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from tortoise.transactions import in_transaction
+
+from app.config import settings
+from app.core.metrics import Counter, Histogram
+from app.db.partitions import FINISHED_STATUSES
+from app.db.versions import bump
+from app.models.log import TaskLog, TaskLog_Pydantic
+
+logger = logging.getLogger(__name__)
+
+# Columns TaskLog.save derives from the output, taken from the stored row instead
+WRITER_FIELDS = {"stdout_hash", "stderr_hash", "stdout_size", "stderr_size", "output_preview"}
+
+# Ids reserved in sqlite_sequence at a time
+ID_BLOCK_SIZE = 1000
+
+DB_WRITE_SECONDS = Histogram(
+    "akari_db_write_seconds", "Time to write task logs, a batched transaction or a direct save", ["operation"]
+)
+LOG_WRITE_FAILURES = Counter("akari_log_write_failures", "Failed writes of queued task logs, retried or not")
+LOGS_DROPPED = Counter("akari_logs_dropped", "Queued task logs dropped after their writes kept failing")
+
+
+def stamp_persisted(log: TaskLog):
+    """
+    Record when a finished log is first written, the last step of a run's lifecycle
+    """
+    if log.status in FINISHED_STATUSES and log.persisted_at is None:
+        log.persisted_at = datetime.now(timezone.utc)
+
+
+class LogWriter:
+    """
+    Queues TaskLog saves and writes them in batched transactions
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Latest queued field values per log id, replaced by every save until written
+        self._pending: Dict[int, dict] = {}
+        self._dirty: Set[int] = set()
+        # Ids assigned here whose row has not been inserted yet
+        self._unwritten: Set[int] = set()
+        self._next_id: Optional[int] = None
+        # Last id of the block reserved in sqlite_sequence
+        self._reserved_id: Optional[int] = None
+        # Failed writes per log id, until it is written or dropped
+        self._attempts: Dict[int, int] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """
+        Start the background flush loop, saves are written directly until then
+        """
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.log_writer_max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the flush loop and write everything still queued
+        """
+        if self._task is not None:
+            # Let the loop finish its batch, a transaction cancelled while it
+            # starts would keep the connection locked
+            await self._queue.put(None)
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Logs waiting for a retry get their last attempt now
+        self._dirty.update(self._attempts)
+        if self._dirty:
+            await self._write(list(self._dirty))
+        self._queue = None
+        self._unwritten.clear()
+        self._next_id = self._reserved_id = None
+
+    async def save(self, log: TaskLog):
+        """
+        Queue the current state of ``log`` for writing, assigning its id if it has none.
+        Blocks when ``log_writer_max_pending`` logs are already queued.
+        """
+        if not self.running:
+            start = time.perf_counter()
+            if log.id is None or log._saved_in_db:
+                stamp_persisted(log)
+                await log.save()
+            else:
+                # Queued before the writer stopped, the row may already exist
+                await self._save(log.id, self._values(log))
+            DB_WRITE_SECONDS.observe(time.perf_counter() - start, operation="save")
+            return
+        if log.id is None:
+            log.id = await self._allocate_id()
+            # Insert with the id assigned here instead of letting SQLite pick one
+            log._custom_generated_pk = True
+            log.created_at = datetime.now(timezone.utc)
+            self._unwritten.add(log.id)
+        self._pending[log.id] = self._values(log)
+        if log.id not in self._dirty:
+            self._dirty.add(log.id)
+            await self._queue.put(log.id)
+
+    @staticmethod
+    def _values(log: TaskLog) -> dict:
+        return {field: getattr(log, field) for field in log._meta.db_fields if field not in WRITER_FIELDS}
+
+    def get(self, log_id: int) -> Optional[TaskLog_Pydantic]:
+        """
+        Queued state of a log that has not been written yet
+        """
+        values = self._pending.get(log_id)
+        if values is None:
+            return None
+        log = TaskLog(**values)
+        log.update_output_summary()
+        return TaskLog_Pydantic.model_validate({
+            field: getattr(log, field, None) for field in TaskLog_Pydantic.model_fields
+        })
+
+    def is_pending(self, log_id: int) -> bool:
+        return log_id in self._pending
+
+    def discard(self, log_id: int) -> bool:
+        """
+        Drop a queued log, e.g. because it was deleted. Returns whether it was queued.
+        """
+        self._dirty.discard(log_id)
+        self._unwritten.discard(log_id)
+        self._attempts.pop(log_id, None)
+        return self._pending.pop(log_id, None) is not None
+
+    def discard_tasks(self, task_ids: List[int]) -> int:
+        """
+        Drop the queued logs of tasks that are being deleted, their inserts would
+        fail once the tasks are gone. Returns how many logs were queued.
+        """
+        task_ids = set(task_ids)
+        log_ids = [log_id for log_id, values in self._pending.items() if values["task_id"] in task_ids]
+        for log_id in log_ids:
+            self.discard(log_id)
+        return len(log_ids)
+
+    async def flush(self):
+        """
+        Write everything queued right now
+        """
+        if self._dirty:
+            await self._write(list(self._dirty))
+
+    async def _allocate_id(self) -> int:
+        if self._next_id is None or self._next_id > self._reserved_id:
+            await self._reserve_ids()
+        log_id = self._next_id
+        self._next_id += 1
+        return log_id
+
+    async def _reserve_ids(self):
+        # AUTOINCREMENT never hands out ids up to sqlite_sequence's seq, so moving it past
+        # the block keeps every other insert off the ids assigned here
+        async with in_transaction("default") as conn:
+            rows = await conn.execute_query_dict(
+                "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'task_logs'), 0), "
+                "COALESCE((SELECT MAX(id) FROM task_logs), 0)) AS last_id"
+            )
+            self._next_id = rows[0]["last_id"] + 1
+            self._reserved_id = rows[0]["last_id"] + ID_BLOCK_SIZE
+            await conn.execute_query("DELETE FROM sqlite_sequence WHERE name = 'task_logs'")
+            await conn.execute_query(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('task_logs', ?)", [self._reserved_id]
+            )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            log_id = await self._queue.get()
+            if log_id is None:
+                break
+            batch = [log_id]
+            deadline = loop.time() + settings.log_writer_flush_ms / 1000
+            while len(batch) < settings.log_writer_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    log_id = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if log_id is None:
+                    stopping = True
+                    break
+                batch.append(log_id)
+            try:
+                await self._write(batch)
+            except Exception:
+                logger.exception("Failed to write queued task logs")
+
+    async def _write(self, log_ids: List[int]):
+        # Saves queued while this batch is being written mark the log dirty again
+        batch = []
+        for log_id in log_ids:
+            if log_id in self._dirty:
+                self._dirty.discard(log_id)
+                batch.append((log_id, self._pending[log_id]))
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            async with in_transaction("default") as conn:
+                for log_id, values in batch:
+                    await self._save(log_id, values, conn)
+            DB_WRITE_SECONDS.observe(time.perf_counter() - start, operation="batch")
+        except asyncio.CancelledError:
+            # Rolled back, the next flush writes them again
+            self._dirty.update(log_id for log_id, _ in batch)
+            raise
+        except Exception:
+            logger.exception(f"Batched write of {len(batch)} task logs failed, writing them one by one")
+            for log_id, values in batch:
+                try:
+                    await self._save(log_id, values)
+                except Exception:
+                    self._failed(log_id, values)
+                else:
+                    self._done(log_id, values)
+            bump(TaskLog._meta.db_table)
+            return
+        for log_id, values in batch:
+            self._done(log_id, values)
+        bump(TaskLog._meta.db_table)
+
+    async def _save(self, log_id: int, values: dict, conn=None):
+        instance = None
+        if log_id not in self._unwritten:
+            # Updates go through the stored row so replaced output blobs are released
+            instance = await TaskLog.filter(id=log_id).using_db(conn).first()
+        if instance is None:
+            instance = TaskLog(**values)
+            instance._custom_generated_pk = True
+        else:
+            for field, value in values.items():
+                setattr(instance, field, value)
+        stamp_persisted(instance)
+        await instance.save(using_db=conn)
+
+    def _failed(self, log_id: int, values: dict):
+        LOG_WRITE_FAILURES.inc()
+        attempts = self._attempts.get(log_id, 0) + 1
+        if not self.running or attempts > settings.log_writer_max_retries:
+            logger.exception(f"Failed to write task log {log_id}, dropping it")
+            LOGS_DROPPED.inc()
+            self._done(log_id, values)
+            return
+        logger.exception(f"Failed to write task log {log_id}, retrying it")
+        self._attempts[log_id] = attempts
+        asyncio.get_running_loop().call_later(settings.log_writer_retry_seconds, self._retry, log_id)
+
+    def _retry(self, log_id: int):
+        if log_id not in self._pending or log_id in self._dirty or not self.running:
+            # Written, discarded or queued again meanwhile
+            return
+        try:
+            self._queue.put_nowait(log_id)
+        except asyncio.QueueFull:
+            asyncio.get_running_loop().call_later(settings.log_writer_retry_seconds, self._retry, log_id)
+            return
+        self._dirty.add(log_id)
+
+    def _done(self, log_id: int, values: dict):
+        self._unwritten.discard(log_id)
+        self._attempts.pop(log_id, None)
+        # Keep the entry if the log was saved again while this batch was written
+        if self._pending.get(log_id) is values:
+            del self._pending[log_id]
+
+
+# Global log writer instance
+log_writer = LogWriter()
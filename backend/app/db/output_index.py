@@ -0,0 +1,136 @@
+"""
+Line index of task output, for paging through huge outputs.
+
+Outputs are stored compressed (see app.db.codec), so reading any part of one
+means decoding all of it. :class:`OutputIndex` keeps the decoded UTF-8 bytes
+together with the number of newlines before every 64 KiB block: counting them
+runs at memchr speed, and finding a line searches the counts and then scans a
+single block. Reading a page of lines or a byte range costs the same however
+large the output is.
+
+Finished outputs never change, so their indexes are kept in an LRU cache
+bounded by ``settings.output_index_cache_mb``, keyed by blob hash where the
+output has one. Requests arriving while an index is built wait for that build
+instead of decoding the output again.
+"""
+import asyncio
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from app.config import settings
+
+# Bytes per indexed block
+OUTPUT_INDEX_BLOCK_SIZE = 64 * 1024
+
+
+class OutputIndex:
+    def __init__(self, text: str):
+        self.data = text.encode("utf-8")
+        # Newlines before each block, and in the whole output as the last entry
+        self._newlines_before = array("q", [0])
+        total = 0
+        for start in range(0, len(self.data), OUTPUT_INDEX_BLOCK_SIZE):
+            total += self.data.count(b"\n", start, start + OUTPUT_INDEX_BLOCK_SIZE)
+            self._newlines_before.append(total)
+        # A final line without a trailing newline still counts
+        self.line_count = total + (1 if self.data and not self.data.endswith(b"\n") else 0)
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def memory(self) -> int:
+        return len(self.data) + self._newlines_before.itemsize * len(self._newlines_before)
+
+    def line_offset(self, line: int) -> int:
+        """
+        Byte offset at which ``line`` (0-based) starts, the output size past the last line
+        """
+        if line <= 0:
+            return 0
+        if line >= self.line_count:
+            return len(self.data)
+        # The line starts after the line-th newline, which lies in this block
+        block = bisect_left(self._newlines_before, line) - 1
+        position = block * OUTPUT_INDEX_BLOCK_SIZE
+        find = self.data.find
+        for _ in range(line - self._newlines_before[block]):
+            position = find(b"\n", position) + 1
+        return position
+
+    def lines(self, start: int, count: int) -> List[str]:
+        """
+        Up to ``count`` lines from line ``start`` on, without their newlines
+        """
+        end = min(start + count, self.line_count)
+        if start >= end:
+            return []
+        text = self.data[self.line_offset(start):self.line_offset(end)].decode("utf-8", errors="replace")
+        if text.endswith("\n"):
+            text = text[:-1]
+        return text.split("\n")
+
+    def byte_range(self, start: int, end: int) -> bytes:
+        """
+        Bytes ``start`` to ``end`` inclusive, as in an HTTP Range
+        """
+        return self.data[start:end + 1]
+
+
+class OutputIndexCache:
+    def __init__(self):
+        self._entries: "OrderedDict[Hashable, OutputIndex]" = OrderedDict()
+        self._building: Dict[Hashable, asyncio.Future] = {}
+        self.memory = 0
+
+    async def get(self, key: Optional[Hashable], load: Callable[[], Awaitable[Optional[str]]]) -> OutputIndex:
+        """
+        Index of the output under ``key``, built from ``load()`` when it is not cached.
+        Outputs that may still change pass a None key and are indexed on every request.
+        """
+        if key is None:
+            return await self._build(load)
+        index = self._entries.get(key)
+        if index is not None:
+            self._entries.move_to_end(key)
+            return index
+        building = self._building.get(key)
+        if building is None:
+            building = asyncio.ensure_future(self._build(load))
+            self._building[key] = building
+            building.add_done_callback(lambda future: self._built(key, future))
+        # A cancelled request must not cancel the build others are waiting for
+        return await asyncio.shield(building)
+
+    @staticmethod
+    async def _build(load: Callable[[], Awaitable[Optional[str]]]) -> OutputIndex:
+        return await asyncio.to_thread(OutputIndex, await load() or "")
+
+    def _built(self, key: Hashable, future: asyncio.Future):
+        self._building.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        index = future.result()
+        budget = settings.output_index_cache_mb * 1024 * 1024
+        if index.memory > budget:
+            # Would evict everything else and still not fit
+            return
+        while self._entries and self.memory + index.memory > budget:
+            _, evicted = self._entries.popitem(last=False)
+            self.memory -= evicted.memory
+        self._entries[key] = index
+        self.memory += index.memory
+
+    def clear(self):
+        self._entries.clear()
+        self.memory = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Global output index cache
+output_indexes = OutputIndexCache()
@@ -0,0 +1,260 @@
+"""
+Time-partitioned log storage.
+
+When ``settings.log_partitioning`` is on, ``task_logs`` in the main database only
+holds the live window (the current month). Finished logs from earlier months are
+moved into one SQLite file per month, ``task_logs_YYYY_MM.sqlite3``, which can be
+dropped as a whole by unlinking the file instead of deleting rows one by one.
+Partitions are written through the main connection with ATTACH and read through
+separate read-only connections.
+"""
+import asyncio
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiosqlite
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app.config import settings
+from app.db.blobs import release_blobs
+from app.db.codec import decompress_output
+from app.db.database import db_pragmas
+from app.db.versions import bump
+from app.models.log import ExecutionStatus
+
+logger = logging.getLogger(__name__)
+
+PARTITION_FILE = re.compile(r"^task_logs_(\d{4})_(\d{2})\.sqlite3$")
+FINISHED_STATUSES = [ExecutionStatus.COMPLETED, ExecutionStatus.FAILED, ExecutionStatus.TIMEOUT, ExecutionStatus.CANCELLED]
+# Timestamp a log is partitioned by, logs created without a start time fall back to created_at
+PARTITION_KEY = "COALESCE(started_at, created_at)"
+
+
+def month_start(year: int, month: int) -> datetime:
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def next_month(year: int, month: int):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def db_timestamp(value: datetime) -> str:
+    """
+    Format a datetime the way it is stored in SQLite so it can be compared as text
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.isoformat(" ")
+
+
+class Partition:
+    """
+    One month of logs in its own SQLite file
+    """
+
+    def __init__(self, path: Path, year: int, month: int):
+        self.path = path
+        self.year = year
+        self.month = month
+        self.start = month_start(year, month)
+        self.end = month_start(*next_month(year, month))
+
+    @property
+    def name(self) -> str:
+        return f"{self.year:04d}-{self.month:02d}"
+
+    def overlaps(self, after: Optional[datetime], before: Optional[datetime]) -> bool:
+        if after is not None and self.end <= as_utc(after):
+            return False
+        if before is not None and self.start >= as_utc(before):
+            return False
+        return True
+
+    def __repr__(self):
+        return f"Partition({self.name})"
+
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class PartitionStore:
+    """
+    Manages the monthly partition files and their read connections
+    """
+
+    def __init__(self):
+        self._readers: Dict[Path, aiosqlite.Connection] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.log_partitioning
+
+    @property
+    def directory(self) -> Path:
+        return Path(settings.log_partition_dir)
+
+    def partition_for(self, year: int, month: int) -> Partition:
+        return Partition(self.directory / f"task_logs_{year:04d}_{month:02d}.sqlite3", year, month)
+
+    def partitions(self, after: Optional[datetime] = None, before: Optional[datetime] = None) -> List[Partition]:
+        """
+        Existing partitions overlapping the time range, newest first
+        """
+        if not self.enabled or not self.directory.is_dir():
+            return []
+        found = []
+        for path in self.directory.iterdir():
+            match = PARTITION_FILE.match(path.name)
+            if match:
+                partition = Partition(path, int(match.group(1)), int(match.group(2)))
+                if partition.overlaps(after, before):
+                    found.append(partition)
+        return sorted(found, key=lambda p: p.start, reverse=True)
+
+    async def reader(self, partition: Partition) -> aiosqlite.Connection:
+        """
+        Cached read-only connection to a partition file
+        """
+        conn = self._readers.get(partition.path)
+        if conn is None:
+            conn = await aiosqlite.connect(f"file:{partition.path.as_posix()}?mode=ro", uri=True)
+            conn.row_factory = aiosqlite.Row
+            busy_timeout = db_pragmas().get("busy_timeout")
+            if busy_timeout:
+                # Rotation may be writing the same file through the main connection
+                await conn.execute_fetchall(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+            await conn.create_function("akari_output", 1, decompress_output, deterministic=True)
+            self._readers[partition.path] = conn
+        return conn
+
+    async def fetch(self, partition: Partition, sql: str, params: list) -> List[dict]:
+        conn = await self.reader(partition)
+        async with conn.execute(sql, params) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def close(self):
+        for conn in self._readers.values():
+            await conn.close()
+        self._readers.clear()
+
+    @asynccontextmanager
+    async def attached(self, partition: Partition):
+        """
+        Attach a partition to the main connection as ``part`` for writing, creating it if needed
+        """
+        async with self._lock:
+            partition.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = Tortoise.get_connection("default")
+            await conn.execute_query("ATTACH DATABASE ? AS part", [str(partition.path)])
+            try:
+                await self._sync_schema(conn)
+                yield conn
+            finally:
+                await conn.execute_query("DETACH DATABASE part")
+
+    async def _sync_schema(self, conn):
+        _, main_columns = await conn.execute_query("PRAGMA main.table_info(task_logs)")
+        _, part_columns = await conn.execute_query("PRAGMA part.table_info(task_logs)")
+        if not part_columns:
+            columns = ", ".join(
+                f'"{row["name"]}" INTEGER PRIMARY KEY' if row["name"] == "id" else f'"{row["name"]}" {row["type"]}'
+                for row in main_columns
+            )
+            await conn.execute_script(
+                f"CREATE TABLE part.task_logs ({columns});"
+                f"CREATE INDEX part.idx_task_logs_started_at ON task_logs ({PARTITION_KEY});"
+                f"CREATE INDEX part.idx_task_logs_task_id ON task_logs (task_id, {PARTITION_KEY});"
+            )
+            return
+        existing = {row["name"] for row in part_columns}
+        for row in main_columns:
+            if row["name"] not in existing:
+                await conn.execute_script(f'ALTER TABLE part.task_logs ADD COLUMN "{row["name"]}" {row["type"]}')
+
+    async def rotate(self, now: Optional[datetime] = None, batch_size: Optional[int] = None,
+                     pause: Optional[float] = None) -> int:
+        """
+        Move finished logs from before the current month out of the live table into their
+        month's partition, in batches. Returns the number of rows moved.
+        """
+        if not self.enabled:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        batch_size = batch_size or settings.retention_batch_size
+        pause = settings.retention_batch_pause if pause is None else pause
+        live_start = db_timestamp(month_start(now.year, now.month))
+        conn = Tortoise.get_connection("default")
+        _, column_rows = await conn.execute_query("PRAGMA main.table_info(task_logs)")
+        columns = ", ".join(f'"{row["name"]}"' for row in column_rows)
+        statuses = ", ".join(str(int(status)) for status in FINISHED_STATUSES)
+        moved = 0
+        while True:
+            rows = await conn.execute_query_dict(
+                f"SELECT id, substr({PARTITION_KEY}, 1, 7) AS month FROM main.task_logs "
+                f"WHERE {PARTITION_KEY} < ? AND status IN ({statuses}) ORDER BY id LIMIT ?",
+                [live_start, batch_size]
+            )
+            if not rows:
+                break
+            by_month: Dict[str, List[int]] = {}
+            for row in rows:
+                by_month.setdefault(row["month"], []).append(row["id"])
+            for month, ids in by_month.items():
+                year, month_number = (int(part) for part in month.split("-"))
+                placeholders = ", ".join("?" for _ in ids)
+                async with self.attached(self.partition_for(year, month_number)):
+                    async with in_transaction("default") as trx:
+                        # OR IGNORE keeps the move idempotent if an earlier one was interrupted
+                        await trx.execute_query(
+                            f"INSERT OR IGNORE INTO part.task_logs ({columns}) "
+                            f"SELECT {columns} FROM main.task_logs WHERE id IN ({placeholders})", ids
+                        )
+                        await trx.execute_query(f"DELETE FROM main.task_logs WHERE id IN ({placeholders})", ids)
+                bump("task_logs")
+                moved += len(ids)
+            if len(rows) < batch_size:
+                break
+            await asyncio.sleep(pause)
+        if moved:
+            logger.info(f"Moved {moved} logs into monthly partitions")
+        return moved
+
+    async def drop(self, partition: Partition) -> int:
+        """
+        Drop a whole partition, releasing the output blobs its logs reference.
+        Returns the number of logs it held.
+        """
+        rows = await self.fetch(
+            partition,
+            "SELECT COUNT(*) AS logs FROM task_logs", []
+        )
+        hashes = await self.fetch(
+            partition,
+            "SELECT hash, COUNT(*) AS refs FROM ("
+            "SELECT stdout_hash AS hash FROM task_logs UNION ALL SELECT stderr_hash FROM task_logs"
+            ") WHERE hash IS NOT NULL GROUP BY hash", []
+        )
+        conn = self._readers.pop(partition.path, None)
+        if conn is not None:
+            await conn.close()
+        async with in_transaction("default") as trx:
+            await release_blobs({row["hash"]: row["refs"] for row in hashes}, trx)
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            try:
+                os.remove(f"{partition.path}{suffix}")
+            except FileNotFoundError:
+                pass
+        logger.info(f"Dropped log partition {partition.name} with {rows[0]['logs']} logs")
+        return rows[0]["logs"]
+
+
+# Global partition store instance
+partitions = PartitionStore()
@@ -0,0 +1,253 @@
+"""
+Log retention engine.
+
+Deletes logs that fall outside the global or per-task retention policy in small
+bounded batches, each in its own short transaction, yielding between batches so
+the scheduler's log writes are never stalled behind one long DELETE. Freed pages
+are handed back to the filesystem with ``PRAGMA incremental_vacuum``.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+from tortoise import Tortoise
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+
+from app.config import settings
+from app.db.archive import archive
+from app.db.blobs import delete_logs
+from app.db.partitions import FINISHED_STATUSES, partitions
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task
+
+logger = logging.getLogger(__name__)
+
+FAILURE_STATUSES = [ExecutionStatus.FAILED, ExecutionStatus.TIMEOUT]
+
+
+def _or_default(value: Optional[int], default: Optional[int]) -> Optional[int]:
+    return default if value is None else value
+
+
+class RetentionPolicy(BaseModel):
+    """
+    Effective retention policy of a task, unset limits keep logs forever
+    """
+    max_age_days: Optional[int] = None
+    max_runs: Optional[int] = None
+    failure_max_age_days: Optional[int] = None
+
+    @classmethod
+    def global_default(cls) -> "RetentionPolicy":
+        return cls(
+            max_age_days=settings.retention_max_age_days,
+            max_runs=settings.retention_max_runs,
+            failure_max_age_days=settings.retention_failure_max_age_days,
+        )
+
+    @classmethod
+    def for_task(cls, task: Task) -> "RetentionPolicy":
+        default = cls.global_default()
+        # 0 is a limit of its own, only unset limits fall back to the default
+        return cls(
+            max_age_days=_or_default(task.log_max_age_days, default.max_age_days),
+            max_runs=_or_default(task.log_max_runs, default.max_runs),
+            failure_max_age_days=_or_default(task.log_failure_max_age_days, default.failure_max_age_days),
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return self.max_age_days is None and self.max_runs is None and self.failure_max_age_days is None
+
+
+class RetentionProgress(BaseModel):
+    """
+    Progress of the current or last retention run
+    """
+    running: bool = False
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    tasks_total: int = 0
+    tasks_done: int = 0
+    batches: int = 0
+    rows_deleted: int = 0
+    rows_partitioned: int = 0
+    partitions_dropped: int = 0
+    rows_archived: int = 0
+    segments_dropped: int = 0
+    pages_reclaimed: int = 0
+    error: Optional[str] = None
+
+
+def _older_than(days: int) -> Q:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    return Q(started_at__lt=cutoff) | Q(started_at__isnull=True, created_at__lt=cutoff)
+
+
+def expired_logs(task_id: int, policy: RetentionPolicy, max_runs_boundary: Optional[int] = None) -> Optional[QuerySet[TaskLog]]:
+    """
+    Build the query of a task's logs that the policy no longer keeps, running logs are never matched
+    """
+    conditions = []
+    keep_failures = policy.failure_max_age_days is not None
+    if keep_failures:
+        # Failures live by their own, usually longer, age limit and do not count against max_runs
+        conditions.append(Q(status__in=FAILURE_STATUSES) & _older_than(policy.failure_max_age_days))
+    if policy.max_age_days is not None:
+        condition = _older_than(policy.max_age_days)
+        if keep_failures:
+            condition &= ~Q(status__in=FAILURE_STATUSES)
+        conditions.append(condition)
+    if max_runs_boundary is not None:
+        condition = Q(id__lte=max_runs_boundary)
+        if keep_failures:
+            condition &= ~Q(status__in=FAILURE_STATUSES)
+        conditions.append(condition)
+    if not conditions:
+        return None
+    return TaskLog.filter(task_id=task_id, status__in=FINISHED_STATUSES).filter(Q(*conditions, join_type="OR"))
+
+
+async def delete_in_batches(query: QuerySet[TaskLog], progress: Optional[RetentionProgress] = None,
+                            batch_size: Optional[int] = None, pause: Optional[float] = None) -> int:
+    """
+    Delete the logs matched by ``query`` oldest first, ``batch_size`` rows per transaction.
+    Returns the number of rows deleted.
+    """
+    batch_size = batch_size or settings.retention_batch_size
+    pause = settings.retention_batch_pause if pause is None else pause
+    deleted = 0
+    while True:
+        ids = await query.order_by("id").limit(batch_size).values_list("id", flat=True)
+        if not ids:
+            break
+        count = await delete_logs(TaskLog.filter(id__in=ids))
+        deleted += count
+        if progress is not None:
+            progress.batches += 1
+            progress.rows_deleted += count
+        if len(ids) < batch_size:
+            break
+        # Let queued log writes and API requests through before the next batch
+        await asyncio.sleep(pause)
+    return deleted
+
+
+async def incremental_vacuum(pause: Optional[float] = None) -> int:
+    """
+    Return free pages to the filesystem in small steps. Needs ``auto_vacuum=INCREMENTAL``,
+    which init_db sets on new databases. Returns the number of pages reclaimed.
+    """
+    pause = settings.retention_batch_pause if pause is None else pause
+    conn = Tortoise.get_connection("default")
+    _, rows = await conn.execute_query("PRAGMA auto_vacuum")
+    if not rows or rows[0][0] != 2:
+        return 0
+    reclaimed = 0
+    while True:
+        _, rows = await conn.execute_query("PRAGMA freelist_count")
+        free_pages = rows[0][0]
+        if not free_pages:
+            break
+        step = min(free_pages, settings.retention_vacuum_pages)
+        await conn.execute_script(f"PRAGMA incremental_vacuum({step})")
+        reclaimed += step
+        await asyncio.sleep(pause)
+    return reclaimed
+
+
+class RetentionEngine:
+    """
+    Applies retention policies to every task's logs, one run at a time
+    """
+
+    def __init__(self):
+        self.progress = RetentionProgress()
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self) -> RetentionProgress:
+        """
+        Run retention once over all tasks
+        """
+        async with self._lock:
+            progress = self.progress = RetentionProgress(running=True, started_at=datetime.now(timezone.utc))
+            try:
+                tasks = await Task.all()
+                progress.tasks_total = len(tasks)
+                if partitions.enabled or archive.enabled:
+                    await self._apply_storage(tasks)
+                for task in tasks:
+                    await self._apply(task)
+                    progress.tasks_done += 1
+                progress.pages_reclaimed = await incremental_vacuum()
+            except Exception as e:
+                progress.error = str(e)
+                logger.exception("Log retention run failed")
+            finally:
+                progress.running = False
+                progress.finished_at = datetime.now(timezone.utc)
+            if progress.rows_deleted:
+                logger.info(f"Log retention deleted {progress.rows_deleted} logs in {progress.batches} batches, "
+                            f"reclaimed {progress.pages_reclaimed} pages")
+            return progress
+
+    async def _apply_storage(self, tasks):
+        """
+        Move past months out of the live table and old logs into the archive, then drop
+        whole partitions and archive segments once every log in them is past the longest
+        age limit of any task. Per-task limits are only applied row by row to the live table.
+        """
+        progress = self.progress
+        progress.rows_partitioned = await partitions.rotate()
+        progress.rows_archived = await archive.archive()
+        limits = []
+        for policy in [RetentionPolicy.global_default(), *(RetentionPolicy.for_task(task) for task in tasks)]:
+            if policy.max_age_days is None:
+                # Some logs are kept forever, partitions can only shrink row by row
+                return
+            limits.append(max(policy.max_age_days, policy.failure_max_age_days or 0))
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max(limits))
+        for partition in partitions.partitions(before=cutoff):
+            if partition.end <= cutoff:
+                progress.rows_deleted += await partitions.drop(partition)
+                progress.partitions_dropped += 1
+        segments_dropped, rows_dropped = await archive.drop_before(cutoff)
+        progress.segments_dropped = segments_dropped
+        progress.rows_deleted += rows_dropped
+
+    async def _apply(self, task: Task):
+        policy = RetentionPolicy.for_task(task)
+        if policy.is_empty:
+            return
+        boundary = None
+        if policy.max_runs is not None:
+            # Everything at or below the id of the first log past the newest max_runs goes.
+            # Only the runs the boundary can delete count: finished ones, without failures
+            # when they have their own age limit.
+            counted = TaskLog.filter(task_id=task.id, status__in=FINISHED_STATUSES)
+            if policy.failure_max_age_days is not None:
+                counted = counted.exclude(status__in=FAILURE_STATUSES)
+            ids = await counted.order_by("-id").offset(policy.max_runs).limit(1).values_list("id", flat=True)
+            boundary = ids[0] if ids else None
+        query = expired_logs(task.id, policy, boundary)
+        if query is not None:
+            await delete_in_batches(query, self.progress)
+
+    async def run_periodically(self):
+        """
+        Background loop started with the application
+        """
+        while True:
+            await asyncio.sleep(settings.retention_interval_seconds)
+            await self.run()
+
+
+# Global retention engine instance
+retention = RetentionEngine()
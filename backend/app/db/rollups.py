@@ -0,0 +1,370 @@
+"""
+Pre-aggregated execution statistics.
+
+Every run that finishes is added to an hourly and a daily ``task_run_rollups``
+row of its task, in the same transaction that writes the log, so /api/stats reads
+a handful of rows per bucket instead of scanning ``task_logs`` and keeps its
+numbers after retention purges the logs themselves. Durations, and the start lag
+of scheduled runs (from the trigger's fire time to the process spawn), are
+counted in fixed log-scale histograms from which percentiles are estimated.
+:func:`rebuild` recomputes buckets from the stored logs, e.g. for databases that
+had logs before rollups existed.
+"""
+import asyncio
+import json
+import logging
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.signals import pre_save, post_save
+from tortoise.transactions import in_transaction
+
+from app.config import settings
+from app.db.log_router import log_router, LogFilter
+from app.db.partitions import FINISHED_STATUSES, as_utc, db_timestamp
+from app.models.log import TaskLog, TaskRunRollup, ExecutionStatus
+from app.models.task import Task
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TABLE = "task_run_rollups"
+ROLLUP_BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Upper bounds in seconds of the duration histogram buckets, one more bucket holds longer runs
+DURATION_BOUNDS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+STATUS_COLUMNS = {
+    ExecutionStatus.COMPLETED: "completed",
+    ExecutionStatus.FAILED: "failed",
+    ExecutionStatus.TIMEOUT: "timed_out",
+    ExecutionStatus.CANCELLED: "cancelled",
+}
+# Upper bounds in seconds of the start lag histogram buckets
+LAG_BOUNDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 300]
+# Values histogrammed per bucket, each stored as <name>_count/_sum/_min/_max/_histogram columns
+SERIES = {"duration": DURATION_BOUNDS, "lag": LAG_BOUNDS}
+COUNT_COLUMNS = ["runs", *STATUS_COLUMNS.values(), *(f"{name}_{column}" for name in SERIES for column in ("count", "sum"))]
+EXTREME_COLUMNS = [f"{name}_{end}" for name in SERIES for end in ("min", "max")]
+HISTOGRAM_COLUMNS = [f"{name}_histogram" for name in SERIES]
+# Time past a task's timeout until its killed run's log is written
+FINISH_SLACK = timedelta(minutes=1)
+
+
+def bucket_start(value: datetime, bucket: str) -> datetime:
+    value = as_utc(value).astimezone(timezone.utc)
+    if bucket == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class RollupCounts:
+    """
+    Counters of one bucket, the in-memory form of a rollup row
+    """
+
+    def __init__(self):
+        self.values = {column: 0 for column in COUNT_COLUMNS}
+        self.extremes: Dict[str, Optional[float]] = {column: None for column in EXTREME_COLUMNS}
+        self.histograms = {name: [0] * (len(bounds) + 1) for name, bounds in SERIES.items()}
+
+    def add(self, status: int, duration: Optional[float], lag: Optional[float] = None):
+        self.values["runs"] += 1
+        self.values[STATUS_COLUMNS[ExecutionStatus(status)]] += 1
+        for name, value in (("duration", duration), ("lag", lag)):
+            if value is None:
+                continue
+            self.values[f"{name}_count"] += 1
+            self.values[f"{name}_sum"] += value
+            self._pick(f"{name}_min", value, min)
+            self._pick(f"{name}_max", value, max)
+            self.histograms[name][bisect_left(SERIES[name], value)] += 1
+
+    def _pick(self, column: str, value: float, pick):
+        current = self.extremes[column]
+        self.extremes[column] = value if current is None else pick(current, value)
+
+    def merge(self, row: dict):
+        # Lag columns are NULL in rows written before they were added
+        for column in COUNT_COLUMNS:
+            self.values[column] += row[column] or 0
+        for column in EXTREME_COLUMNS:
+            if row[column] is not None:
+                self._pick(column, row[column], min if column.endswith("_min") else max)
+        for name in SERIES:
+            for index, count in enumerate(row[f"{name}_histogram"] or []):
+                self.histograms[name][index] += count
+
+
+async def upsert_rollup(conn: BaseDBAsyncClient, task_id: int, bucket: str, start: datetime,
+                        counts: RollupCounts, replace: bool = False):
+    """
+    Add ``counts`` to a rollup row, or overwrite it with ``replace``
+    """
+    columns = ["task_id", "bucket", "bucket_start", *COUNT_COLUMNS, *EXTREME_COLUMNS, *HISTOGRAM_COLUMNS]
+    params = [
+        task_id, bucket, db_timestamp(start), *(counts.values[column] for column in COUNT_COLUMNS),
+        *(counts.extremes[column] for column in EXTREME_COLUMNS),
+        *(json.dumps(counts.histograms[name]) for name in SERIES)
+    ]
+    if replace:
+        updates = [f"{column} = excluded.{column}" for column in columns[3:]]
+    else:
+        updates = [f"{column} = COALESCE({column}, 0) + excluded.{column}" for column in COUNT_COLUMNS]
+        # Scalar min()/max() return NULL if either side is NULL
+        updates += [
+            f"{name}_{pick} = COALESCE({pick}({name}_{pick}, excluded.{name}_{pick}), {name}_{pick}, excluded.{name}_{pick})"
+            for name in SERIES for pick in ("min", "max")
+        ]
+        for name in SERIES:
+            changed = [(index, count) for index, count in enumerate(counts.histograms[name]) if count]
+            if changed:
+                column = f"{name}_histogram"
+                paths = ", ".join(
+                    f"'$[{index}]', COALESCE(json_extract({column}, '$[{index}]'), 0) + {count}"
+                    for index, count in changed
+                )
+                # A NULL histogram, from before the column existed, takes the new one
+                updates.append(f"{column} = COALESCE(json_set({column}, {paths}), excluded.{column})")
+    placeholders = ", ".join("?" for _ in columns)
+    await conn.execute_query(
+        f"INSERT INTO {ROLLUP_TABLE} ({', '.join(columns)}) VALUES ({placeholders}) "
+        f"ON CONFLICT (task_id, bucket, bucket_start) DO UPDATE SET {', '.join(updates)}",
+        params
+    )
+
+
+def start_lag(scheduled_at, spawned_at) -> Optional[float]:
+    """
+    Seconds from a trigger's fire time to the spawn of the run's process, None for
+    manual runs and runs that never spawned
+    """
+    if scheduled_at is None or spawned_at is None:
+        return None
+    if isinstance(scheduled_at, str):
+        scheduled_at, spawned_at = datetime.fromisoformat(scheduled_at), datetime.fromisoformat(spawned_at)
+    return max((as_utc(spawned_at) - as_utc(scheduled_at)).total_seconds(), 0.0)
+
+
+async def record_run(conn: BaseDBAsyncClient, task_id: int, status: int, at: datetime,
+                     duration: Optional[float], lag: Optional[float] = None):
+    """
+    Add one finished run to its task's hourly and daily rollups
+    """
+    counts = RollupCounts()
+    counts.add(status, duration, lag)
+    for bucket in ROLLUP_BUCKETS:
+        await upsert_rollup(conn, task_id, bucket, bucket_start(at, bucket), counts)
+
+
+@pre_save(TaskLog)
+async def _check_finished(sender, instance: TaskLog, using_db, update_fields):
+    # Count a run once, when its log is first written with a finished status
+    instance._finishes_run = False
+    if instance.status not in FINISHED_STATUSES or (update_fields and "status" not in update_fields):
+        return
+    if instance._saved_in_db:
+        # Known for instances that were loaded or saved, only others read the stored row
+        stored = getattr(instance, "_stored_status", None)
+        if stored is None:
+            rows = await TaskLog.filter(id=instance.id).using_db(using_db).values_list("status", flat=True)
+            stored = rows[0] if rows else None
+        if stored in FINISHED_STATUSES:
+            return
+    instance._finishes_run = True
+
+
+@post_save(TaskLog)
+async def _record_finished(sender, instance: TaskLog, created, using_db, update_fields):
+    if not update_fields or "status" in update_fields:
+        instance._stored_status = instance.status
+    if getattr(instance, "_finishes_run", False):
+        instance._finishes_run = False
+        at = instance.started_at or instance.created_at or datetime.now(timezone.utc)
+        await record_run(using_db, instance.task_id, instance.status, at, instance.duration,
+                         start_lag(instance.scheduled_at, instance.spawned_at))
+
+
+class RebuildResult(BaseModel):
+    logs: int = 0
+    buckets: int = 0
+
+
+def _count_rows(rows: List[dict], counts: Dict[Tuple[int, str, datetime], RollupCounts]) -> int:
+    # Adds the finished runs among ``rows`` to their buckets, returns how many there were
+    finished = 0
+    for row in rows:
+        if row["status"] not in FINISHED_STATUSES:
+            continue
+        at = row["started_at"] or row["created_at"]
+        if isinstance(at, str):
+            at = datetime.fromisoformat(at)
+        for bucket in ROLLUP_BUCKETS:
+            key = (row["task_id"], bucket, bucket_start(at, bucket))
+            counts.setdefault(key, RollupCounts()).add(
+                row["status"], row["duration"], start_lag(row["scheduled_at"], row["spawned_at"])
+            )
+        finished += 1
+    return finished
+
+
+async def _open_since(now: datetime) -> datetime:
+    """
+    Start of the first day whose buckets a run may still be added to. Runs are killed
+    at their task's timeout, so logs started longer ago than the longest one are final.
+    """
+    timeouts = await Task.all().order_by("-timeout").limit(1).values_list("timeout", flat=True)
+    longest = timedelta(seconds=timeouts[0] if timeouts else 0)
+    return bucket_start(now - longest - FINISH_SLACK, "day")
+
+
+async def rebuild(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  batch_size: Optional[int] = None, pause: Optional[float] = None) -> RebuildResult:
+    """
+    Recompute the rollups of every bucket that has stored logs between ``since`` and
+    ``until``, widened to whole days. Rebuilt rows replace the existing ones, so running
+    it again gives the same result, and buckets whose logs were purged are left alone.
+    Closed days are scanned in batches. Days runs may still finish in only hold live
+    logs, they are counted inside the transaction that replaces their buckets, so runs
+    recorded while the rebuild runs are not overwritten.
+    """
+    batch_size = batch_size or settings.retention_batch_size
+    pause = settings.retention_batch_pause if pause is None else pause
+    since = bucket_start(since, "day") if since else None
+    until = bucket_start(until, "day") + ROLLUP_BUCKETS["day"] if until else None
+    open_since = await _open_since(datetime.now(timezone.utc))
+
+    result = RebuildResult()
+    fields = ["id", "task_id", "status", "started_at", "created_at", "duration", "scheduled_at", "spawned_at"]
+    counts: Dict[Tuple[int, str, datetime], RollupCounts] = {}
+    closed_until = open_since if until is None else min(until, open_since)
+    if since is None or since < closed_until:
+        log_filter = LogFilter(started_after=since, started_before=closed_until)
+        async for rows in log_router.export(log_filter, fields, batch_size):
+            result.logs += _count_rows(rows, counts)
+
+    items = list(counts.items())
+    for start in range(0, len(items), batch_size):
+        async with in_transaction("default") as conn:
+            for (task_id, bucket, bucket_begin), bucket_counts in items[start:start + batch_size]:
+                await upsert_rollup(conn, task_id, bucket, bucket_begin, bucket_counts, replace=True)
+        await asyncio.sleep(pause)
+    result.buckets = len(items)
+
+    if until is None or until > open_since:
+        # No other write commits while the transaction is open
+        async with in_transaction("default") as conn:
+            query = TaskLog.filter(started_at__gte=max(since or open_since, open_since), status__in=FINISHED_STATUSES)
+            if until is not None:
+                query = query.filter(started_at__lt=until)
+            counts = {}
+            result.logs += _count_rows(await query.using_db(conn).values(*fields), counts)
+            for (task_id, bucket, bucket_begin), bucket_counts in counts.items():
+                await upsert_rollup(conn, task_id, bucket, bucket_begin, bucket_counts, replace=True)
+        result.buckets += len(counts)
+    logger.info(f"Rebuilt {result.buckets} rollup buckets from {result.logs} logs")
+    return result
+
+
+async def rebuild_if_empty():
+    """
+    Backfill rollups once for logs written before they existed
+    """
+    if await TaskRunRollup.exists() or not await TaskLog.filter(status__in=FINISHED_STATUSES).exists():
+        return
+    try:
+        await rebuild()
+    except Exception:
+        logger.exception("Rollup backfill failed")
+
+
+class StatsBucket(BaseModel):
+    """
+    Run counts, duration and start lag statistics of one bucket, or of a whole range
+    """
+    start: datetime
+    runs: int = 0
+    completed: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    cancelled: int = 0
+    duration_avg: Optional[float] = None
+    duration_min: Optional[float] = None
+    duration_max: Optional[float] = None
+    duration_p50: Optional[float] = None
+    duration_p95: Optional[float] = None
+    duration_p99: Optional[float] = None
+    lag_avg: Optional[float] = None
+    lag_min: Optional[float] = None
+    lag_max: Optional[float] = None
+    lag_p50: Optional[float] = None
+    lag_p95: Optional[float] = None
+    lag_p99: Optional[float] = None
+
+    @classmethod
+    def from_counts(cls, start: datetime, counts: RollupCounts) -> "StatsBucket":
+        values = counts.values
+        stats = cls(
+            start=start,
+            **{column: values[column] for column in ("runs", *STATUS_COLUMNS.values())},
+            **counts.extremes,
+        )
+        for name in SERIES:
+            count = values[f"{name}_count"]
+            if count:
+                setattr(stats, f"{name}_avg", values[f"{name}_sum"] / count)
+                for quantile in (50, 95, 99):
+                    setattr(stats, f"{name}_p{quantile}", percentile(counts, name, quantile / 100))
+        return stats
+
+
+class StatsResponse(BaseModel):
+    bucket: str
+    start: datetime
+    end: datetime
+    task_id: Optional[int] = None
+    total: StatsBucket
+    buckets: List[StatsBucket]
+
+
+def percentile(counts: RollupCounts, name: str, quantile: float) -> Optional[float]:
+    """
+    Estimate a percentile of a series from its histogram, interpolating inside the bucket it falls in
+    """
+    bounds = SERIES[name]
+    minimum, maximum = counts.extremes[f"{name}_min"], counts.extremes[f"{name}_max"]
+    rank = quantile * counts.values[f"{name}_count"]
+    seen = 0
+    for index, count in enumerate(counts.histograms[name]):
+        if count and seen + count >= rank:
+            lower = bounds[index - 1] if index else 0.0
+            upper = bounds[index] if index < len(bounds) else maximum
+            value = lower + (upper - lower) * (rank - seen) / count
+            return min(max(value, minimum), maximum)
+        seen += count
+    return maximum
+
+
+async def stats(bucket: str, start: datetime, end: datetime, task_id: Optional[int] = None) -> StatsResponse:
+    """
+    Statistics per bucket between ``start`` and ``end``, of one task or of all tasks together.
+    Only reads rollup rows, however many logs the range covers.
+    """
+    start, end = bucket_start(start, bucket), as_utc(end)
+    query = TaskRunRollup.filter(bucket=bucket, bucket_start__gte=start, bucket_start__lt=end)
+    if task_id is not None:
+        query = query.filter(task_id=task_id)
+    rows = await query.values("bucket_start", *COUNT_COLUMNS, *EXTREME_COLUMNS, *HISTOGRAM_COLUMNS)
+    by_start: Dict[datetime, RollupCounts] = {}
+    total = RollupCounts()
+    for row in rows:
+        by_start.setdefault(as_utc(row["bucket_start"]), RollupCounts()).merge(row)
+        total.merge(row)
+    return StatsResponse(
+        bucket=bucket,
+        start=start,
+        end=end,
+        task_id=task_id,
+        total=StatsBucket.from_counts(start, total),
+        buckets=[StatsBucket.from_counts(begin, counts) for begin, counts in sorted(by_start.items())],
+    )
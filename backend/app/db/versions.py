@@ -0,0 +1,60 @@
+"""
+Cheap change versions for conditional GETs.
+
+Each versioned table has an in-memory modification counter that every write
+path bumps once its change is committed: TaskLog and Task saves and deletes,
+batched log writes, bulk log deletes and partition rotation. Writes inside a
+transaction bump again when it commits (see :func:`bumps`), so a read racing
+the commit cannot cache the old state under the new version. Reading a version
+costs nothing, so API handlers can build an ETag and answer 304 before running
+the query behind the response. Versions are prefixed with a per-process epoch,
+so an ETag handed out before a restart never matches afterwards.
+"""
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Dict, NamedTuple, Optional
+
+_epoch = f"{time.time_ns():x}"
+_started_at = datetime.now(timezone.utc)
+_versions: Dict[str, int] = {}
+_modified_at: Dict[str, datetime] = {}
+
+
+class ChangeVersion(NamedTuple):
+    key: str
+    modified_at: Optional[datetime]
+
+
+def bump(table: str):
+    """
+    Record a committed change to ``table``
+    """
+    _versions[table] = _versions.get(table, 0) + 1
+    _modified_at[table] = datetime.now(timezone.utc)
+
+
+def bumps(*tables: str):
+    """
+    Decorator bumping ``tables`` once the wrapped coroutine is done, for handlers
+    whose writes commit in a transaction instead of through model saves
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapped(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                for table in tables:
+                    bump(table)
+        return wrapped
+    return decorator
+
+
+def change_version(*tables: str) -> ChangeVersion:
+    """
+    Combined version of ``tables``, changes whenever any of them does
+    """
+    key = ",".join(f"{table}:{_versions.get(table, 0)}" for table in tables)
+    modified_at = max(_modified_at.get(table, _started_at) for table in tables)
+    return ChangeVersion(f"{_epoch}/{key}", modified_at)
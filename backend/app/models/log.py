@@ -1,6 +1,16 @@
 from tortoise import fields, models
+from tortoise.transactions import in_transaction
 from tortoise.contrib.pydantic import pydantic_model_creator
+from pydantic import BaseModel
+from datetime import datetime
 from enum import IntEnum
+from typing import List, Optional
+from app.db.codec import CompressedTextField
+from app.db.blobs import acquire_blob, release_blobs, load_blobs, output_hash
+from app.db.versions import bump
+
+# Length of the output preview kept next to the size columns for list views
+OUTPUT_PREVIEW_LENGTH = 200
 
 
 class LogLevel(IntEnum):
@@ -34,14 +44,31 @@ class TaskLog(models.Model):
     finished_at = fields.DatetimeField(null=True, description="Finish time")
     duration = fields.FloatField(null=True, description="Duration in seconds")
 
+    # Lifecycle of a run, for measuring scheduling lag (see app.db.rollups.start_lag)
+    scheduled_at = fields.DatetimeField(null=True, description="Fire time of the trigger, none for manual runs")
+    fired_at = fields.DatetimeField(null=True, description="Time the scheduler started the fire")
+    admitted_at = fields.DatetimeField(null=True, description="Time the run passed the concurrency checks")
+    spawned_at = fields.DatetimeField(null=True, description="Time the process was started")
+    first_output_at = fields.DatetimeField(null=True, description="Time of the first stdout or stderr output")
+    exited_at = fields.DatetimeField(null=True, description="Time the process exited")
+    persisted_at = fields.DatetimeField(null=True, description="Time the finished log was written")
+
     # Command executed
     command_executed = fields.CharField(max_length=2000, description="Full command executed")
 
-    # Output
-    stdout = fields.TextField(null=True, description="Standard output")
-    stderr = fields.TextField(null=True, description="Standard error")
+    # Output, new logs keep it in output_blobs and only hold the hashes,
+    # the inline columns remain for logs written before deduplication
+    stdout = CompressedTextField(null=True, description="Standard output")
+    stderr = CompressedTextField(null=True, description="Standard error")
+    stdout_hash = fields.CharField(max_length=64, null=True, index=True, description="Standard output blob hash")
+    stderr_hash = fields.CharField(max_length=64, null=True, index=True, description="Standard error blob hash")
     exit_code = fields.IntField(null=True, description="Exit code")
 
+    # Output summary, kept up to date on save so list views never read stdout/stderr
+    stdout_size = fields.IntField(null=True, description="Standard output size in bytes")
+    stderr_size = fields.IntField(null=True, description="Standard error size in bytes")
+    output_preview = fields.CharField(max_length=OUTPUT_PREVIEW_LENGTH, null=True, description="Short output preview")
+
     # Error info
     error_message = fields.TextField(null=True, description="Error message if failed")
 
@@ -54,7 +81,177 @@ class TaskLog(models.Model):
     def __str__(self):
         return f"TaskLog(id={self.id}, task={self.task_id}, status={self.status})"
 
+    @classmethod
+    def _init_from_db(cls, **kwargs):
+        instance = super()._init_from_db(**kwargs)
+        # Status as stored, rollups count a run when its stored status first turns finished.
+        # Partial instances may not have loaded it.
+        instance._stored_status = getattr(instance, "status", None)
+        return instance
+
+    async def save(self, using_db=None, *args, **kwargs):
+        self.update_output_summary()
+        db = using_db or self._choose_db(True)
+        outputs = self.stdout, self.stderr
+        async with in_transaction(db.connection_name) as conn:
+            await self._store_outputs(conn)
+            try:
+                await super().save(conn, *args, **kwargs)
+            finally:
+                # The columns are written empty, keep the text on the instance
+                self.stdout, self.stderr = outputs
+        bump(self._meta.db_table)
+
+    async def delete(self, using_db=None):
+        db = using_db or self._choose_db(True)
+        async with in_transaction(db.connection_name) as conn:
+            await super().delete(conn)
+            await release_blobs([self.stdout_hash, self.stderr_hash], conn)
+        bump(self._meta.db_table)
+
+    async def _store_outputs(self, conn):
+        """
+        Move stdout/stderr into content-addressed blobs, releasing a previously stored output
+        """
+        for stream in ("stdout", "stderr"):
+            text = getattr(self, stream)
+            if not text:
+                # Empty, or not loaded on this instance: keep whatever is stored
+                continue
+            hash_attr = f"{stream}_hash"
+            old_hash = getattr(self, hash_attr)
+            digest = output_hash(text)
+            if digest != old_hash:
+                await acquire_blob(text, conn, digest)
+                await release_blobs([old_hash], conn)
+                setattr(self, hash_attr, digest)
+            setattr(self, stream, None)
+
+    async def load_outputs(self):
+        """
+        Resolve stdout/stderr from their blobs
+        """
+        blobs = await load_blobs([self.stdout_hash, self.stderr_hash])
+        if self.stdout_hash:
+            self.stdout = blobs.get(self.stdout_hash)
+        if self.stderr_hash:
+            self.stderr = blobs.get(self.stderr_hash)
+
+    def update_output_summary(self):
+        """
+        Refresh output sizes and preview from stdout/stderr
+        """
+        if self._partial:
+            return
+        for stream in ("stdout", "stderr"):
+            text = getattr(self, stream)
+            # Output kept in a blob is not loaded on the instance, its summary is already stored
+            if text or not getattr(self, f"{stream}_hash"):
+                setattr(self, f"{stream}_size", len(text.encode("utf-8")) if text else 0)
+        if self.stdout or self.stderr or not (self.stdout_hash or self.stderr_hash):
+            preview = self.stdout or self.stderr or self.error_message or ""
+            self.output_preview = preview[:OUTPUT_PREVIEW_LENGTH] or None
+
+
+class OutputBlob(models.Model):
+    """
+    Distinct task output shared by every log that produced it, see app.db.blobs
+    """
+    hash = fields.CharField(max_length=64, pk=True, description="sha256 of the output")
+    data = CompressedTextField(description="Output text")
+    size = fields.IntField(description="Output size in bytes")
+    refcount = fields.IntField(default=0, description="Number of log streams referencing this output")
+
+    class Meta:
+        table = "output_blobs"
+
+    def __str__(self):
+        return f"OutputBlob(hash={self.hash[:12]}, size={self.size}, refcount={self.refcount})"
+
+
+class TaskRunRollup(models.Model):
+    """
+    Run counts and duration histogram of one task over one hour or day, see app.db.rollups
+    """
+    id = fields.IntField(pk=True)
+    task = fields.ForeignKeyField("models.Task", related_name="rollups", on_delete=fields.CASCADE)
+    bucket = fields.CharField(max_length=8, description="Bucket size, hour or day")
+    bucket_start = fields.DatetimeField(description="Start of the bucket")
+
+    runs = fields.IntField(default=0, description="Finished runs")
+    completed = fields.IntField(default=0)
+    failed = fields.IntField(default=0)
+    timed_out = fields.IntField(default=0)
+    cancelled = fields.IntField(default=0)
+
+    duration_count = fields.IntField(default=0, description="Runs with a known duration")
+    duration_sum = fields.FloatField(default=0)
+    duration_min = fields.FloatField(null=True)
+    duration_max = fields.FloatField(null=True)
+    duration_histogram = fields.JSONField(default=list, description="Run counts per DURATION_BOUNDS bucket")
+
+    # Nullable so that upgrade_schema can add them to existing databases
+    lag_count = fields.IntField(null=True, description="Scheduled runs with a known start lag")
+    lag_sum = fields.FloatField(null=True)
+    lag_min = fields.FloatField(null=True)
+    lag_max = fields.FloatField(null=True)
+    lag_histogram = fields.JSONField(null=True, description="Run counts per LAG_BOUNDS bucket")
+
+    class Meta:
+        table = "task_run_rollups"
+        unique_together = (("task", "bucket", "bucket_start"),)
+        indexes = (("bucket", "bucket_start"),)
+
+    def __str__(self):
+        return f"TaskRunRollup(task={self.task_id}, {self.bucket}={self.bucket_start}, runs={self.runs})"
+
 
 # Pydantic schemas for API
-TaskLog_Pydantic = pydantic_model_creator(TaskLog, name="TaskLog")
-TaskLogIn_Pydantic = pydantic_model_creator(TaskLog, name="TaskLogIn", exclude_readonly=True)
\ No newline at end of file
+TaskLog_Pydantic = pydantic_model_creator(TaskLog, name="TaskLog", exclude=("stdout_hash", "stderr_hash"))
+TaskLogIn_Pydantic = pydantic_model_creator(TaskLog, name="TaskLogIn", exclude_readonly=True, exclude=("stdout_hash", "stderr_hash"))
+
+
+class TaskLogSummary(BaseModel):
+    """
+    Lightweight log projection for list endpoints, without stdout/stderr bodies.
+    Every field is optional so that sparse fieldsets (``fields=``) can omit them.
+    """
+    id: int
+    task_id: Optional[int] = None
+    status: Optional[ExecutionStatus] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration: Optional[float] = None
+    scheduled_at: Optional[datetime] = None
+    fired_at: Optional[datetime] = None
+    admitted_at: Optional[datetime] = None
+    spawned_at: Optional[datetime] = None
+    first_output_at: Optional[datetime] = None
+    exited_at: Optional[datetime] = None
+    persisted_at: Optional[datetime] = None
+    exit_code: Optional[int] = None
+    error_message: Optional[str] = None
+    command_executed: Optional[str] = None
+    stdout_size: Optional[int] = None
+    stderr_size: Optional[int] = None
+    output_preview: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+# Columns a list request may select through ``fields=``
+LOG_SUMMARY_FIELDS = list(TaskLogSummary.model_fields)
+# Run lifecycle timestamps, in the order they are taken
+LIFECYCLE_FIELDS = ["scheduled_at", "fired_at", "admitted_at", "spawned_at", "first_output_at", "exited_at", "persisted_at"]
+
+
+class LogOutputPage(BaseModel):
+    """
+    Page of lines of one output stream of a log
+    """
+    log_id: int
+    stream: str
+    status: ExecutionStatus
+    total_lines: int
+    total_bytes: int
+    from_line: int
+    lines: List[str]
\ No newline at end of file
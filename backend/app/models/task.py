@@ -1,8 +1,10 @@
 from tortoise import fields, models
 from tortoise.contrib.pydantic import pydantic_model_creator
+from tortoise.validators import MinValueValidator
 from enum import IntEnum
 from typing import Optional, List
 import json
+from app.db.versions import bump
 
 
 class ScheduleType(IntEnum):
@@ -10,6 +12,19 @@ class ScheduleType(IntEnum):
     INTERVAL = 2
 
 
+class NonNegativeIntField(fields.IntField):
+    """
+    Integer field rejecting negative values, on save and in the generated pydantic models
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(validators=[MinValueValidator(0), *kwargs.pop("validators", [])], **kwargs)
+
+    @property
+    def constraints(self) -> dict:
+        return {**super().constraints, "ge": 0}
+
+
 class Task(models.Model):
     """
     Task model representing a scheduled job
@@ -32,6 +47,11 @@ class Task(models.Model):
     timeout = fields.IntField(default=300, description="Timeout in seconds")
     max_concurrent = fields.IntField(default=1, description="Maximum concurrent executions")
 
+    # Log retention, falls back to the global settings when unset
+    log_max_age_days = NonNegativeIntField(null=True, description="Delete logs older than N days")
+    log_max_runs = NonNegativeIntField(null=True, description="Keep at most N logs")
+    log_failure_max_age_days = NonNegativeIntField(null=True, description="Keep failed logs N days instead")
+
     # Metadata
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
@@ -42,6 +62,16 @@ class Task(models.Model):
     def __str__(self):
         return f"Task(id={self.id}, name={self.name})"
 
+    async def save(self, *args, **kwargs):
+        await super().save(*args, **kwargs)
+        bump(self._meta.db_table)
+
+    async def delete(self, *args, **kwargs):
+        await super().delete(*args, **kwargs)
+        bump(self._meta.db_table)
+        # Cascaded to the task's logs
+        bump("task_logs")
+
     @property
     def schedule_info(self) -> str:
         if self.schedule_type == ScheduleType.CRON:
@@ -53,7 +83,7 @@ class Task(models.Model):
 # Pydantic schemas for API
 Task_Pydantic = pydantic_model_creator(Task, name="Task")
 TaskIn_Pydantic = pydantic_model_creator(Task, name="TaskIn", exclude_readonly=True)
-TaskUpdate_Pydantic = pydantic_model_creator(Task, name="TaskUpdate", exclude_readonly=True, optional=["name", "description", "command", "args", "schedule_type", "cron_expression", "interval_seconds", "enabled", "timeout", "max_concurrent"])
+TaskUpdate_Pydantic = pydantic_model_creator(Task, name="TaskUpdate", exclude_readonly=True, optional=["name", "description", "command", "args", "schedule_type", "cron_expression", "interval_seconds", "enabled", "timeout", "max_concurrent", "log_max_age_days", "log_max_runs", "log_failure_max_age_days"])
 
 from app.models.log import ExecutionStatus
 from pydantic import BaseModel
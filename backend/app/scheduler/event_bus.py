@@ -0,0 +1,134 @@
+"""
+In-process bus of task and execution state changes.
+
+TaskScheduler publishes an event whenever a job fires, a run is queued, starts
+or finishes, and whenever a task is created, changed or deleted. GET /api/events
+streams them to clients as server-sent events, so views can apply the change
+instead of polling the task and log lists.
+
+Every event carries a sequence number, increasing by one per event and prefixed
+with a per-process epoch in its SSE id. The most recent events are kept in a
+ring buffer, so a client reconnecting with ``Last-Event-ID`` receives the events
+it missed. If they were already dropped, or the server restarted in between, it
+gets a ``reset`` event telling it to reload its state first.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncIterator, Deque, Optional, Set
+
+from pydantic import BaseModel
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ("runs", "tasks")
+
+
+class Event(BaseModel):
+    seq: int
+    topic: str
+    type: str
+    task_id: Optional[int] = None
+    at: datetime
+    data: dict = {}
+
+
+class Subscription:
+    """
+    One client's queue of live events
+    """
+
+    def __init__(self, topics: Set[str], task_id: Optional[int]):
+        self.topics = topics
+        self.task_id = task_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.event_queue_size)
+        # Set when the client fell so far behind that its queue overflowed
+        self.overflowed = False
+
+    def matches(self, event: Event) -> bool:
+        return event.topic in self.topics and (self.task_id is None or event.task_id == self.task_id)
+
+
+class EventBus:
+    def __init__(self):
+        self.epoch = f"{time.time_ns():x}"
+        self.seq = 0
+        self._buffer: Deque[Event] = deque(maxlen=settings.event_buffer_size)
+        self._subscriptions: Set[Subscription] = set()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """
+        Sequence number of an event id from this process, None for ids of another epoch or garbage
+        """
+        epoch, _, seq = (event_id or "").rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, topic: str, type: str, task_id: Optional[int] = None, **data) -> Event:
+        self.seq += 1
+        event = Event(seq=self.seq, topic=topic, type=type, task_id=task_id, at=datetime.now(timezone.utc), data=data)
+        self._buffer.append(event)
+        for subscription in list(self._subscriptions):
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Drop the slow client instead of buffering without bound, it resumes from the ring buffer
+                subscription.overflowed = True
+                self._subscriptions.discard(subscription)
+        return event
+
+    def replay(self, after: int) -> Optional[list]:
+        """
+        Buffered events after sequence number ``after``, None if some of them were already dropped
+        """
+        if after > self.seq:
+            return None
+        if after < self.seq and (not self._buffer or self._buffer[0].seq > after + 1):
+            return None
+        return [event for event in self._buffer if event.seq > after]
+
+    async def subscribe(self, topics: Set[str], task_id: Optional[int] = None, last_event_id: Optional[str] = None,
+                        heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Event]]:
+        """
+        Events matching the filters, first the ones missed since ``last_event_id``, then live ones.
+        A ``reset`` event is yielded when the missed events are no longer known. With ``heartbeat``,
+        None is yielded after that many idle seconds so the caller can keep the connection alive.
+        """
+        subscription = Subscription(topics, task_id)
+        # Registered and replayed without awaiting in between, so every event is either replayed or queued
+        self._subscriptions.add(subscription)
+        try:
+            if last_event_id is not None:
+                after = self.parse_event_id(last_event_id)
+                missed = self.replay(after) if after is not None else None
+                if missed is None:
+                    yield Event(seq=self.seq, topic="bus", type="reset", at=datetime.now(timezone.utc))
+                else:
+                    for event in missed:
+                        if subscription.matches(event):
+                            yield event
+            while not (subscription.overflowed and subscription.queue.empty()):
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+
+# Global event bus instance
+event_bus = EventBus()
@@ -3,13 +3,22 @@ from concurrent.futures import ThreadPoolExecutor
 import logging
 from datetime import datetime, timezone
 import sys
-from typing import Optional, Dict, Any, List
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Deque
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from app.models.task import Task, ScheduleType
 from app.models.log import TaskLog, ExecutionStatus
+from app.core.metrics import Counter, Gauge, Histogram
+from app.db.log_writer import log_writer
+from app.db.rollups import DURATION_BOUNDS, LAG_BOUNDS, start_lag
+from app.db.versions import bump, change_version
+from app.scheduler.event_bus import event_bus
 from app.config import settings
+from tortoise import Tortoise
 import subprocess
 import shlex
 
@@ -37,6 +46,27 @@ def run_command_in_thread(*cmd_args):
 
 executor = ThreadPoolExecutor(max_workers=8)
 
+TASK_FIRES = Counter("akari_task_fires", "Scheduled fires per task", ["task_id"])
+TASK_SKIPS = Counter("akari_task_skips", "Fires skipped per task and reason", ["task_id", "reason"])
+TASK_TIMEOUTS = Counter("akari_task_timeouts", "Runs killed at their timeout per task", ["task_id"])
+TASK_FAILURES = Counter("akari_task_failures", "Failed runs per task, timeouts excluded", ["task_id"])
+TASK_DURATION = Histogram("akari_task_duration_seconds", "Duration of finished runs", buckets=DURATION_BOUNDS)
+TASK_SPAWN = Histogram("akari_task_spawn_seconds", "Time to start a run's process")
+TASK_QUEUE_WAIT = Histogram("akari_task_queue_wait_seconds", "Time from queueing a run to its start")
+TASK_START_LAG = Histogram("akari_task_start_lag_seconds", "Time from a trigger's fire time to the spawn of its run",
+                           buckets=LAG_BOUNDS)
+RUNNING_JOBS = Gauge(
+    "akari_running_jobs", "Runs in progress",
+    function=lambda: sum(1 for job in scheduler.running_jobs.values() if not job.done())
+)
+# ThreadPoolExecutor keeps one idle semaphore release per idle thread
+EXECUTOR_THREADS = Gauge("akari_executor_threads", "Threads started by the subprocess executor",
+                         function=lambda: len(executor._threads))
+EXECUTOR_BUSY_THREADS = Gauge("akari_executor_busy_threads", "Subprocess executor threads running a call",
+                              function=lambda: len(executor._threads) - executor._idle_semaphore._value)
+EXECUTOR_QUEUED = Gauge("akari_executor_queued_calls", "Calls waiting for a subprocess executor thread",
+                        function=lambda: executor._work_queue.qsize())
+
 import asyncio
 import subprocess
 import sys
@@ -47,12 +77,17 @@ class AsyncSubprocess:
     def __init__(self):
         pass
     
-    async def run_with_timeout(self, cmd, timeout):
-        """运行命令并设置超时"""
+    async def run_with_timeout(self, cmd, timeout, timings: Optional[Dict[str, datetime]] = None):
+        """
+        运行命令并设置超时
+        ``timings`` receives spawned_at, first_output_at and exited_at as they happen
+        """
         process = None
+        timings = {} if timings is None else timings
         
         try:
             # 在线程池中运行阻塞的 subprocess 调用
+            spawn_start = time.perf_counter()
             process = await asyncio.get_event_loop().run_in_executor(
                 executor,
                 lambda: subprocess.Popen(
@@ -64,10 +99,12 @@ class AsyncSubprocess:
                     errors='ignore'
                 )
             )
+            TASK_SPAWN.observe(time.perf_counter() - spawn_start)
+            timings["spawned_at"] = datetime.now(timezone.utc)
             
             # 创建异步任务来等待进程完成
             communicate_task = asyncio.create_task(
-                self._communicate_async(process)
+                self._communicate_async(process, timings)
             )
             
             try:
@@ -92,7 +129,7 @@ class AsyncSubprocess:
                 # 等待进程真正结束
                 await asyncio.get_event_loop().run_in_executor(
                     executor,
-                    process.wait
+                    self._wait, process, timings
                 )
                 
                 raise TimeoutError(f"Task timed out after {timeout} seconds")
@@ -110,24 +147,24 @@ class AsyncSubprocess:
                 )
             raise e
     
-    async def _communicate_async(self, process: subprocess.Popen[str]):
+    async def _communicate_async(self, process: subprocess.Popen[str], timings: Dict[str, datetime]):
         """异步版本的 communicate()"""
         loop = asyncio.get_event_loop()
         
         # 并行读取 stdout 和 stderr
         stdout_future = loop.run_in_executor(
             executor,
-            process.stdout.read
+            self._read, process.stdout, timings
         )
         stderr_future = loop.run_in_executor(
             executor,
-            process.stderr.read
+            self._read, process.stderr, timings
         )
         
         # 等待进程结束
         wait_future = loop.run_in_executor(
             executor,
-            process.wait
+            self._wait, process, timings
         )
         
         # 等待所有任务完成
@@ -139,6 +176,20 @@ class AsyncSubprocess:
         
         return stdout, stderr
     
+    @staticmethod
+    def _read(stream, timings: Dict[str, datetime]) -> str:
+        # The first character blocks until the process writes, which timestamps its first output
+        first = stream.read(1)
+        if not first:
+            return ""
+        timings.setdefault("first_output_at", datetime.now(timezone.utc))
+        return first + stream.read()
+
+    @staticmethod
+    def _wait(process: subprocess.Popen, timings: Dict[str, datetime]):
+        process.wait()
+        timings.setdefault("exited_at", datetime.now(timezone.utc))
+
     def _terminate_windows(self, process):
         """Windows 上的进程终止方法"""
         try:
@@ -156,9 +207,34 @@ class AsyncSubprocess:
                 pass
 
 
+def task_event_data(task: Task) -> dict:
+    # What list views show of a task, sent with task events
+    return {
+        "name": task.name,
+        "enabled": task.enabled,
+        "schedule_type": task.schedule_type,
+        "cron_expression": task.cron_expression,
+        "interval_seconds": task.interval_seconds,
+        "updated_at": task.updated_at,
+    }
+
+
+def _schedule_key(task: Task) -> tuple:
+    # Fields that decide whether and when a task's job fires
+    return task.enabled, task.schedule_type, task.cron_expression, task.interval_seconds
+
+
 class TaskScheduler:
     """
     Task scheduler service using APScheduler
+
+    Fires read their task from an in-memory registry instead of the database. The
+    tasks API keeps it current with :meth:`register_task` and :meth:`unregister_task`.
+    Other writes are caught by two version checks: the in-process change version of
+    ``tasks`` (app.db.versions), compared on every fire at no cost, and SQLite's
+    ``PRAGMA data_version``, which only moves when another connection, e.g. another
+    process or a manual edit, commits and is polled by :meth:`watch_tasks`. Either
+    one reloads the whole registry and reschedules the tasks whose schedule changed.
     """
 
     def __init__(self):
@@ -168,6 +244,13 @@ class TaskScheduler:
         )
         self.running_jobs: Dict[int, asyncio.Task] = {}
         self.job_id_map: Dict[int, str] = {}  # task_id -> scheduler job id
+        self.tasks: Dict[int, Task] = {}  # task_id -> task, the registry read by fires
+        self._tasks_version: Optional[str] = None  # change version the registry was loaded at
+        self._data_version: Optional[int] = None
+        self._reload_lock = asyncio.Lock()
+        # task_id -> trigger fire times submitted but not yet taken by a fire
+        self._fire_times: Dict[int, Deque[datetime]] = {}
+        self.scheduler.add_listener(self._job_submitted, EVENT_JOB_SUBMITTED)
 
     async def start(self):
         """
@@ -185,6 +268,104 @@ class TaskScheduler:
             self.scheduler.shutdown()
             logger.info("Task scheduler stopped")
 
+    async def load_tasks(self, reschedule: bool = False):
+        """
+        (Re)load the task registry from the database. With ``reschedule`` the jobs
+        of tasks that were added, removed or whose schedule changed are updated too.
+        """
+        async with self._reload_lock:
+            version = change_version("tasks").key
+            data_version = await self._read_data_version()
+            tasks = {task.id: task for task in await Task.all()}
+            previous, self.tasks = self.tasks, tasks
+            self._tasks_version = version
+            self._data_version = data_version
+        if not reschedule:
+            return
+        for task_id in previous.keys() - tasks.keys():
+            await self.remove_task(task_id)
+            event_bus.publish("tasks", "deleted", task_id)
+        for task in tasks.values():
+            old = previous.get(task.id)
+            if old is None or old.updated_at != task.updated_at:
+                event_bus.publish("tasks", "created" if old is None else "updated", task.id, **task_event_data(task))
+            if old is None or _schedule_key(old) != _schedule_key(task):
+                if task.enabled:
+                    await self.add_task(task)
+                else:
+                    await self.remove_task(task.id)
+                logger.info(f"Task {task.id} changed outside the API, rescheduled")
+
+    async def _read_data_version(self) -> int:
+        _, rows = await Tortoise.get_connection("default").execute_query("PRAGMA data_version")
+        return rows[0][0]
+
+    def tasks_committed(self, since: str):
+        """
+        Record task writes the API committed and is about to apply to the registry
+        itself. ``since`` is the tasks version read before writing: a registry that
+        was current then stays current, so the next fire does not reload it.
+        """
+        bump("tasks")
+        if self._tasks_version == since:
+            self._tasks_version = change_version("tasks").key
+
+    def register_task(self, task: Task):
+        """
+        Put a created or updated task into the registry
+        """
+        event = "updated" if task.id in self.tasks else "created"
+        self.tasks[task.id] = task
+        event_bus.publish("tasks", event, task.id, **task_event_data(task))
+
+    def unregister_task(self, task_id: int):
+        """
+        Drop a deleted task from the registry
+        """
+        self.tasks.pop(task_id, None)
+        event_bus.publish("tasks", "deleted", task_id)
+
+    async def apply_tasks(self, changed: List[Task], deleted: List[int]):
+        """
+        Bring the registry and the jobs in line with a batch of written tasks, e.g. a
+        bulk import. Only tasks whose schedule or enabled flag changed are rescheduled.
+        """
+        for task_id in deleted:
+            await self.remove_task(task_id)
+            self.unregister_task(task_id)
+        for task in changed:
+            old = self.tasks.get(task.id)
+            self.register_task(task)
+            if old is not None and _schedule_key(old) == _schedule_key(task):
+                continue
+            if task.enabled:
+                await self.add_task(task)
+            else:
+                await self.remove_task(task.id)
+
+    async def get_task(self, task_id: int) -> Optional[Task]:
+        """
+        Task from the registry, reloaded first if tasks were written since it was loaded
+        """
+        if self._tasks_version != change_version("tasks").key:
+            await self.load_tasks(reschedule=self._tasks_version is not None)
+        return self.tasks.get(task_id)
+
+    async def watch_tasks(self):
+        """
+        Background loop started with the application, picks up task edits committed
+        by other connections
+        """
+        while True:
+            await asyncio.sleep(settings.task_registry_check_seconds)
+            try:
+                if await self._read_data_version() != self._data_version:
+                    # Cached task responses predate the outside commit too
+                    bump("tasks")
+                    await self.load_tasks(reschedule=True)
+            except Exception:
+                logger.exception("Task registry check failed")
+
     async def add_task(self, task: Task) -> Optional[str]:
         """
         Add a task to the scheduler
@@ -243,6 +424,7 @@ class TaskScheduler:
         """
         Remove a task from the scheduler
         """
+        self._fire_times.pop(task_id, None)
         job_id = self.job_id_map.get(task_id)
         if job_id:
             try:
@@ -263,31 +445,59 @@ class TaskScheduler:
                     pass
             del self.running_jobs[task_id]
 
+    def _job_submitted(self, event: JobSubmissionEvent):
+        # Dispatched right after APScheduler submits a job, before the fire runs. A job that
+        # was due several times runs once per fire time, in order.
+        if event.job_id.startswith("task_"):
+            task_id = int(event.job_id.split("_")[1])
+            self._fire_times.setdefault(task_id, deque()).extend(event.scheduled_run_times)
+
+    def _take_fire_time(self, task_id: int) -> Optional[datetime]:
+        fire_times = self._fire_times.get(task_id)
+        if not fire_times:
+            return None
+        fire_time = fire_times.popleft()
+        if not fire_times:
+            del self._fire_times[task_id]
+        return fire_time
+
     async def _execute_task_wrapper(self, task_id: int):
         """
         Wrapper for task execution to handle concurrent limits
         """
+        timings = {
+            "scheduled_at": self._take_fire_time(task_id),
+            "fired_at": datetime.now(timezone.utc),
+        }
         # Check concurrent executions
-        task = await Task.get_or_none(id=task_id)
+        task = await self.get_task(task_id)
         if not task or not task.enabled:
             return
+        event_bus.publish("runs", "fired", task_id)
+        TASK_FIRES.inc(task_id=task_id)
 
         # Check if already running
         if task_id in self.running_jobs:
             running_task = self.running_jobs[task_id]
             if not running_task.done():
                 logger.warning(f"Task {task_id} is already running, skipping")
+                event_bus.publish("runs", "skipped", task_id, reason="already running")
+                TASK_SKIPS.inc(task_id=task_id, reason="already running")
                 return
 
         # Check concurrent limit
         running_count = sum(1 for t in self.running_jobs.values() if not t.done())
         if running_count >= task.max_concurrent:
             logger.warning(f"Concurrent limit reached for task {task_id}, skipping")
+            event_bus.publish("runs", "skipped", task_id, reason="concurrent limit")
+            TASK_SKIPS.inc(task_id=task_id, reason="concurrent limit")
             return
 
         # Execute task
-        execution_task = asyncio.create_task(self._execute_task(task))
+        timings["admitted_at"] = datetime.now(timezone.utc)
+        execution_task = asyncio.create_task(self._run_queued(task, time.perf_counter(), timings))
         self.running_jobs[task_id] = execution_task
+        event_bus.publish("runs", "queued", task_id)
         try:
             await execution_task
         except asyncio.CancelledError:
@@ -311,17 +521,26 @@ class TaskScheduler:
         )
         return exit_code, stdout, stderr
 
-    async def _execute_task(self, task: Task):
+    async def _run_queued(self, task: Task, queued_at: float, timings: Optional[Dict[str, datetime]] = None):
+        # queued_at is the perf_counter reading taken when the run was queued
+        TASK_QUEUE_WAIT.observe(time.perf_counter() - queued_at)
+        await self._execute_task(task, timings)
+
+    async def _execute_task(self, task: Task, timings: Optional[Dict[str, datetime]] = None):
         """
         Execute a task command and log results
+        ``timings`` holds the lifecycle timestamps taken before the run started, see TaskLog
         """
+        timings = dict(timings or {})
         log = TaskLog(
             task=task,
             status=ExecutionStatus.RUNNING,
             command_executed=f"{task.command} {' '.join(map(str, task.args))}",
-            started_at=datetime.now(timezone.utc)
+            started_at=datetime.now(timezone.utc),
+            **timings
         )
-        await log.save()
+        await log_writer.save(log)
+        event_bus.publish("runs", "started", task.id, log_id=log.id, started_at=log.started_at)
 
         try:
             # Build command
@@ -335,7 +554,8 @@ class TaskScheduler:
             try:
                 exit_code, stdout, stderr = await async_subprocess.run_with_timeout(
                     cmd=cmd,
-                    timeout=task.timeout
+                    timeout=task.timeout,
+                    timings=timings
                 )
                 
                 log.stdout = stdout
@@ -344,9 +564,8 @@ class TaskScheduler:
             except TimeoutError:
                 log.status = ExecutionStatus.TIMEOUT
                 log.error_message = f"Task timed out after {task.timeout} seconds"
-                log.stdout = ""
-                log.stderr = ""
-                log.exit_code = -1
+                exit_code, stdout, stderr = -1, "", ""
+                TASK_TIMEOUTS.inc(task_id=task.id)
             except Exception as e:
                 raise e
 
@@ -357,7 +576,7 @@ class TaskScheduler:
 
             if exit_code == 0:
                 log.status = ExecutionStatus.COMPLETED
-            else:
+            elif log.status != ExecutionStatus.TIMEOUT:
                 log.status = ExecutionStatus.FAILED
                 log.error_message = f"Command failed with exit code {exit_code}"
 
@@ -379,20 +598,39 @@ class TaskScheduler:
             logger.error(f"Task {task.id} execution error: {e}")
             logger.exception('exception detail:')
 
-        await log.save()
+        # Taken by the subprocess, also when it timed out or failed
+        for field in ("spawned_at", "first_output_at", "exited_at"):
+            setattr(log, field, timings.get(field))
+        lag = start_lag(log.scheduled_at, log.spawned_at)
+        if lag is not None:
+            TASK_START_LAG.observe(lag)
+        if log.status == ExecutionStatus.FAILED:
+            TASK_FAILURES.inc(task_id=task.id)
+        if log.duration is not None:
+            TASK_DURATION.observe(log.duration)
+
+        await log_writer.save(log)
+        event_bus.publish(
+            "runs", "finished", task.id,
+            log_id=log.id, status=log.status, exit_code=log.exit_code,
+            finished_at=log.finished_at, duration=log.duration
+        )
 
     async def execute_now(self, task_id: int) -> Optional[int]:
         """
         Execute a task immediately
         Returns log ID if execution started
         """
-        task = await Task.get_or_none(id=task_id)
+        task = await self.get_task(task_id)
         if not task:
             return None
 
         # Create execution task
-        execution_task = asyncio.create_task(self._execute_task(task))
+        now = datetime.now(timezone.utc)
+        timings = {"fired_at": now, "admitted_at": now}
+        execution_task = asyncio.create_task(self._run_queued(task, time.perf_counter(), timings))
         self.running_jobs[task_id] = execution_task
+        event_bus.publish("runs", "queued", task_id, manual=True)
         return task_id
 
     async def get_scheduled_tasks(self) -> List[Dict[str, Any]]:
@@ -0,0 +1,82 @@
+"""
+Benchmark for importing task definitions.
+
+Creates tasks in a temporary SQLite database through the API, once with one
+POST /api/tasks/ per task and once with POST /api/tasks/bulk/create, then
+upserts the same definitions again with changed commands through
+/api/tasks/bulk/upsert. The scheduler is not started, jobs are only added to
+its job store, as they are at startup before it runs.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_bulk_tasks [--tasks 1000 10000] [--single-limit 1000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+from tortoise import Tortoise
+
+from app.config import settings
+from app.scheduler.scheduler import scheduler
+from main import app
+
+
+def definitions(count: int, command: str = "echo") -> list:
+    return [
+        {"name": f"bench {i}", "command": command, "args": [str(i)], "schedule_type": 2,
+         "interval_seconds": 60 + i % 600, "enabled": i % 2 == 0}
+        for i in range(count)
+    ]
+
+
+async def main(counts, single_limit: int):
+    # The scheduler and APScheduler log every added and removed job
+    logging.disable(logging.INFO)
+    print(f"{'tasks':>7}  {'case':<14}{'ms':>10}{'tasks/s':>12}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.sqlite3")
+            await Tortoise.init(db_url=f"sqlite://{path}", modules=settings.db_modules)
+            await Tortoise.generate_schemas()
+            await scheduler.load_tasks()
+            transport = ASGITransport(app=app, client=("127.0.0.1", 5000))
+            async with AsyncClient(transport=transport, base_url="http://test/api") as client:
+                cases = []
+                if count <= single_limit:
+                    async def single():
+                        for definition in definitions(count):
+                            response = await client.post("/tasks/", json={**definition, "name": "single " + definition["name"]})
+                            assert response.status_code == 201
+                    cases.append(("single POST", single))
+
+                async def bulk_create():
+                    response = await client.post("/tasks/bulk/create", json=definitions(count))
+                    assert response.json()["succeeded"] == count
+
+                async def bulk_upsert():
+                    response = await client.post("/tasks/bulk/upsert", json=definitions(count, "true"))
+                    assert response.json()["succeeded"] == count
+                cases += [("bulk create", bulk_create), ("bulk upsert", bulk_upsert)]
+
+                for name, case in cases:
+                    start = time.perf_counter()
+                    await case()
+                    elapsed = time.perf_counter() - start
+                    print(f"{count:>7}  {name:<14}{elapsed * 1000:>10.0f}{count / elapsed:>12.0f}")
+
+            for task_id in list(scheduler.job_id_map):
+                await scheduler.remove_task(task_id)
+            await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--single-limit", type=int, default=1000,
+                        help="skip the one-request-per-task case above this many tasks")
+    args = parser.parse_args()
+    asyncio.run(main(args.tasks, args.single_limit))
@@ -0,0 +1,107 @@
+"""
+Benchmark for the SQLite performance profiles.
+
+For each profile, runs scheduler-like writers (create a running log, then finish
+it) against API-like readers (list page plus one detail) on a temporary database
+for a fixed time. Readers use their own connection with the same PRAGMAs, the
+way partition readers and external tools do, so lock contention between readers
+and writers shows up as errors.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_db_profiles [--seconds 5] [--writers 4] [--readers 4] [--dir data]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import aiosqlite
+from tortoise import Tortoise
+
+from app.db.database import db_config, db_pragmas, DB_PROFILES
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+# What a plain SQLite connection does without any configuration, for comparison
+ROLLBACK_JOURNAL = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+async def writer(task: Task, deadline: float, counters: dict):
+    while time.perf_counter() < deadline:
+        try:
+            log = await TaskLog.create(
+                task=task,
+                status=ExecutionStatus.RUNNING,
+                command_executed="echo bench",
+                started_at=datetime.now(timezone.utc)
+            )
+            log.status = ExecutionStatus.COMPLETED
+            log.stdout = f"run {log.id} ok\n"
+            log.finished_at = datetime.now(timezone.utc)
+            await log.save()
+            counters["writes"] += 1
+        except Exception as e:
+            counters["errors"] += 1
+            counters["last_error"] = str(e)
+
+
+async def reader(path: str, pragmas: dict, deadline: float, counters: dict):
+    async with aiosqlite.connect(path) as conn:
+        for pragma, value in pragmas.items():
+            await conn.execute_fetchall(f"PRAGMA {pragma}={value}")
+        while time.perf_counter() < deadline:
+            try:
+                rows = await conn.execute_fetchall(
+                    "SELECT id, status, started_at, output_preview FROM task_logs ORDER BY started_at DESC LIMIT 20"
+                )
+                if rows:
+                    await conn.execute_fetchall("SELECT * FROM task_logs WHERE id = ?", [rows[0][0]])
+                counters["reads"] += 1
+            except sqlite3.OperationalError as e:
+                counters["errors"] += 1
+                counters["last_error"] = str(e)
+            await asyncio.sleep(0)
+
+
+async def run_profile(profile: str, overrides: dict, seconds: float, writers: int, readers: int,
+                      directory: str = None) -> dict:
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        path = os.path.join(tmp, "bench.sqlite3")
+        await Tortoise.init(config=db_config(f"sqlite://{path}", profile, overrides))
+        await Tortoise.generate_schemas()
+        task = await Task.create(name="bench", command="echo", schedule_type=ScheduleType.INTERVAL, interval_seconds=5)
+
+        # Readers get the same PRAGMAs, minus those Tortoise adds on its own
+        pragmas = db_pragmas(profile, overrides)
+        counters = {"writes": 0, "reads": 0, "errors": 0, "last_error": None}
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(
+            *(writer(task, deadline, counters) for _ in range(writers)),
+            *(reader(path, pragmas, deadline, counters) for _ in range(readers)),
+        )
+        await Tortoise.close_connections()
+    return counters
+
+
+async def main(seconds: float, writers: int, readers: int, directory: str = None):
+    profiles = [("rollback", "default", ROLLBACK_JOURNAL)] + [(name, name, {}) for name in DB_PROFILES]
+    print(f"{seconds:.0f}s per profile, {writers} writers, {readers} readers")
+    print(f"{'profile':<10}{'writes/s':>10}{'reads/s':>10}{'errors':>8}")
+    for label, profile, overrides in profiles:
+        counters = await run_profile(profile, overrides, seconds, writers, readers, directory)
+        print(f"{label:<10}{counters['writes'] / seconds:>10.0f}{counters['reads'] / seconds:>10.0f}{counters['errors']:>8}")
+        if counters["last_error"]:
+            print(f"{'':<10}last error: {counters['last_error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--dir", help="where to create the database, /tmp is often tmpfs where fsync is free")
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds, args.writers, args.readers, args.dir))
@@ -0,0 +1,107 @@
+"""
+Benchmark for the ``.values()`` read paths of the task and log endpoints.
+
+Fills a temporary SQLite database with tasks and logs, then compares the previous
+ORM-instance paths with the current ones:
+
+    tasks list   Task instances, Task_Pydantic.from_tortoise_orm, model_dump and two
+                 log queries per task, against get_tasks_with_stats (one row query
+                 and one grouped statistics query)
+    log detail   TaskLog_Pydantic.from_tortoise_orm per read against log_router.get,
+                 which validates the instance directly. Single rows stay instances:
+                 a one-row .values() query costs more to build than the instance.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_list_endpoints [--rows 1000 10000] [--logs-per-task 3]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from tortoise import Tortoise
+
+from app.api.tasks import get_tasks_with_stats
+from app.config import settings
+from app.db.log_router import log_router
+from app.models.log import TaskLog, TaskLog_Pydantic, ExecutionStatus
+from app.models.task import Task, Task_Pydantic, TaskWithStats, ScheduleType
+
+
+async def previous_tasks_with_stats(query):
+    tasks_with_stats = []
+    for task in await query:
+        log_count = await task.logs.all().count()
+        last_execution_success = None
+        latest_log = await task.logs.all().order_by("-started_at").first()
+        if latest_log:
+            last_execution_success = latest_log.status == ExecutionStatus.COMPLETED
+        task_data = await Task_Pydantic.from_tortoise_orm(task)
+        tasks_with_stats.append(TaskWithStats(
+            **task_data.model_dump(),
+            log_count=log_count,
+            last_execution_success=last_execution_success
+        ))
+    return tasks_with_stats
+
+
+async def previous_get_log(log_id: int):
+    log = await TaskLog.get_or_none(id=log_id)
+    await log.load_outputs()
+    return await TaskLog_Pydantic.from_tortoise_orm(log)
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def read_logs(get, ids) -> None:
+    for log_id in ids:
+        assert (await get(log_id)).id == log_id
+
+
+async def fill(tasks: int, logs_per_task: int):
+    await Task.bulk_create([
+        Task(name=f"bench {i}", command="echo", args=[str(i)], schedule_type=ScheduleType.INTERVAL, interval_seconds=60)
+        for i in range(tasks)
+    ], batch_size=1000)
+    task_ids = await Task.all().values_list("id", flat=True)
+    await TaskLog.bulk_create([
+        TaskLog(task_id=task_id, status=ExecutionStatus.COMPLETED, command_executed="echo", stdout="ok\n" * 20,
+                stdout_size=60, output_preview="ok")
+        for task_id in task_ids
+        for _ in range(logs_per_task)
+    ], batch_size=1000)
+
+
+async def main(rows_list, logs_per_task: int):
+    print(f"{'rows':>7}  {'case':<12}{'previous ms':>14}{'current ms':>12}{'speedup':>10}")
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.sqlite3")
+            await Tortoise.init(db_url=f"sqlite://{path}", modules=settings.db_modules)
+            await Tortoise.generate_schemas()
+            await fill(rows, logs_per_task)
+
+            query = Task.all().limit(rows).order_by("-created_at")
+            previous = await timed(previous_tasks_with_stats(query))
+            current = await timed(get_tasks_with_stats(query))
+            print(f"{rows:>7}  {'tasks list':<12}{previous:>14.1f}{current:>12.1f}{previous / current:>9.1f}x")
+
+            ids = await TaskLog.all().limit(rows).values_list("id", flat=True)
+            previous = await timed(read_logs(previous_get_log, ids))
+            current = await timed(read_logs(log_router.get, ids))
+            print(f"{rows:>7}  {'log detail':<12}{previous:>14.1f}{current:>12.1f}{previous / current:>9.1f}x")
+
+            await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--logs-per-task", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.logs_per_task))
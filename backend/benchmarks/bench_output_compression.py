@@ -0,0 +1,91 @@
+"""
+Benchmark for compressed task output storage.
+
+Fills a temporary SQLite database with logs carrying repetitive output stored as
+plain TEXT, measures the database size and detail read latency, then runs the
+background compression migration and measures again.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_output_compression [--logs 2000] [--lines 400]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from tortoise import Tortoise
+
+from app.config import settings
+from app.db.codec import compress_existing_outputs
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+def make_output(lines: int) -> str:
+    return "".join(
+        f"2024-01-01 00:00:{i % 60:02d} INFO worker-{i % 4} processed batch {i} ok\n"
+        for i in range(lines)
+    )
+
+
+async def read_latency(ids, samples: int) -> float:
+    start = time.perf_counter()
+    for log_id in random.sample(ids, min(samples, len(ids))):
+        log = await TaskLog.get(id=log_id)
+        assert log.stdout
+    return (time.perf_counter() - start) / min(samples, len(ids)) * 1000
+
+
+async def db_size(path: str) -> int:
+    conn = Tortoise.get_connection("default")
+    await conn.execute_script("VACUUM")
+    await conn.execute_script("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(path)
+
+
+async def main(logs: int, lines: int, samples: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sqlite3")
+        await Tortoise.init(db_url=f"sqlite://{path}", modules=settings.db_modules)
+        await Tortoise.generate_schemas()
+
+        task = await Task.create(name="bench", command="echo", schedule_type=ScheduleType.INTERVAL, interval_seconds=5)
+        output = make_output(lines)
+
+        compression = settings.output_compression
+        settings.output_compression = "none"
+        await TaskLog.bulk_create([
+            TaskLog(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo", stdout=output, stderr="")
+            for _ in range(logs)
+        ], batch_size=500)
+        settings.output_compression = compression
+
+        ids = await TaskLog.all().values_list("id", flat=True)
+        before_size = await db_size(path)
+        before_latency = await read_latency(ids, samples)
+
+        start = time.perf_counter()
+        rewritten = await compress_existing_outputs(pause=0)
+        migrate_time = time.perf_counter() - start
+
+        after_size = await db_size(path)
+        after_latency = await read_latency(ids, samples)
+        await Tortoise.close_connections()
+
+    print(f"logs={logs} output={len(output.encode()) / 1024:.1f}KiB codec={compression}")
+    print(f"migration: {rewritten} rows in {migrate_time:.2f}s")
+    print(f"{'':<8}{'db size':>14}{'read ms':>12}")
+    print(f"{'before':<8}{before_size / 1024 / 1024:>11.2f}MiB{before_latency:>12.3f}")
+    print(f"{'after':<8}{after_size / 1024 / 1024:>11.2f}MiB{after_latency:>12.3f}")
+    print(f"ratio {before_size / after_size:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=400)
+    parser.add_argument("--samples", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.logs, args.lines, args.samples))
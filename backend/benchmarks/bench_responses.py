@@ -0,0 +1,124 @@
+"""
+Benchmark for JSON rendering and response compression.
+
+Builds log list pages and a log detail response the way the API does (response
+model validation and serialization, then rendering), renders them with the
+standard JSONResponse and with orjson, and compresses the result with gzip and,
+when installed, brotli at the configured levels. Cases:
+
+    typical  100 summary rows, short previews
+    worst    1000 summary rows, long previews and error messages
+    detail   one log whose stdout/stderr are 1 MiB of log lines
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_responses [--repeat 20]
+"""
+import argparse
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.config import settings
+from app.core.compression import brotli
+from app.core.responses import orjson, FastJSONResponse
+from app.core.schemas import PaginatedResponse
+from app.models.log import TaskLog_Pydantic, TaskLogSummary, ExecutionStatus
+
+
+def make_output(size: int) -> str:
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        line = f"2024-01-01 00:00:{i % 60:02d} INFO worker-{i % 4} processed batch {i} ok\n"
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return "".join(lines)
+
+
+def make_page(rows: int, preview: int, error: int) -> dict:
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    data = []
+    for i in range(rows):
+        data.append({
+            "id": 100000 - i,
+            "task_id": i % 20 + 1,
+            "status": ExecutionStatus.FAILED if i % 7 == 0 else ExecutionStatus.COMPLETED,
+            "started_at": started + timedelta(minutes=i),
+            "finished_at": started + timedelta(minutes=i, seconds=3),
+            "duration": 3.25,
+            "exit_code": 1 if i % 7 == 0 else 0,
+            "error_message": ("Command failed with exit code 1 " * error)[:error] if i % 7 == 0 else None,
+            "command_executed": f"python /opt/jobs/job_{i % 20}.py --batch {i}",
+            "stdout_size": 20000 + i,
+            "stderr_size": 0,
+            "output_preview": make_output(preview)[:preview],
+            "created_at": started + timedelta(minutes=i),
+        })
+    return {"total": 100000, "skip": 0, "limit": rows, "data": data}
+
+
+def make_detail(size: int) -> dict:
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    output = make_output(size)
+    return {
+        "id": 1, "status": ExecutionStatus.COMPLETED, "started_at": started, "finished_at": started,
+        "duration": 3.25, "command_executed": "python /opt/jobs/job.py", "stdout": output, "stderr": output,
+        "exit_code": 0, "stdout_size": len(output), "stderr_size": len(output), "output_preview": output[:200],
+        "error_message": None, "created_at": started,
+    }
+
+
+def timed(func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def bench(name: str, adapter: TypeAdapter, content: dict, repeat: int):
+    # What FastAPI does with a response_model before handing the content to the response class
+    model = adapter.validate_python(content)
+    jsonable, serialize_ms = timed(lambda: adapter.dump_python(model, mode="json", exclude_unset=True), repeat)
+
+    rows = [("validate+dump", serialize_ms, None)]
+    body, stdlib_ms = timed(lambda: JSONResponse(jsonable).body, repeat)
+    rows.append(("json", stdlib_ms, len(body)))
+    if orjson is not None:
+        body, orjson_ms = timed(lambda: FastJSONResponse(jsonable).body, repeat)
+        rows.append(("orjson", orjson_ms, len(body)))
+
+    level = settings.response_gzip_level
+    compressed, gzip_ms = timed(lambda: zlib.compress(body, level), repeat)
+    rows.append((f"gzip-{level}", gzip_ms, len(compressed)))
+    if brotli is not None:
+        quality = settings.response_brotli_quality
+        compressed, brotli_ms = timed(lambda: brotli.compress(body, quality=quality), repeat)
+        rows.append((f"br-{quality}", brotli_ms, len(compressed)))
+
+    print(f"{name}")
+    for label, ms, size in rows:
+        size_text = f"{size / 1024:>11.1f}KiB" if size is not None else f"{'':>14}"
+        print(f"  {label:<14}{ms:>10.2f}ms{size_text}")
+
+
+def main(repeat: int):
+    page = TypeAdapter(PaginatedResponse[TaskLogSummary])
+    bench("typical page (100 rows)", page, make_page(100, 120, 40), repeat)
+    bench("worst page (1000 rows)", page, make_page(1000, 500, 2000), repeat)
+    bench("detail (2 x 1 MiB output)", TypeAdapter(TaskLog_Pydantic), make_detail(1024 * 1024), repeat)
+    if orjson is None:
+        print("orjson is not installed, only the standard encoder was measured")
+    if brotli is None:
+        print("brotli is not installed, only gzip was measured")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.repeat)
@@ -1,13 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import logging
-import ipaddress
 from app.config import settings
 from fastapi import Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse
+from app.core.compression import CompressionMiddleware
+from app.core.ip_filter import IPFilterMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.core.timing import ServerTimingMiddleware, instrument_queries
+from app.core.static import static_site
 from app.core.events import startup_event, shutdown_event
-from app.api import tasks, logs
+from app.api import tasks, logs, stats, events, metrics, diagnostics
 
 # Configure logging
 logging.basicConfig(
@@ -34,32 +37,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# IP filtering middleware
-@app.middleware("http")
-async def ip_filter_middleware(request: Request, call_next):
-    allowed_ips = settings.get_allowed_ips()
-    if allowed_ips: # allowed_ips 是 ['127.0.0.1/32', '192.168.0.0/16'] 这样的格式
-        client_ip = request.client.host
-        # 检查IP是否匹配任一CIDR网络
-        allowed = False
-        for cidr in allowed_ips:
-            try:
-                network = ipaddress.ip_network(cidr, strict=False)
-                ip = ipaddress.ip_address(client_ip)
-                if ip in network:
-                    allowed = True
-                    break
-            except ValueError as e:
-                logger.warning(f"Invalid CIDR format '{cidr}': {e}")
-                continue
+# Compress large responses, gzip or brotli depending on the client
+app.add_middleware(CompressionMiddleware)
 
-        if not allowed:
-            return JSONResponse(
-                status_code=403,
-                content={"detail": f"IP {client_ip} not allowed"}
-            )
-    response = await call_next(request)
-    return response
+# Reject clients outside settings.allowed_ips
+app.add_middleware(IPFilterMiddleware)
+
+# Count and time the queries, ORM and serialization work of every request
+instrument_queries()
+app.add_middleware(ServerTimingMiddleware)
+
+# Time every request, added last so it is outermost and sees the whole response
+app.add_middleware(MetricsMiddleware)
 
 # Register event handlers
 app.add_event_handler("startup", startup_event)
@@ -68,14 +57,10 @@ app.add_event_handler("shutdown", shutdown_event)
 # Register API routers
 app.include_router(tasks.router, prefix='/api')
 app.include_router(logs.router, prefix='/api')
-
-# Serve static files
-# 挂载静态文件
-app.mount("/assets", StaticFiles(directory="static/assets"), name="assets")
-# 处理所有其他路由，返回 index.html
-@app.get("/{full_path:path}")
-async def catch_all(full_path: str):
-    return FileResponse("static/index.html")
+app.include_router(stats.router, prefix='/api')
+app.include_router(events.router, prefix='/api')
+app.include_router(diagnostics.router, prefix='/api')
+app.include_router(metrics.router)
 
 @app.get("/health")
 async def health_check():
@@ -84,6 +69,18 @@ async def health_check():
     """
     return {"status": "healthy"}
 
+# Serve the built frontend, registered last so API and health routes take priority
+@app.api_route("/assets/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def frontend_asset(path: str, request: Request):
+    return static_site.asset_response(path, request)
+
+# 处理所有其他路由，返回 index.html
+@app.get("/{full_path:path}", include_in_schema=False)
+async def catch_all(full_path: str, request: Request):
+    if full_path == "api" or full_path.startswith("api/"):
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    return static_site.index_response(request)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -21,6 +21,17 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def strict_query_budgets():
+    """
+    Fail requests to routes that run more queries than their query budget.
+    """
+    previous = settings.query_budget_strict
+    settings.query_budget_strict = True
+    yield
+    settings.query_budget_strict = previous
+
+
 @pytest_asyncio.fixture(scope="session", autouse=True)
 async def initialize_db():
     """
@@ -49,7 +60,7 @@ async def async_client():
     Create an async test client for FastAPI.
     """
     from httpx import ASGITransport
-    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True) as client:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test/api", follow_redirects=True) as client:
         yield client
 
 
@@ -0,0 +1,225 @@
+"""
+Unit tests for the cold log archive.
+"""
+import json
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from tortoise import Tortoise
+
+from app.config import settings
+from app.db.archive import archive
+from app.db.log_router import log_router, LogFilter
+from app.db.partitions import partitions
+from app.db.retention import retention
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+# Logs from January and February are past a 30 day archive threshold, March is not
+NOW = datetime(2024, 3, 15, tzinfo=timezone.utc)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "log_archive_enabled", True)
+    monkeypatch.setattr(settings, "log_archive_dir", str(tmp_path / "archive"))
+    monkeypatch.setattr(settings, "log_archive_after_days", 30)
+    monkeypatch.setattr(settings, "log_partition_dir", str(tmp_path / "partitions"))
+    yield tmp_path / "archive"
+    await partitions.close()
+    await Tortoise.get_connection("default").execute_query("DELETE FROM output_blobs")
+
+
+@pytest.mark.asyncio
+class TestArchive:
+    """Test cases for archiving logs and reading them back through the log router."""
+
+    async def create_logs(self):
+        tasks = []
+        for name in ("First", "Second"):
+            tasks.append(await Task.create(
+                name=f"{name} Archived Task",
+                command="echo",
+                schedule_type=ScheduleType.INTERVAL,
+                interval_seconds=60
+            ))
+        logs = {}
+        for month in (1, 2, 3):
+            for task in tasks:
+                logs[month, task.name] = await TaskLog.create(
+                    task=task,
+                    status=ExecutionStatus.COMPLETED if month != 2 else ExecutionStatus.FAILED,
+                    command_executed="echo",
+                    started_at=datetime(2024, month, 10, tzinfo=timezone.utc),
+                    stdout=f"{task.name} output of month {month}"
+                )
+        return tasks, logs
+
+    async def test_archive_moves_old_logs(self, archive_dir):
+        tasks, logs = await self.create_logs()
+        running = await TaskLog.create(
+            task=tasks[0],
+            status=ExecutionStatus.RUNNING,
+            command_executed="echo",
+            started_at=datetime(2024, 1, 20, tzinfo=timezone.utc)
+        )
+
+        conn = Tortoise.get_connection("default")
+        _, before = await conn.execute_query("SELECT COUNT(*) FROM output_blobs")
+
+        assert await archive.archive(now=NOW, pause=0) == 4
+        live = await TaskLog.all().order_by("id").values_list("id", flat=True)
+        assert live == [logs[3, tasks[0].name].id, logs[3, tasks[1].name].id, running.id]
+        _, after = await conn.execute_query("SELECT COUNT(*) FROM output_blobs")
+        assert before[0][0] - after[0][0] == 4
+
+        manifest = json.loads((archive_dir / "manifest.json").read_text())
+        [segment] = manifest["segments"]
+        assert segment["rows"] == 4
+        assert segment["task_counts"] == {str(tasks[0].id): 2, str(tasks[1].id): 2}
+        assert sorted(path.name for path in archive_dir.iterdir()) == [
+            "logs_000001.jsonl.gz", "manifest.json", "outputs_000001.jsonl.gz"
+        ]
+
+    async def test_segments_split_by_size(self, monkeypatch):
+        monkeypatch.setattr(settings, "log_archive_segment_rows", 2)
+        await self.create_logs()
+        await archive.archive(now=NOW, batch_size=2, pause=0)
+        assert [segment.rows for segment in archive.segments()] == [2, 2]
+
+    async def test_page_spans_archive(self, async_client: AsyncClient):
+        tasks, logs = await self.create_logs()
+        await archive.archive(now=NOW, pause=0)
+
+        response = await async_client.get("/logs")
+        data = response.json()
+        assert data["total"] == 6
+        assert [log["started_at"][:7] for log in data["data"]] == ["2024-03"] * 2 + ["2024-02"] * 2 + ["2024-01"] * 2
+
+        response = await async_client.get("/logs", params={"task_id": tasks[0].id, "skip": 1})
+        assert [log["id"] for log in response.json()["data"]] == [logs[2, tasks[0].name].id, logs[1, tasks[0].name].id]
+
+        response = await async_client.get("/logs", params={"search": f"{tasks[1].name} output of month 1"})
+        assert [log["id"] for log in response.json()["data"]] == [logs[1, tasks[1].name].id]
+
+        response = await async_client.get("/logs", params={"status": ExecutionStatus.FAILED})
+        assert response.json()["total"] == 2
+
+    async def test_manifest_prunes_segments(self, monkeypatch):
+        monkeypatch.setattr(settings, "log_archive_segment_rows", 1)
+        tasks, _ = await self.create_logs()
+        await archive.archive(now=NOW, pause=0)
+        assert len(archive.segments()) == 4
+
+        log_filter = LogFilter(task_id=tasks[1].id, started_before=datetime(2024, 2, 1))
+        [segment] = archive.segments(log_filter)
+        assert segment.known_count(log_filter) == 1
+        assert segment.known_count(LogFilter(status=ExecutionStatus.COMPLETED)) is None
+        page = await log_router.page(log_filter, 0, 10, ["id", "task_id"])
+        assert page.total == 1
+        assert page.data[0].task_id == tasks[1].id
+
+    async def test_get_and_delete_archived_log(self, async_client: AsyncClient):
+        tasks, logs = await self.create_logs()
+        await archive.archive(now=NOW, pause=0)
+        log = logs[1, tasks[0].name]
+
+        response = await async_client.get(f"/logs/{log.id}")
+        assert response.status_code == 200
+        assert response.json()["stdout"] == f"{tasks[0].name} output of month 1"
+        assert response.json()["started_at"].startswith("2024-01-10T00:00:00")
+
+        response = await async_client.delete(f"/logs/{log.id}")
+        assert response.status_code == 204
+        response = await async_client.get(f"/logs/{log.id}")
+        assert response.status_code == 404
+        assert (await async_client.get("/logs")).json()["total"] == 5
+
+    async def test_delete_matching(self, archive_dir):
+        tasks, _ = await self.create_logs()
+        await archive.archive(now=NOW, pause=0)
+
+        assert await log_router.delete_matching(LogFilter(task_id=tasks[0].id)) == 3
+        assert archive.segments()[0].deleted
+        assert await log_router.delete_matching(LogFilter(started_before=datetime(2024, 3, 1))) == 2
+        assert archive.segments() == []
+        assert not (archive_dir / "logs_000001.jsonl.gz").exists()
+
+    async def test_delete_matching_several_tasks(self):
+        tasks, _ = await self.create_logs()
+        await archive.archive(now=NOW, pause=0)
+        await partitions.rotate(now=NOW, pause=0)
+
+        log_filter = LogFilter(task_ids={task.id for task in tasks})
+        assert archive.segments()[0].known_count(log_filter) == 4
+        assert await log_router.delete_matching(log_filter) == 6
+        assert archive.segments() == []
+        assert (await log_router.page(LogFilter(), 0, 10, ["id"])).total == 0
+
+    async def test_export_spans_archive(self, async_client: AsyncClient):
+        _, logs = await self.create_logs()
+        await archive.archive(now=NOW, pause=0)
+
+        response = await async_client.get("/logs/export", params={"fields": "started_at,stdout"})
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == sorted(log.id for log in logs.values())
+        assert rows[0]["stdout"] == logs[min(logs, key=lambda key: logs[key].id)].stdout
+        assert rows[0]["started_at"] == "2024-01-10T00:00:00+00:00"
+
+    async def test_archive_whole_partitions(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "log_partitioning", True)
+        tasks, logs = await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+        assert len(partitions.partitions()) == 2
+
+        # February is not entirely past the threshold yet and stays partitioned
+        assert await archive.archive(now=NOW, pause=0) == 2
+        assert [partition.name for partition in partitions.partitions()] == ["2024-02"]
+        response = await log_router.get(logs[1, tasks[1].name].id)
+        assert response.stdout == f"{tasks[1].name} output of month 1"
+        page = await log_router.page(LogFilter(), 0, 10, ["id"])
+        assert page.total == 6
+
+    async def test_task_stats_span_sources(self, async_client: AsyncClient, monkeypatch):
+        monkeypatch.setattr(settings, "log_partitioning", True)
+        tasks, logs = await self.create_logs()
+        await logs[3, tasks[1].name].delete()
+        archived_only = await Task.create(
+            name="Archived Only Task",
+            command="echo",
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=60
+        )
+        await TaskLog.create(
+            task=archived_only,
+            status=ExecutionStatus.TIMEOUT,
+            command_executed="echo",
+            started_at=datetime(2024, 1, 12, tzinfo=timezone.utc)
+        )
+        await partitions.rotate(now=NOW, pause=0)
+        await archive.archive(now=NOW, pause=0)
+
+        stats = {
+            task["id"]: (task["log_count"], task["last_execution_success"])
+            for task in (await async_client.get("/tasks")).json()["data"]
+        }
+        # March is live, February partitioned and January archived
+        assert stats[tasks[0].id] == (3, True)
+        assert stats[tasks[1].id] == (2, False)
+        assert stats[archived_only.id] == (1, False)
+        page = await log_router.page(LogFilter(task_id=tasks[1].id), 0, 10, ["id"])
+        assert page.total == 2
+
+    async def test_retention_archives_and_drops_segments(self, monkeypatch):
+        monkeypatch.setattr(settings, "retention_max_age_days", 365)
+        monkeypatch.setattr(settings, "retention_batch_pause", 0)
+        await self.create_logs()
+
+        progress = await retention.run()
+        assert progress.error is None
+        assert progress.rows_archived == 6
+        assert progress.segments_dropped == 1
+        assert progress.rows_deleted == 6
+        assert archive.segments() == []
@@ -0,0 +1,109 @@
+"""
+Unit tests for the bulk task endpoints.
+"""
+import pytest
+from httpx import AsyncClient
+
+from app.models.task import Task, ScheduleType
+from app.scheduler.scheduler import scheduler
+
+
+def task_json(name: str, **kwargs) -> dict:
+    return {
+        "name": name,
+        "command": "echo",
+        "args": [],
+        "schedule_type": ScheduleType.INTERVAL,
+        "interval_seconds": 60,
+        **kwargs
+    }
+
+
+@pytest.mark.asyncio
+class TestBulkTasks:
+    """Test cases for bulk create, upsert, enable, disable and delete."""
+
+    async def test_bulk_create(self, async_client: AsyncClient):
+        await scheduler.load_tasks()
+        response = await async_client.post("/tasks/bulk/create", json=[
+            task_json("Bulk 1"),
+            task_json("Bulk 2", interval_seconds=None),
+            task_json("Bulk 3", enabled=False),
+        ])
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["succeeded"], data["failed"]) == (2, 1)
+        first, invalid, third = data["results"]
+        assert first["status"] == third["status"] == "created"
+        assert invalid == {"index": 1, "id": None, "status": "failed",
+                           "error": "interval_seconds is required for interval schedule type"}
+
+        stored = await Task.get(id=first["id"])
+        assert stored.name == "Bulk 1" and stored.created_at is not None
+        assert (await Task.get(id=third["id"])).enabled is False
+        assert first["id"] in scheduler.job_id_map
+        assert third["id"] not in scheduler.job_id_map
+        assert scheduler.tasks[third["id"]].name == "Bulk 3"
+
+        # A single create keeps counting after the bulk ids
+        response = await async_client.post("/tasks/", json=task_json("Single"))
+        assert response.json()["id"] == third["id"] + 1
+
+    async def test_bulk_upsert(self, async_client: AsyncClient):
+        await scheduler.load_tasks()
+        existing = await Task.create(name="Upserted", command="echo", schedule_type=ScheduleType.INTERVAL,
+                                     interval_seconds=60, enabled=False)
+        for _ in range(2):
+            await Task.create(name="Twice", command="echo", schedule_type=ScheduleType.INTERVAL, interval_seconds=60)
+
+        response = await async_client.post("/tasks/bulk/upsert", json=[
+            task_json("Upserted", command="true", enabled=True),
+            task_json("New"),
+            task_json("Twice"),
+            task_json("New"),
+        ])
+        results = response.json()["results"]
+        assert [result["status"] for result in results] == ["updated", "created", "failed", "failed"]
+        assert results[0]["id"] == existing.id
+        assert results[2]["error"] == "Name matches 2 tasks"
+        assert results[3]["error"] == "Name repeated in the request"
+
+        stored = await Task.get(id=existing.id)
+        assert (stored.command, stored.enabled) == ("true", True)
+        assert stored.updated_at > existing.updated_at
+        assert existing.id in scheduler.job_id_map
+
+        response = await async_client.post("/tasks/bulk/upsert", json=[task_json("Upserted", command="true")])
+        assert response.json()["results"][0]["status"] == "unchanged"
+
+    async def test_bulk_enable_disable_delete(self, async_client: AsyncClient):
+        await scheduler.load_tasks()
+        response = await async_client.post("/tasks/bulk/create", json=[
+            task_json(f"Toggled {i}", enabled=False) for i in range(3)
+        ])
+        ids = [result["id"] for result in response.json()["results"]]
+
+        response = await async_client.post("/tasks/bulk/enable", json={"ids": [ids[0], ids[1], ids[1], 999999]})
+        assert [result["status"] for result in response.json()["results"]] == [
+            "enabled", "enabled", "failed", "failed"
+        ]
+        assert await Task.filter(id__in=ids, enabled=True).count() == 2
+        assert ids[0] in scheduler.job_id_map and ids[2] not in scheduler.job_id_map
+
+        response = await async_client.post("/tasks/bulk/disable", json={"ids": ids})
+        assert [result["status"] for result in response.json()["results"]] == ["disabled", "disabled", "unchanged"]
+        assert not any(task_id in scheduler.job_id_map for task_id in ids)
+        assert scheduler.tasks[ids[0]].enabled is False
+
+        response = await async_client.post("/tasks/bulk/delete", json={"ids": ids[:2] + [999999]})
+        data = response.json()
+        assert (data["succeeded"], data["failed"]) == (2, 1)
+        assert await Task.filter(id__in=ids).values_list("id", flat=True) == [ids[2]]
+        assert ids[0] not in scheduler.tasks
+
+    async def test_bulk_limits(self, async_client: AsyncClient):
+        response = await async_client.post("/tasks/bulk/delete", json={"ids": list(range(10001))})
+        assert response.status_code == 422
+
+        response = await async_client.post("/tasks/bulk/create", json=[])
+        assert response.json() == {"succeeded": 0, "failed": 0, "results": []}
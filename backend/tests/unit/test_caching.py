@@ -0,0 +1,99 @@
+"""
+Unit tests for ETag and conditional GET support.
+"""
+from datetime import datetime, timezone
+
+import pytest
+from httpx import AsyncClient
+
+from app.db.blobs import delete_logs
+from app.db.versions import change_version
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+@pytest.mark.asyncio
+class TestConditionalGet:
+    """Test cases for change versions, ETags and 304 responses."""
+
+    async def create_task(self):
+        return await Task.create(
+            name="Cached Task",
+            command="echo",
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=60
+        )
+
+    async def test_writes_bump_versions(self):
+        before = change_version("tasks", "task_logs")
+        task = await self.create_task()
+        after_task = change_version("tasks", "task_logs")
+        assert after_task.key != before.key
+        assert after_task.modified_at >= before.modified_at
+
+        logs_version = change_version("task_logs")
+        await TaskLog.create(task=task, status=ExecutionStatus.RUNNING, command_executed="echo")
+        assert change_version("task_logs") != logs_version
+        await delete_logs(TaskLog.filter(task_id=task.id))
+        assert change_version("tasks", "task_logs").key != after_task.key
+
+    async def test_task_list_not_modified(self, async_client: AsyncClient):
+        await self.create_task()
+        response = await async_client.get("/tasks")
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"] == "no-cache"
+        assert "last-modified" in response.headers
+
+        response = await async_client.get("/tasks", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        # Another page is another representation
+        response = await async_client.get("/tasks", params={"limit": 5}, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+
+        await self.create_task()
+        response = await async_client.get("/tasks", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    async def test_task_not_modified_since(self, async_client: AsyncClient):
+        task = await self.create_task()
+        response = await async_client.get(f"/tasks/{task.id}")
+        last_modified = response.headers["last-modified"]
+        response = await async_client.get(f"/tasks/{task.id}", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+
+    async def test_finished_log_is_immutable(self, async_client: AsyncClient):
+        task = await self.create_task()
+        log = await TaskLog.create(
+            task=task,
+            status=ExecutionStatus.COMPLETED,
+            command_executed="echo",
+            started_at=datetime.now(timezone.utc),
+            finished_at=datetime.now(timezone.utc),
+            stdout="done"
+        )
+        response = await async_client.get(f"/logs/{log.id}")
+        assert "immutable" in response.headers["cache-control"]
+        etag = response.headers["etag"]
+
+        # Unrelated writes do not invalidate a finished log
+        await TaskLog.create(task=task, status=ExecutionStatus.RUNNING, command_executed="echo")
+        response = await async_client.get(f"/logs/{log.id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert "immutable" in response.headers["cache-control"]
+
+    async def test_running_log_revalidates(self, async_client: AsyncClient):
+        task = await self.create_task()
+        log = await TaskLog.create(task=task, status=ExecutionStatus.RUNNING, command_executed="echo")
+        response = await async_client.get(f"/logs/{log.id}")
+        assert response.headers["cache-control"] == "no-cache"
+        etag = response.headers["etag"]
+        response = await async_client.get(f"/logs/{log.id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        log.status = ExecutionStatus.COMPLETED
+        await log.save()
+        response = await async_client.get(f"/logs/{log.id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["status"] == ExecutionStatus.COMPLETED
@@ -0,0 +1,104 @@
+"""
+Unit tests for response compression and JSON rendering.
+"""
+import gzip
+import json
+import zlib
+
+import pytest
+from httpx import AsyncClient
+
+from app.core import compression
+from app.core.compression import negotiate_encoding
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+async def create_logs(count: int):
+    task = await Task.create(
+        name="Compressed Task",
+        command="echo",
+        schedule_type=ScheduleType.INTERVAL,
+        interval_seconds=60
+    )
+    await TaskLog.bulk_create([
+        TaskLog(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo hello", stdout=f"line {i}")
+        for i in range(count)
+    ])
+    return task
+
+
+def test_negotiate_encoding(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", object())
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate_encoding("*") == "br"
+    assert negotiate_encoding("br;q=0, *;q=0.1") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding(None) is None
+
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate_encoding("br") is None
+    assert negotiate_encoding("br, gzip") == "gzip"
+
+
+@pytest.mark.asyncio
+class TestCompression:
+    """Test cases for the compression middleware on API responses."""
+
+    async def test_large_response_is_gzipped(self, async_client: AsyncClient):
+        await create_logs(50)
+        response = await async_client.get("/logs", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert response.headers["content-type"] == "application/json"
+        assert int(response.headers["content-length"]) < len(response.content)
+        assert response.json()["total"] == 50
+
+    async def test_small_or_refused_responses_are_not_compressed(self, async_client: AsyncClient):
+        task = await create_logs(50)
+        response = await async_client.get(f"/tasks/{task.id}", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+        response = await async_client.get("/logs", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.json()["total"] == 50
+
+        # Bodiless 304s stay as they are
+        etag = (await async_client.get("/tasks")).headers["etag"]
+        response = await async_client.get("/tasks", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert response.status_code == 304
+        assert "content-encoding" not in response.headers
+
+    async def test_stream_is_compressed_once(self, async_client: AsyncClient):
+        await create_logs(50)
+
+        # Already gzipped by the export itself
+        response = await async_client.get("/logs/export", params={"gzip": True}, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.text.splitlines()) == 50
+
+        # Streamed and compressed chunk by chunk by the middleware
+        response = await async_client.get("/logs/export", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 50
+        assert rows[0]["command_executed"] == "echo hello"
+
+    async def test_streamed_chunks_flush(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        wrapped = compression._CompressingSend(send, "gzip")
+        await wrapped({"type": "http.response.start", "status": 200,
+                       "headers": [(b"content-type", b"application/x-ndjson")]})
+        await wrapped({"type": "http.response.body", "body": b'{"id": 1}\n', "more_body": True})
+        # What was sent so far decompresses to the whole first chunk before the stream ends
+        assert zlib.decompressobj(31).decompress(sent[1]["body"]) == b'{"id": 1}\n'
+        await wrapped({"type": "http.response.body", "body": b'{"id": 2}\n', "more_body": False})
+        assert gzip.decompress(b"".join(message["body"] for message in sent[1:])) == b'{"id": 1}\n{"id": 2}\n'
@@ -0,0 +1,72 @@
+"""
+Unit tests for the SQLite performance profiles and read/write connection routing.
+"""
+import pytest
+from tortoise.backends.sqlite.client import SqliteClient
+from tortoise.transactions import in_transaction
+
+from app.config import settings
+from app.db.database import db_config, db_pragmas, ReadWriteRouter
+from app.models.task import Task
+
+
+class TestDatabaseProfiles:
+    """Test cases for building the database configuration."""
+
+    def test_profile_pragmas_with_overrides(self, monkeypatch):
+        monkeypatch.setattr(settings, "db_profile", "balanced")
+        monkeypatch.setattr(settings, "db_pragmas", {"mmap_size": 0})
+        pragmas = db_pragmas()
+        assert pragmas["synchronous"] == "NORMAL"
+        assert pragmas["mmap_size"] == 0
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            db_pragmas("turbo")
+
+    def test_config_applies_pragmas_to_sqlite(self):
+        config = db_config("sqlite:///tmp/akari.sqlite3", profile="durable", overrides={}, read_pool_size=0)
+        credentials = config["connections"]["default"]["credentials"]
+        assert credentials["file_path"] == "/tmp/akari.sqlite3"
+        assert credentials["synchronous"] == "FULL"
+        assert config["apps"]["models"]["models"] == settings.db_modules["models"]
+        assert config["use_tz"] is True
+        assert list(config["connections"]) == ["default"]
+
+    def test_read_pool(self):
+        config = db_config("sqlite:///tmp/akari.sqlite3", profile="balanced", overrides={}, read_pool_size=2)
+        assert list(config["connections"]) == ["default", "read_0", "read_1"]
+        assert config["connections"]["read_1"]["credentials"]["query_only"] == "ON"
+        assert "query_only" not in config["connections"]["default"]["credentials"]
+        assert config["routers"] == [ReadWriteRouter]
+
+    def test_no_read_pool_for_memory_database(self):
+        config = db_config("sqlite://:memory:", read_pool_size=2)
+        assert list(config["connections"]) == ["default"]
+        assert config["routers"] == []
+
+
+@pytest.mark.asyncio
+async def test_connection_uses_profile(tmp_path):
+    credentials = db_config(f"sqlite://{tmp_path / 'profile.sqlite3'}", profile="balanced", overrides={})
+    client = SqliteClient(connection_name="profile", **credentials["connections"]["default"]["credentials"])
+    await client.create_connection(with_db=True)
+    try:
+        _, rows = await client.execute_query("PRAGMA journal_mode")
+        assert rows[0][0] == "wal"
+        _, rows = await client.execute_query("PRAGMA synchronous")
+        assert rows[0][0] == 1  # NORMAL
+        _, rows = await client.execute_query("PRAGMA busy_timeout")
+        assert rows[0][0] == 5000
+        _, rows = await client.execute_query("PRAGMA temp_store")
+        assert rows[0][0] == 2  # MEMORY
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_router_keeps_transactions_on_writer():
+    router = ReadWriteRouter()
+    assert router.db_for_write(Task) == "default"
+    async with in_transaction("default"):
+        assert router.db_for_read(Task) == "default"
@@ -0,0 +1,162 @@
+"""
+Unit tests for the task and run event stream.
+"""
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.db.log_writer import log_writer
+from app.models.log import ExecutionStatus
+from app.models.task import Task, ScheduleType
+from app.scheduler.event_bus import EventBus, event_bus
+from app.scheduler.scheduler import scheduler
+from main import app
+
+
+async def take(events, count: int) -> list:
+    return [await asyncio.wait_for(events.__anext__(), 1) for _ in range(count)]
+
+
+async def subscribed(bus: EventBus, events, count: int) -> asyncio.Future:
+    # Start taking events and wait until the subscription is registered
+    subscribers = bus.subscribers
+    pending = asyncio.ensure_future(take(events, count))
+    while bus.subscribers == subscribers:
+        await asyncio.sleep(0)
+    return pending
+
+
+@pytest.mark.asyncio
+class TestEventBus:
+    """Test cases for publishing, filtering and resuming event subscriptions."""
+
+    async def test_filters_and_sequence(self):
+        bus = EventBus()
+        events = bus.subscribe({"runs"}, task_id=1)
+        pending = await subscribed(bus, events, 2)
+        bus.publish("runs", "fired", 1)
+        bus.publish("tasks", "updated", 1)
+        bus.publish("runs", "fired", 2)
+        bus.publish("runs", "queued", 1)
+        received = await pending
+        assert [(event.seq, event.type) for event in received] == [(1, "fired"), (4, "queued")]
+        await events.aclose()
+        assert bus.subscribers == 0
+
+    async def test_resume_after_reconnect(self, monkeypatch):
+        monkeypatch.setattr(settings, "event_buffer_size", 3)
+        bus = EventBus()
+        for task_id in range(1, 5):
+            bus.publish("runs", "fired", task_id)
+
+        # Events 3 and 4 are still buffered
+        events = bus.subscribe({"runs"}, last_event_id=bus.event_id(2))
+        assert [event.seq for event in await take(events, 2)] == [3, 4]
+        bus.publish("runs", "fired", 5)
+        assert [event.seq for event in await take(events, 1)] == [5]
+        await events.aclose()
+
+        # Event 2 was dropped, as was everything from another process
+        for last_event_id in (bus.event_id(1), "0-4", "garbage", bus.event_id(99)):
+            events = bus.subscribe({"runs"}, last_event_id=last_event_id)
+            [reset] = await take(events, 1)
+            assert (reset.type, reset.seq) == ("reset", 5)
+            await events.aclose()
+
+        # Up to date, nothing to replay
+        events = bus.subscribe({"runs"}, last_event_id=bus.event_id(5), heartbeat=0.01)
+        assert await take(events, 1) == [None]
+        await events.aclose()
+
+    async def test_slow_subscriber_is_dropped(self, monkeypatch):
+        monkeypatch.setattr(settings, "event_queue_size", 2)
+        bus = EventBus()
+        events = bus.subscribe({"runs"})
+        pending = await subscribed(bus, events, 1)
+        for task_id in range(4):
+            bus.publish("runs", "fired", task_id)
+        await pending
+        assert bus.subscribers == 0
+        # The queued events are still delivered, then the stream ends
+        assert [event.seq for event in await take(events, 1)] == [2]
+        with pytest.raises(StopAsyncIteration):
+            await events.__anext__()
+
+
+@pytest.mark.asyncio
+class TestSchedulerEvents:
+    """Test cases for the events published by the scheduler and the SSE endpoint."""
+
+    async def test_run_and_task_events(self, async_client: AsyncClient):
+        await scheduler.load_tasks()
+        events = event_bus.subscribe({"runs", "tasks"})
+        pending = await subscribed(event_bus, events, 1)
+
+        response = await async_client.post("/tasks/", json={
+            "name": "Evented Task",
+            "command": "echo",
+            "args": ["hello"],
+            "schedule_type": ScheduleType.INTERVAL,
+            "interval_seconds": 60,
+            "enabled": False
+        })
+        task_id = response.json()["id"]
+        [created] = await pending
+        assert (created.topic, created.type, created.task_id) == ("tasks", "created", task_id)
+        assert created.data["name"] == "Evented Task"
+
+        await scheduler.execute_now(task_id)
+        await scheduler.running_jobs.pop(task_id)
+        await log_writer.flush()
+        queued, started, finished = await take(events, 3)
+        assert [queued.type, started.type, finished.type] == ["queued", "started", "finished"]
+        assert started.data["log_id"] == finished.data["log_id"]
+        assert finished.data["status"] == ExecutionStatus.COMPLETED
+
+        await async_client.delete(f"/tasks/{task_id}")
+        [deleted] = await take(events, 1)
+        assert (deleted.type, deleted.task_id) == ("deleted", task_id)
+        await events.aclose()
+
+    async def test_stream_endpoint(self, async_client: AsyncClient):
+        response = await async_client.get("/events", params={"topics": "runs,unknown"})
+        assert response.status_code == 422
+
+        task = await Task.create(name="Streamed Task", command="echo", schedule_type=ScheduleType.INTERVAL,
+                                 interval_seconds=60)
+        before = event_bus.event_id(event_bus.seq)
+        event_bus.publish("runs", "fired", task.id)
+
+        chunks = []
+        received = asyncio.Event()
+
+        async def receive():
+            await received.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                chunks.append(dict(message["headers"]))
+            elif message.get("body"):
+                chunks.append(message["body"].decode())
+                if chunks[-1].startswith("id:"):
+                    received.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/api/events", "raw_path": b"/api/events", "root_path": "", "query_string": b"topics=runs",
+            "headers": [(b"host", b"test"), (b"last-event-id", before.encode()), (b"accept-encoding", b"gzip")],
+            "client": ("127.0.0.1", 5000), "server": ("test", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), 5)
+
+        headers, retry, event = chunks[:3]
+        assert headers[b"content-type"].startswith(b"text/event-stream")
+        assert b"content-encoding" not in headers
+        assert retry == "retry: 3000\n\n"
+        event_id, data = event.strip().split("\n")
+        assert event_id == f"id: {event_bus.event_id(event_bus.seq)}"
+        assert json.loads(data[len("data: "):])["task_id"] == task.id
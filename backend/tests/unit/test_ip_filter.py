@@ -0,0 +1,66 @@
+"""
+Unit tests for the client IP allowlist.
+"""
+from ipaddress import ip_address
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.core.ip_filter import IPAllowlist, IPFilterMiddleware
+
+
+def test_allowlist_ranges():
+    allowlist = IPAllowlist(["10.0.0.0/8", "192.168.1.0/24", "192.168.0.0/24", "10.1.0.0/16", "2001:db8::/32", "bad"])
+    assert allowlist.allows("10.200.3.4")
+    assert allowlist.allows("192.168.0.255")
+    assert allowlist.allows("192.168.1.0")
+    assert not allowlist.allows("192.168.2.1")
+    assert not allowlist.allows("9.255.255.255")
+    assert not allowlist.allows("11.0.0.0")
+    assert allowlist.allows("2001:db8::1")
+    assert not allowlist.allows("2001:db9::1")
+    # IPv4 clients of a dual-stack socket
+    assert allowlist.allows("::ffff:10.0.0.1")
+    assert not allowlist.allows("testclient")
+    assert not allowlist.allows(None)
+
+    # Nested, adjacent and overlapping networks merge into one range each
+    assert allowlist._starts[4] == [int(ip_address("10.0.0.0")), int(ip_address("192.168.0.0"))]
+    assert allowlist._ends[4] == [int(ip_address("10.255.255.255")), int(ip_address("192.168.1.255"))]
+    assert IPAllowlist([]).allows("8.8.8.8")
+    assert IPAllowlist(["bad"]).allows("8.8.8.8")
+
+
+@pytest.mark.asyncio
+class TestIPFilterMiddleware:
+    """Test cases for rejecting clients outside the allowlist."""
+
+    async def test_reloads_on_setting_change(self, async_client: AsyncClient, monkeypatch):
+        # httpx's ASGI transport connects from 127.0.0.1
+        monkeypatch.setattr(settings, "allowed_ips", "127.0.0.1/32")
+        assert (await async_client.get("/tasks")).status_code == 200
+
+        monkeypatch.setattr(settings, "allowed_ips", "10.0.0.0/8")
+        response = await async_client.get("/tasks")
+        assert response.status_code == 403
+        assert response.json() == {"detail": "IP 127.0.0.1 not allowed"}
+
+    async def test_websocket_and_lifespan(self, monkeypatch):
+        monkeypatch.setattr(settings, "allowed_ips", "10.0.0.0/8")
+        passed = []
+
+        async def app(scope, receive, send):
+            passed.append(scope["type"])
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = IPFilterMiddleware(app)
+        await middleware({"type": "lifespan"}, None, send)
+        await middleware({"type": "websocket", "client": ("10.1.2.3", 5000)}, None, send)
+        await middleware({"type": "websocket", "client": ("8.8.8.8", 5000)}, None, send)
+        assert passed == ["lifespan", "websocket"]
+        assert sent == [{"type": "websocket.close", "code": 1008}]
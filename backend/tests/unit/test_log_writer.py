@@ -0,0 +1,205 @@
+"""
+Unit tests for the write-behind task log writer.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+
+from app.config import settings
+from app.db.log_writer import ID_BLOCK_SIZE, LOG_WRITE_FAILURES, LOGS_DROPPED, log_writer
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+from app.scheduler.scheduler import scheduler
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def running_writer(monkeypatch):
+    # Long enough that only flush() and stop() write during a test
+    monkeypatch.setattr(settings, "log_writer_flush_ms", 60000)
+    log_writer.start()
+    yield log_writer
+    await log_writer.stop()
+
+
+@pytest.mark.asyncio
+class TestLogWriter:
+    """Test cases for queued, batched log writes."""
+
+    async def create_task(self):
+        return await Task.create(
+            name="Writer Task",
+            command="echo",
+            args=["hello"],
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=60
+        )
+
+    def running_log(self, task):
+        return TaskLog(
+            task=task,
+            status=ExecutionStatus.RUNNING,
+            command_executed="echo hello",
+            started_at=datetime.now(timezone.utc)
+        )
+
+    async def test_save_is_queued_until_flush(self):
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+
+        assert log.id is not None
+        assert await TaskLog.filter(id=log.id).exists() is False
+        assert log_writer.get(log.id).status == ExecutionStatus.RUNNING
+
+        await log_writer.flush()
+        stored = await TaskLog.get(id=log.id)
+        assert stored.status == ExecutionStatus.RUNNING
+        assert log_writer.get(log.id) is None
+
+    async def test_insert_and_update_are_coalesced(self):
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+        log.status = ExecutionStatus.COMPLETED
+        log.stdout = "hello\n"
+        log.exit_code = 0
+        await log_writer.save(log)
+
+        assert log_writer.get(log.id).stdout == "hello\n"
+        await log_writer.flush()
+        stored = await TaskLog.get(id=log.id)
+        await stored.load_outputs()
+        assert stored.status == ExecutionStatus.COMPLETED
+        assert stored.stdout == "hello\n"
+        assert stored.stdout_size == 6
+
+    async def test_update_after_flush(self):
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+        await log_writer.flush()
+
+        log.status = ExecutionStatus.FAILED
+        log.stderr = "boom"
+        await log_writer.save(log)
+        await log_writer.flush()
+        assert await TaskLog.all().count() == 1
+        stored = await TaskLog.get(id=log.id)
+        assert stored.status == ExecutionStatus.FAILED
+        assert stored.output_preview == "boom"
+
+    async def test_ids_follow_existing_rows(self):
+        task = await self.create_task()
+        existing = await TaskLog.create(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo")
+        logs = [self.running_log(task) for _ in range(3)]
+        for log in logs:
+            await log_writer.save(log)
+        assert [log.id for log in logs] == [existing.id + 1, existing.id + 2, existing.id + 3]
+
+        await log_writer.flush()
+        assert await TaskLog.all().count() == 4
+
+    async def test_ids_are_reserved(self):
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+
+        # Inserted around the writer, as another process would
+        other = await TaskLog.create(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo")
+        assert other.id == log.id + ID_BLOCK_SIZE
+        await log_writer.flush()
+        assert await TaskLog.all().count() == 2
+
+    async def test_failed_write_is_retried(self, monkeypatch):
+        monkeypatch.setattr(settings, "log_writer_retry_seconds", 0)
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+
+        save = log_writer._save
+        calls = []
+
+        async def failing_save(*args, **kwargs):
+            calls.append(args)
+            # The batch and the single write fail, the retry goes through
+            if len(calls) <= 2:
+                raise RuntimeError("disk I/O error")
+            await save(*args, **kwargs)
+        monkeypatch.setattr(log_writer, "_save", failing_save)
+
+        failures = LOG_WRITE_FAILURES.value()
+        await log_writer.flush()
+        assert log_writer.is_pending(log.id)
+        await asyncio.sleep(0.01)
+        await log_writer.flush()
+        assert await TaskLog.filter(id=log.id).exists()
+        assert LOG_WRITE_FAILURES.value() == failures + 1
+        assert not log_writer.is_pending(log.id)
+
+    async def test_log_is_dropped_after_retries(self, monkeypatch):
+        monkeypatch.setattr(settings, "log_writer_retry_seconds", 0)
+        monkeypatch.setattr(settings, "log_writer_max_retries", 1)
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+
+        async def failing_save(*args, **kwargs):
+            raise RuntimeError("disk I/O error")
+        monkeypatch.setattr(log_writer, "_save", failing_save)
+
+        dropped = LOGS_DROPPED.value()
+        for _ in range(2):
+            await log_writer.flush()
+            await asyncio.sleep(0.01)
+        assert not log_writer.is_pending(log.id)
+        assert LOGS_DROPPED.value() == dropped + 1
+
+    async def test_stop_writes_queued_logs(self):
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+
+        await log_writer.stop()
+        assert await TaskLog.filter(id=log.id).exists()
+
+    async def test_scheduler_execution(self):
+        task = await self.create_task()
+        await scheduler._execute_task(task)
+        await log_writer.flush()
+
+        log = await TaskLog.get(task_id=task.id)
+        await log.load_outputs()
+        assert log.status == ExecutionStatus.COMPLETED
+        assert log.stdout.strip() == "hello"
+
+    async def test_api_reads_and_deletes_queued_log(self, async_client: AsyncClient):
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+
+        response = await async_client.get(f"/logs/{log.id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == ExecutionStatus.RUNNING
+
+        response = await async_client.delete(f"/logs/{log.id}")
+        assert response.status_code == 204
+        await log_writer.flush()
+        assert await TaskLog.filter(id=log.id).exists() is False
+
+    async def test_task_delete_stops_runs_and_drops_queued_logs(self, async_client: AsyncClient):
+        task = await self.create_task()
+        log = self.running_log(task)
+        await log_writer.save(log)
+        run = asyncio.create_task(asyncio.sleep(60))
+        scheduler.running_jobs[task.id] = run
+
+        response = await async_client.delete(f"/tasks/{task.id}")
+        assert response.status_code == 204
+        assert run.cancelled()
+        assert task.id not in scheduler.running_jobs
+        assert not log_writer.is_pending(log.id)
+        await log_writer.flush()
+        assert await TaskLog.filter(id=log.id).exists() is False
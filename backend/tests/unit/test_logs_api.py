@@ -355,3 +355,165 @@ class TestLogsAPI:
         data = response.json()
         assert data["total"] == 0  # task2 log should be deleted
 
+
+    async def test_get_logs_returns_summary_without_output(self, async_client: AsyncClient):
+        """Test that log lists return sizes and a preview instead of stdout/stderr."""
+        task_id = await self.create_test_task(async_client, "Summary Task")
+
+        from app.models.log import TaskLog, ExecutionStatus
+        from app.models.task import Task
+
+        task = await Task.get(id=task_id)
+        log = await TaskLog.create(
+            task=task,
+            status=ExecutionStatus.COMPLETED,
+            command_executed="echo summary",
+            stdout="x" * 1000,
+            stderr="错误",
+            exit_code=0
+        )
+
+        response = await async_client.get("/logs")
+        assert response.status_code == 200
+        entry = response.json()["data"][0]
+        assert entry["id"] == log.id
+        assert entry["task_id"] == task_id
+        assert "stdout" not in entry
+        assert "stderr" not in entry
+        assert entry["stdout_size"] == 1000
+        assert entry["stderr_size"] == len("错误".encode("utf-8"))
+        assert entry["output_preview"] == "x" * 200
+
+        # Full bodies are still available from the detail endpoint
+        response = await async_client.get(f"/logs/{log.id}")
+        assert response.json()["stdout"] == "x" * 1000
+
+    async def test_get_logs_sparse_fields(self, async_client: AsyncClient):
+        """Test selecting summary columns with fields=."""
+        task_id = await self.create_test_task(async_client, "Sparse Task")
+
+        from app.models.log import TaskLog, ExecutionStatus
+        from app.models.task import Task
+
+        task = await Task.get(id=task_id)
+        await TaskLog.create(
+            task=task,
+            status=ExecutionStatus.FAILED,
+            command_executed="false",
+            exit_code=1
+        )
+
+        response = await async_client.get("/logs?fields=status,exit_code")
+        assert response.status_code == 200
+        entry = response.json()["data"][0]
+        assert set(entry) == {"id", "status", "exit_code"}
+        assert entry["status"] == ExecutionStatus.FAILED.value
+
+        response = await async_client.get(f"/tasks/{task_id}/logs?fields=status")
+        assert response.status_code == 200
+        assert set(response.json()["data"][0]) == {"id", "status"}
+
+        response = await async_client.get("/logs?fields=stdout")
+        assert response.status_code == 422
+
+    async def test_search_matches_compressed_output(self, async_client: AsyncClient):
+        """Test that search finds text inside compressed stdout."""
+        task_id = await self.create_test_task(async_client, "Compressed Task")
+
+        from app.models.log import TaskLog, ExecutionStatus
+        from app.models.task import Task
+
+        task = await Task.get(id=task_id)
+        await TaskLog.create(
+            task=task,
+            status=ExecutionStatus.COMPLETED,
+            command_executed="cat big.log",
+            stdout="repeated line\n" * 1000 + "needle-in-output\n",
+            exit_code=0
+        )
+
+        response = await async_client.get("/logs?search=NEEDLE-IN-OUTPUT")
+        assert response.status_code == 200
+        assert response.json()["total"] == 1
+
+    async def test_export_ndjson_and_csv(self, async_client: AsyncClient, monkeypatch):
+        """Test streaming export in both formats with filters and column selection."""
+        import csv
+        import io
+        import json
+        from app.config import settings
+        from app.models.log import TaskLog, ExecutionStatus
+        from app.models.task import Task
+
+        # Several keyset batches per export
+        monkeypatch.setattr(settings, "log_export_batch_size", 2)
+        task_id = await self.create_test_task(async_client, "Export Task")
+        task = await Task.get(id=task_id)
+        for i in range(5):
+            await TaskLog.create(
+                task=task,
+                status=ExecutionStatus.COMPLETED if i % 2 == 0 else ExecutionStatus.FAILED,
+                command_executed="echo",
+                stdout=f"line {i}\n" * 300,
+                exit_code=i % 2
+            )
+
+        response = await async_client.get("/logs/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+        assert len(rows) == 5
+        assert "stdout" not in rows[0]
+
+        response = await async_client.get(
+            f"/logs/export?task_id={task_id}&status={ExecutionStatus.FAILED.value}&fields=exit_code,stdout"
+        )
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 2
+        assert set(rows[0]) == {"id", "exit_code", "stdout"}
+        assert rows[0]["stdout"] == "line 1\n" * 300
+
+        response = await async_client.get("/logs/export?format=csv&fields=status,started_at&gzip=true")
+        assert response.headers["content-encoding"] == "gzip"
+        # httpx decodes the gzip content encoding transparently
+        table = list(csv.reader(io.StringIO(response.text)))
+        assert table[0] == ["id", "status", "started_at"]
+        assert len(table) == 6
+
+        response = await async_client.get("/logs/export?fields=nope")
+        assert response.status_code == 422
+        response = await async_client.get("/logs/export?format=xml")
+        assert response.status_code == 422
+
+    async def test_export_lifecycle_fields(self, async_client: AsyncClient):
+        """Test exporting the lifecycle timestamps of a scheduled run."""
+        import csv
+        import io
+        import json
+        from datetime import datetime, timedelta
+        from app.models.log import TaskLog, ExecutionStatus
+        from app.models.task import Task
+
+        task_id = await self.create_test_task(async_client, "Lifecycle Export Task")
+        scheduled = datetime.now(timezone.utc).replace(microsecond=0)
+        log = await TaskLog.create(
+            task=await Task.get(id=task_id),
+            status=ExecutionStatus.COMPLETED,
+            command_executed="echo",
+            scheduled_at=scheduled,
+            spawned_at=scheduled + timedelta(seconds=1)
+        )
+
+        response = await async_client.get(f"/logs/export?task_id={task_id}")
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == [log.id]
+        assert datetime.fromisoformat(rows[0]["scheduled_at"]) == scheduled
+        assert datetime.fromisoformat(rows[0]["spawned_at"]) == scheduled + timedelta(seconds=1)
+        assert rows[0]["exited_at"] is None
+
+        response = await async_client.get(f"/logs/export?task_id={task_id}&format=csv&fields=scheduled_at")
+        table = list(csv.reader(io.StringIO(response.text)))
+        assert table[0] == ["id", "scheduled_at"]
+        assert datetime.fromisoformat(table[1][1]) == scheduled
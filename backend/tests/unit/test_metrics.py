@@ -0,0 +1,106 @@
+"""
+Unit tests for the metrics collectors and GET /metrics.
+"""
+import threading
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.metrics import Counter, Gauge, Histogram, Registry, HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+from app.scheduler.scheduler import scheduler, TASK_FIRES, TASK_TIMEOUTS, TASK_DURATION, TASK_SPAWN, TASK_QUEUE_WAIT
+
+
+class TestCollectors:
+    """Test cases for recording and rendering metrics."""
+
+    def test_render(self):
+        registry = Registry()
+        runs = Counter("runs", "Runs", ["task_id"], registry=registry)
+        lag = Gauge("lag_seconds", "Lag", registry=registry)
+        depth = Gauge("depth", "Depth", function=lambda: 3, registry=registry)
+        latency = Histogram("latency_seconds", "Latency", ["route"], buckets=[0.1, 1], registry=registry)
+
+        runs.inc(task_id=1)
+        runs.inc(2, task_id=1)
+        lag.set(0.25)
+        latency.observe(0.1, route='/a"b')
+        latency.observe(5, route='/a"b')
+        assert runs.value(task_id=1) == 3
+        assert depth.value() == 3
+        with pytest.raises(ValueError):
+            runs.inc(route="/")
+
+        assert registry.render().splitlines() == [
+            "# HELP runs Runs",
+            "# TYPE runs counter",
+            'runs_total{task_id="1"} 3',
+            "# HELP lag_seconds Lag",
+            "# TYPE lag_seconds gauge",
+            "lag_seconds 0.25",
+            "# HELP depth Depth",
+            "# TYPE depth gauge",
+            "depth 3",
+            "# HELP latency_seconds Latency",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+            'latency_seconds_bucket{route="/a\\"b",le="1"} 1',
+            'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 2',
+            'latency_seconds_sum{route="/a\\"b"} 5.1',
+            'latency_seconds_count{route="/a\\"b"} 2',
+        ]
+        with pytest.raises(ValueError):
+            Counter("runs", "Again", registry=registry)
+
+    def test_threads(self):
+        counter = Counter("threaded", "Threaded", registry=Registry())
+
+        def work():
+            for _ in range(10000):
+                counter.inc()
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert counter.value() == 40000
+
+
+@pytest.mark.asyncio
+class TestMetricsRecording:
+    """Test cases for the metrics recorded by the scheduler and the API."""
+
+    async def test_http_metrics(self, async_client: AsyncClient):
+        before = HTTP_REQUEST_SECONDS.count(method="GET", route="/api/tasks/{task_id}")
+        await async_client.get("/tasks/1")
+        await async_client.get("/tasks/2")
+        assert HTTP_REQUEST_SECONDS.count(method="GET", route="/api/tasks/{task_id}") == before + 2
+        assert HTTP_REQUESTS.value(method="GET", route="/api/tasks/{task_id}", status=404) >= 2
+
+        response = await async_client.get("http://test/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        for name in ("akari_http_request_duration_seconds_bucket", "akari_running_jobs", "akari_executor_threads",
+                     "akari_event_loop_lag_seconds", "akari_db_write_seconds"):
+            assert f"# TYPE {name.removesuffix('_bucket')} " in response.text
+
+    async def test_scheduler_metrics(self):
+        task = await Task.create(name="Metered Task", command="sleep", args=["5"], timeout=1,
+                                 schedule_type=ScheduleType.INTERVAL, interval_seconds=60)
+        await scheduler.load_tasks()
+        # Task ids restart with every test, the counters do not
+        fires = TASK_FIRES.value(task_id=task.id)
+        timeouts = TASK_TIMEOUTS.value(task_id=task.id)
+        spawns = TASK_SPAWN.count()
+        durations = TASK_DURATION.count()
+        waits = TASK_QUEUE_WAIT.count()
+
+        await scheduler._execute_task_wrapper(task.id)
+        assert TASK_FIRES.value(task_id=task.id) == fires + 1
+        assert TASK_TIMEOUTS.value(task_id=task.id) == timeouts + 1
+        assert TASK_SPAWN.count() == spawns + 1
+        assert TASK_DURATION.count() == durations + 1
+        assert TASK_QUEUE_WAIT.count() == waits + 1
+        log = await TaskLog.get(task_id=task.id)
+        assert log.status == ExecutionStatus.TIMEOUT
@@ -0,0 +1,116 @@
+"""
+Unit tests for content-addressed output deduplication.
+"""
+import pytest
+import pytest_asyncio
+from tortoise import Tortoise
+from httpx import AsyncClient
+
+from app.db.blobs import delete_logs, storage_stats
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def clean_blobs():
+    await Tortoise.get_connection("default").execute_query("DELETE FROM output_blobs")
+    yield
+
+
+@pytest.mark.asyncio
+class TestOutputBlobs:
+    """Test cases for output blobs and their reference counts."""
+
+    async def create_task(self, name="Health Check"):
+        return await Task.create(
+            name=name,
+            command="curl",
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=5
+        )
+
+    async def create_log(self, task, stdout="status: ok\n", stderr=""):
+        return await TaskLog.create(
+            task=task,
+            status=ExecutionStatus.COMPLETED,
+            command_executed="curl http://localhost/health",
+            stdout=stdout,
+            stderr=stderr,
+            exit_code=0
+        )
+
+    async def blob_refcounts(self):
+        conn = Tortoise.get_connection("default")
+        rows = await conn.execute_query_dict("SELECT hash, refcount FROM output_blobs")
+        return {row["hash"]: row["refcount"] for row in rows}
+
+    async def test_identical_outputs_share_one_blob(self):
+        task = await self.create_task()
+        logs = [await self.create_log(task) for _ in range(20)]
+
+        assert len({log.stdout_hash for log in logs}) == 1
+        assert await self.blob_refcounts() == {logs[0].stdout_hash: 20}
+
+        stats = await storage_stats()
+        assert stats["blobs"] == 1
+        assert stats["references"] == 20
+        assert stats["dedup_ratio"] == 20.0
+
+    async def test_outputs_are_resolved_on_read(self):
+        task = await self.create_task()
+        log = await self.create_log(task, stdout="out", stderr="err")
+
+        loaded = await TaskLog.get(id=log.id)
+        assert loaded.stdout is None
+        await loaded.load_outputs()
+        assert (loaded.stdout, loaded.stderr) == ("out", "err")
+        assert loaded.stdout_size == 3
+
+    async def test_resave_does_not_add_references(self):
+        task = await self.create_task()
+        log = await self.create_log(task)
+        log.exit_code = 1
+        await log.save()
+
+        loaded = await TaskLog.get(id=log.id)
+        await loaded.save()
+        assert await self.blob_refcounts() == {log.stdout_hash: 1}
+        assert (await TaskLog.get(id=log.id)).stdout_size == len("status: ok\n")
+
+    async def test_changed_output_releases_old_blob(self):
+        task = await self.create_task()
+        log = await self.create_log(task, stdout="first")
+        log.stdout = "second"
+        await log.save()
+
+        assert list(await self.blob_refcounts()) == [log.stdout_hash]
+
+    async def test_deleting_logs_collects_blobs(self):
+        task = await self.create_task()
+        kept = await self.create_log(task, stdout="shared")
+        log = await self.create_log(task, stdout="shared")
+        unique = await self.create_log(task, stdout="unique")
+
+        await log.delete()
+        assert await self.blob_refcounts() == {kept.stdout_hash: 1, unique.stdout_hash: 1}
+
+        assert await delete_logs(TaskLog.filter(task_id=task.id)) == 2
+        assert await self.blob_refcounts() == {}
+
+    async def test_deleting_task_collects_blobs(self, async_client: AsyncClient):
+        task = await self.create_task()
+        for _ in range(3):
+            await self.create_log(task)
+
+        response = await async_client.delete(f"/tasks/{task.id}")
+        assert response.status_code == 204
+        assert await self.blob_refcounts() == {}
+
+    async def test_storage_endpoint(self, async_client: AsyncClient):
+        task = await self.create_task()
+        for _ in range(4):
+            await self.create_log(task)
+
+        response = await async_client.get("/logs/storage")
+        assert response.status_code == 200
+        assert response.json()["dedup_ratio"] == 4.0
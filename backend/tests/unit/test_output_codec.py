@@ -0,0 +1,83 @@
+"""
+Unit tests for the compressed output storage codec.
+"""
+import pytest
+from tortoise import Tortoise
+
+from app.config import settings
+from app.db.codec import compress_output, decompress_output, compress_existing_outputs
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+class TestOutputCodec:
+    """Test cases for compress_output/decompress_output."""
+
+    def test_small_output_stays_plain(self):
+        assert compress_output("ok\n") == "ok\n"
+        assert compress_output(None) is None
+        assert compress_output("") == ""
+
+    def test_large_output_round_trip(self):
+        text = "line of repetitive output 中文\n" * 1000
+        stored = compress_output(text)
+        assert isinstance(stored, bytes)
+        assert len(stored) < len(text.encode("utf-8")) / 10
+        assert decompress_output(stored) == text
+
+    def test_threshold(self, monkeypatch):
+        monkeypatch.setattr(settings, "output_compression_threshold", 100)
+        assert compress_output("a" * 99) == "a" * 99
+        assert isinstance(compress_output("a" * 100), bytes)
+
+    def test_compression_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "output_compression", "none")
+        text = "x" * 10000
+        assert compress_output(text) == text
+
+
+@pytest.mark.asyncio
+class TestCompressedStorage:
+    """Test cases for compressed stdout/stderr columns."""
+
+    async def create_task(self):
+        return await Task.create(
+            name="Codec Task",
+            command="echo",
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=60
+        )
+
+    async def test_log_output_is_stored_compressed(self):
+        task = await self.create_task()
+        text = "health ok\n" * 500
+        log = await TaskLog.create(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo", stdout=text)
+
+        conn = Tortoise.get_connection("default")
+        rows = await conn.execute_query_dict(
+            "SELECT typeof(data) AS kind FROM output_blobs WHERE hash = ?", [log.stdout_hash]
+        )
+        assert rows[0]["kind"] == "blob"
+
+        loaded = await TaskLog.get(id=log.id)
+        await loaded.load_outputs()
+        assert loaded.stdout == text
+        assert loaded.stdout_size == len(text)
+
+    async def test_existing_rows_are_migrated(self):
+        task = await self.create_task()
+        text = "legacy output\n" * 500
+        conn = Tortoise.get_connection("default")
+        await conn.execute_query(
+            "INSERT INTO task_logs (task_id, status, command_executed, stdout, stderr, created_at) "
+            "VALUES (?, ?, 'echo', ?, 'err', CURRENT_TIMESTAMP)",
+            [task.id, ExecutionStatus.COMPLETED.value, text]
+        )
+
+        assert await compress_existing_outputs(batch_size=1, pause=0) == 1
+        rows = await conn.execute_query_dict("SELECT typeof(stdout) AS kind, stderr FROM task_logs")
+        assert rows[0]["kind"] == "blob"
+        assert rows[0]["stderr"] == "err"
+        assert (await TaskLog.first()).stdout == text
+        # Already compressed rows are skipped
+        assert await compress_existing_outputs(batch_size=1, pause=0) == 0
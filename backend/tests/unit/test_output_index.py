@@ -0,0 +1,151 @@
+"""
+Unit tests for line-indexed output paging.
+"""
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.db import output_index
+from app.db.output_index import OutputIndex, OutputIndexCache, output_indexes
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+def make_output(lines: int) -> str:
+    return "".join(f"line {i} ünïcode\n" for i in range(lines))
+
+
+async def create_log(stdout: str, status: ExecutionStatus = ExecutionStatus.COMPLETED) -> TaskLog:
+    task = await Task.create(name="Output Task", command="echo", schedule_type=ScheduleType.INTERVAL, interval_seconds=60)
+    return await TaskLog.create(task_id=task.id, status=status, command_executed="echo", stdout=stdout, stderr="oops")
+
+
+class TestOutputIndex:
+    """Test cases for locating lines and bytes in an indexed output."""
+
+    def test_lines_across_blocks(self, monkeypatch):
+        monkeypatch.setattr(output_index, "OUTPUT_INDEX_BLOCK_SIZE", 64)
+        text = make_output(500)
+        index = OutputIndex(text)
+        expected = text.split("\n")[:-1]
+        assert index.line_count == 500
+        assert index.size == len(text.encode("utf-8"))
+        for start, count in ((0, 1), (0, 500), (3, 7), (131, 40), (499, 10), (500, 5)):
+            assert index.lines(start, count) == expected[start:start + count]
+        assert index.byte_range(0, 12) == "line 0 ünïc".encode("utf-8")
+
+    def test_line_edges(self):
+        assert OutputIndex("").line_count == 0
+        assert OutputIndex("").lines(0, 10) == []
+        index = OutputIndex("a\n\nb")
+        assert index.line_count == 3
+        assert index.lines(0, 10) == ["a", "", "b"]
+        assert index.lines(2, 1) == ["b"]
+
+
+@pytest.mark.asyncio
+class TestOutputIndexCache:
+    """Test cases for caching indexes of finished outputs."""
+
+    async def test_builds_once_and_evicts(self, monkeypatch):
+        monkeypatch.setattr(settings, "output_index_cache_mb", 1)
+        cache = OutputIndexCache()
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            return "x" * 400_000
+
+        first, second = await asyncio.gather(cache.get("a", load), cache.get("a", load))
+        assert first is second and len(loads) == 1
+        await cache.get("b", load)
+        assert len(cache) == 2
+        # The least recently used entry makes room
+        await cache.get("a", load)
+        await cache.get("c", load)
+        assert len(cache) == 2 and len(loads) == 3
+        await cache.get("a", load)
+        assert len(loads) == 3
+
+        # Unfinished outputs are not kept
+        await cache.get(None, load)
+        await cache.get(None, load)
+        assert len(loads) == 5 and len(cache) == 2
+
+
+@pytest.mark.asyncio
+class TestLogOutputAPI:
+    """Test cases for the output paging endpoints."""
+
+    async def test_output_pages(self, async_client: AsyncClient):
+        log = await create_log(make_output(2500))
+        response = await async_client.get(f"/logs/{log.id}/output", params={"from_line": 10, "count": 3})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["lines"] == ["line 10 ünïcode", "line 11 ünïcode", "line 12 ünïcode"]
+        assert (data["total_lines"], data["from_line"], data["status"]) == (2500, 10, ExecutionStatus.COMPLETED)
+        assert "immutable" in response.headers["cache-control"]
+
+        response = await async_client.get(f"/logs/{log.id}/output", params={"tail": 2})
+        data = response.json()
+        assert (data["from_line"], data["lines"]) == (2498, ["line 2498 ünïcode", "line 2499 ünïcode"])
+
+        response = await async_client.get(f"/logs/{log.id}/output", params={"stream": "stderr"})
+        assert response.json()["lines"] == ["oops"]
+
+        response = await async_client.get(f"/logs/{log.id}/output", params={"stream": "other"})
+        assert response.status_code == 422
+        response = await async_client.get("/logs/999999/output")
+        assert response.status_code == 404
+
+    async def test_output_cached_by_blob(self, async_client: AsyncClient, monkeypatch):
+        log = await create_log(make_output(100))
+        await async_client.get(f"/logs/{log.id}/output")
+
+        async def no_loads(*args, **kwargs):
+            raise AssertionError("output was decoded again")
+        monkeypatch.setattr(output_index.OutputIndexCache, "_build", staticmethod(no_loads))
+        response = await async_client.get(f"/logs/{log.id}/output", params={"from_line": 50, "count": 1})
+        assert response.json()["lines"] == ["line 50 ünïcode"]
+        # Another log with the same output shares the index
+        other = await create_log(make_output(100))
+        response = await async_client.get(f"/logs/{other.id}/output", params={"tail": 1})
+        assert response.json()["lines"] == ["line 99 ünïcode"]
+
+    async def test_running_log_is_not_cached(self, async_client: AsyncClient):
+        log = await create_log("", ExecutionStatus.RUNNING)
+        cached = len(output_indexes)
+        response = await async_client.get(f"/logs/{log.id}/output")
+        assert response.json()["total_lines"] == 0
+        assert response.headers["cache-control"] == "no-store"
+        assert len(output_indexes) == cached
+
+    async def test_raw_byte_ranges(self, async_client: AsyncClient):
+        text = make_output(2000)
+        data = text.encode("utf-8")
+        log = await create_log(text)
+        url = f"/logs/{log.id}/output/raw"
+
+        response = await async_client.get(url, headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert response.content == data
+        assert response.headers["accept-ranges"] == "bytes"
+
+        for header, start, end in (("bytes=0-99", 0, 99), ("bytes=100-", 100, len(data) - 1),
+                                   ("bytes=-50", len(data) - 50, len(data) - 1),
+                                   ("bytes=10-99999999", 10, len(data) - 1)):
+            response = await async_client.get(url, headers={"Range": header, "Accept-Encoding": "gzip"})
+            assert response.status_code == 206
+            assert response.content == data[start:end + 1]
+            assert response.headers["content-range"] == f"bytes {start}-{end}/{len(data)}"
+            assert "content-encoding" not in response.headers
+
+        response = await async_client.get(url, headers={"Range": f"bytes={len(data)}-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(data)}"
+        # Not a single byte range, ignored
+        response = await async_client.get(url, headers={"Range": "bytes=0-1,5-6"})
+        assert response.status_code == 200
@@ -0,0 +1,155 @@
+"""
+Unit tests for monthly log partitions.
+"""
+import json
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from tortoise import Tortoise
+
+from app.config import settings
+from app.db.blobs import output_hash
+from app.db.codec import compress_output
+from app.db.log_router import log_router, LogFilter
+from app.db.partitions import partitions
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+NOW = datetime(2024, 3, 15, tzinfo=timezone.utc)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def partition_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "log_partitioning", True)
+    monkeypatch.setattr(settings, "log_partition_dir", str(tmp_path))
+    yield tmp_path
+    await partitions.close()
+    await Tortoise.get_connection("default").execute_query("DELETE FROM output_blobs")
+
+
+@pytest.mark.asyncio
+class TestPartitions:
+    """Test cases for partition rotation, routing and drops."""
+
+    async def create_logs(self):
+        task = await Task.create(
+            name="Partitioned Task",
+            command="echo",
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=60
+        )
+        logs = {}
+        for month in (1, 2, 3):
+            logs[month] = await TaskLog.create(
+                task=task,
+                status=ExecutionStatus.COMPLETED,
+                command_executed="echo",
+                started_at=datetime(2024, month, 10, tzinfo=timezone.utc),
+                stdout=f"output of month {month}"
+            )
+        return task, logs
+
+    async def test_rotate_moves_past_months(self, partition_dir):
+        task, logs = await self.create_logs()
+        running = await TaskLog.create(
+            task=task,
+            status=ExecutionStatus.RUNNING,
+            command_executed="echo",
+            started_at=datetime(2024, 1, 20, tzinfo=timezone.utc)
+        )
+
+        moved = await partitions.rotate(now=NOW, pause=0)
+        assert moved == 2
+        assert sorted(path.name for path in partition_dir.iterdir()) == [
+            "task_logs_2024_01.sqlite3", "task_logs_2024_02.sqlite3"
+        ]
+        live = await TaskLog.all().order_by("id").values_list("id", flat=True)
+        assert live == [logs[3].id, running.id]
+
+    async def test_page_spans_partitions(self, async_client: AsyncClient):
+        _, logs = await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+
+        response = await async_client.get("/logs")
+        data = response.json()
+        assert data["total"] == 3
+        assert [log["id"] for log in data["data"]] == [logs[3].id, logs[2].id, logs[1].id]
+
+        response = await async_client.get("/logs", params={"skip": 1, "limit": 1})
+        assert [log["id"] for log in response.json()["data"]] == [logs[2].id]
+
+        response = await async_client.get("/logs", params={"search": "month 1"})
+        assert [log["id"] for log in response.json()["data"]] == [logs[1].id]
+
+    async def test_search_many_matching_blobs(self):
+        _, logs = await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+        texts = [f"output of month 1, copy {i}" for i in range(500)]
+        await Tortoise.get_connection("default").execute_many(
+            "INSERT INTO output_blobs (hash, data, size, refcount) VALUES (?, ?, ?, 0)",
+            [[output_hash(text), compress_output(text), len(text)] for text in texts]
+        )
+
+        page = await log_router.page(LogFilter(search="month 1"), 0, 10, ["id"])
+        assert [log.id for log in page.data] == [logs[1].id]
+        # Matching blobs are not bound one variable each, SQLite caps them per statement
+        _, params = await log_router._partition_where(LogFilter(search="month 1"))
+        _, few_params = await log_router._partition_where(LogFilter(search="month 2"))
+        assert len(params) == len(few_params)
+
+    async def test_time_range_prunes_partitions(self):
+        await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+
+        log_filter = LogFilter(started_after=datetime(2024, 2, 1), started_before=datetime(2024, 3, 1))
+        assert [partition.name for partition in log_router.partitions_for(log_filter)] == ["2024-02"]
+        page = await log_router.page(log_filter, 0, 10, ["id", "started_at"])
+        assert page.total == 1
+
+    async def test_get_and_delete_partitioned_log(self, async_client: AsyncClient):
+        _, logs = await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+
+        response = await async_client.get(f"/logs/{logs[1].id}")
+        assert response.status_code == 200
+        assert response.json()["stdout"] == "output of month 1"
+
+        response = await async_client.delete(f"/logs/{logs[1].id}")
+        assert response.status_code == 204
+        response = await async_client.get(f"/logs/{logs[1].id}")
+        assert response.status_code == 404
+
+    async def test_time_range_delete_drops_partition(self, partition_dir):
+        await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+
+        deleted = await log_router.delete_matching(LogFilter(started_before=datetime(2024, 2, 1)))
+        assert deleted == 1
+        assert [path.name for path in partition_dir.iterdir()] == ["task_logs_2024_02.sqlite3"]
+        conn = Tortoise.get_connection("default")
+        _, rows = await conn.execute_query("SELECT COUNT(*) FROM output_blobs")
+        assert rows[0][0] == 2
+
+    async def test_delete_task_clears_partitions(self, async_client: AsyncClient):
+        task, _ = await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+
+        response = await async_client.delete(f"/tasks/{task.id}")
+        assert response.status_code == 204
+        for partition in partitions.partitions():
+            assert await partitions.fetch(partition, "SELECT id FROM task_logs", []) == []
+
+    async def test_export_spans_partitions(self, async_client: AsyncClient):
+        _, logs = await self.create_logs()
+        await partitions.rotate(now=NOW, pause=0)
+
+        response = await async_client.get("/logs/export", params={"fields": "started_at,stdout"})
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == [logs[1].id, logs[2].id, logs[3].id]
+        assert rows[0]["stdout"] == "output of month 1"
+        assert rows[0]["started_at"] == "2024-01-10T00:00:00+00:00"
+
+        response = await async_client.get("/logs/export", params={"started_before": "2024-02-01T00:00:00Z"})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [logs[1].id]
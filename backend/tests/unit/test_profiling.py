@@ -0,0 +1,114 @@
+"""
+Unit tests for the CPU and memory profiling endpoints.
+"""
+import asyncio
+import threading
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.core.profiling import profiler
+
+
+def spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def profiling():
+    yield
+    settings.profiling_enabled = False
+    if profiler.tracing:
+        profiler.stop_tracing()
+
+
+@pytest.mark.asyncio
+class TestProfiling:
+    """Test cases for switching profiling on and using it."""
+
+    async def test_disabled_by_default(self, async_client: AsyncClient, profiling, monkeypatch):
+        monkeypatch.setattr(settings, "profiling_token", "secret")
+        response = await async_client.get("/diagnostics/profile/cpu", params={"seconds": 0.1})
+        assert response.status_code == 403
+
+        response = await async_client.put(
+            "/diagnostics/profiling", json={"enabled": True}, headers={"X-Profiling-Token": "secret"}
+        )
+        assert response.json() == {"enabled": True}
+        response = await async_client.get("/diagnostics/profile/memory")
+        assert response.status_code == 200
+
+    async def test_switch_requires_token(self, async_client: AsyncClient, profiling, monkeypatch):
+        # Loopback clients are refused too, a local reverse proxy makes every client one
+        response = await async_client.put("/diagnostics/profiling", json={"enabled": True})
+        assert response.status_code == 403
+
+        monkeypatch.setattr(settings, "profiling_token", "secret")
+        for headers in ({}, {"X-Profiling-Token": "guess"}):
+            response = await async_client.put("/diagnostics/profiling", json={"enabled": True}, headers=headers)
+            assert response.status_code == 403
+        assert settings.profiling_enabled is False
+
+    async def test_cpu_profile_covers_threads(self, async_client: AsyncClient, profiling):
+        settings.profiling_enabled = True
+        stop = threading.Event()
+        thread = threading.Thread(target=spin, args=(stop,), name="spinner")
+        thread.start()
+        try:
+            response = await async_client.get("/diagnostics/profile/cpu", params={"seconds": 0.2, "interval_ms": 2})
+            collapsed = await async_client.get("/diagnostics/profile/cpu",
+                                               params={"seconds": 0.1, "format": "collapsed"})
+        finally:
+            stop.set()
+            thread.join()
+
+        data = response.json()
+        assert data["samples"] > 10
+        assert any(stack.startswith("spinner;") and "spin (test_profiling.py" in stack for stack in data["collapsed"])
+        spin_stats = next(function for function in data["functions"] if function["function"].startswith("spin "))
+        assert spin_stats["total"] >= spin_stats["own"]
+        # The event loop is waiting on the sampler, idle threads are left out
+        assert not any("selectors.py" in stack for stack in data["collapsed"])
+
+        line = collapsed.text.splitlines()[0]
+        stack, count = line.rsplit(" ", 1)
+        assert ";" in stack and int(count) > 0
+
+        response = await async_client.get("/diagnostics/profile/cpu", params={"seconds": settings.profiling_max_seconds + 1})
+        assert response.status_code == 422
+
+    async def test_concurrent_cpu_profiles(self, async_client: AsyncClient, profiling):
+        settings.profiling_enabled = True
+        first = asyncio.create_task(async_client.get("/diagnostics/profile/cpu", params={"seconds": 0.2}))
+        await asyncio.sleep(0.05)
+        second = await async_client.get("/diagnostics/profile/cpu", params={"seconds": 0.1})
+        assert second.status_code == 409
+        assert (await first).status_code == 200
+
+    async def test_memory_snapshots_diff(self, async_client: AsyncClient, profiling):
+        settings.profiling_enabled = True
+        response = await async_client.post("/diagnostics/profile/memory/snapshots")
+        assert response.status_code == 409
+
+        response = await async_client.put("/diagnostics/profile/memory", json={"tracing": True, "frames": 0})
+        assert response.status_code == 422
+        response = await async_client.put("/diagnostics/profile/memory", json={"tracing": True, "frames": 5})
+        assert response.json() == {"tracing": True, "frames": 5, "snapshots": []}
+        base = (await async_client.post("/diagnostics/profile/memory/snapshots")).json()
+        retained = [bytearray(10_000) for _ in range(100)]
+        target = (await async_client.post("/diagnostics/profile/memory/snapshots", params={"limit": 5})).json()
+        assert target["traced_bytes"] > base["traced_bytes"] and len(target["top"]) == 5
+
+        response = await async_client.get("/diagnostics/profile/memory/diff", params={"base": base["id"]})
+        diff = response.json()
+        assert diff["target"] == target["id"] and diff["size_diff"] >= 1_000_000
+        assert "test_profiling.py" in diff["top"][0]["location"]
+        assert diff["top"][0]["size_diff"] >= 1_000_000
+        del retained
+
+        response = await async_client.get("/diagnostics/profile/memory/diff", params={"base": 999})
+        assert response.status_code == 404
+        response = await async_client.put("/diagnostics/profile/memory", json={"tracing": False})
+        assert response.json()["tracing"] is False and response.json()["snapshots"] == []
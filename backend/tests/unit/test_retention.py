@@ -0,0 +1,137 @@
+"""
+Unit tests for the log retention engine.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.db.retention import RetentionEngine, RetentionPolicy, delete_in_batches
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+@pytest.mark.asyncio
+class TestRetention:
+    """Test cases for retention policies and batched deletion."""
+
+    async def create_task(self, **kwargs):
+        return await Task.create(
+            name="Retention Task",
+            command="echo",
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=60,
+            **kwargs
+        )
+
+    async def create_log(self, task, days_ago=0, status=ExecutionStatus.COMPLETED):
+        return await TaskLog.create(
+            task=task,
+            status=status,
+            command_executed="echo",
+            started_at=datetime.now(timezone.utc) - timedelta(days=days_ago),
+            stdout=f"run {days_ago}"
+        )
+
+    async def test_policy_falls_back_to_global(self, monkeypatch):
+        monkeypatch.setattr(settings, "retention_max_age_days", 30)
+        monkeypatch.setattr(settings, "retention_max_runs", 100)
+        task = await self.create_task(log_max_runs=5)
+
+        policy = RetentionPolicy.for_task(task)
+        assert policy.max_age_days == 30
+        assert policy.max_runs == 5
+        assert policy.failure_max_age_days is None
+
+    async def test_zero_limits_do_not_fall_back(self, monkeypatch):
+        monkeypatch.setattr(settings, "retention_max_runs", 100)
+        task = await self.create_task(log_max_runs=0)
+        assert RetentionPolicy.for_task(task).max_runs == 0
+        await self.create_log(task)
+        await self.create_log(task, status=ExecutionStatus.RUNNING)
+
+        await RetentionEngine().run()
+        assert await TaskLog.filter(task_id=task.id).values_list("status", flat=True) == [ExecutionStatus.RUNNING]
+
+    async def test_negative_limits_are_rejected(self, async_client: AsyncClient):
+        response = await async_client.post("/tasks/", json={
+            "name": "Negative Retention",
+            "command": "echo",
+            "schedule_type": ScheduleType.INTERVAL,
+            "interval_seconds": 60,
+            "log_max_runs": -1
+        })
+        assert response.status_code == 422
+
+        task = await self.create_task()
+        response = await async_client.put(f"/tasks/{task.id}", json={"log_max_age_days": -5})
+        assert response.status_code == 422
+
+    async def test_max_age(self):
+        task = await self.create_task(log_max_age_days=7)
+        recent = await self.create_log(task, days_ago=1)
+        await self.create_log(task, days_ago=10)
+        await self.create_log(task, days_ago=20)
+
+        progress = await RetentionEngine().run()
+        assert progress.rows_deleted == 2
+        assert progress.error is None
+        assert await TaskLog.all().values_list("id", flat=True) == [recent.id]
+
+    async def test_max_runs(self):
+        task = await self.create_task(log_max_runs=3)
+        logs = [await self.create_log(task) for _ in range(5)]
+
+        await RetentionEngine().run()
+        remaining = await TaskLog.all().order_by("id").values_list("id", flat=True)
+        assert remaining == [log.id for log in logs[2:]]
+
+    async def test_failures_are_kept_longer(self):
+        task = await self.create_task(log_max_age_days=7, log_failure_max_age_days=30)
+        await self.create_log(task, days_ago=10)
+        failed = await self.create_log(task, days_ago=10, status=ExecutionStatus.FAILED)
+        await self.create_log(task, days_ago=40, status=ExecutionStatus.TIMEOUT)
+
+        await RetentionEngine().run()
+        assert await TaskLog.all().values_list("id", flat=True) == [failed.id]
+
+    async def test_max_runs_counts_successes_only(self):
+        task = await self.create_task(log_max_runs=2, log_failure_max_age_days=30)
+        logs = [
+            await self.create_log(task, status=status)
+            for status in (ExecutionStatus.COMPLETED, ExecutionStatus.COMPLETED, ExecutionStatus.FAILED,
+                           ExecutionStatus.COMPLETED, ExecutionStatus.TIMEOUT, ExecutionStatus.RUNNING)
+        ]
+
+        await RetentionEngine().run()
+        remaining = await TaskLog.all().order_by("id").values_list("id", flat=True)
+        # The two newest successes, the failures and the running log
+        assert remaining == [log.id for log in logs[1:]]
+
+    async def test_running_logs_are_kept(self):
+        task = await self.create_task(log_max_age_days=1)
+        running = await self.create_log(task, days_ago=5, status=ExecutionStatus.RUNNING)
+
+        await RetentionEngine().run()
+        assert await TaskLog.all().values_list("id", flat=True) == [running.id]
+
+    async def test_delete_in_batches(self):
+        task = await self.create_task()
+        for _ in range(7):
+            await self.create_log(task)
+
+        engine = RetentionEngine()
+        deleted = await delete_in_batches(TaskLog.all(), engine.progress, batch_size=3, pause=0)
+        assert deleted == 7
+        assert engine.progress.batches == 3
+        assert await TaskLog.all().count() == 0
+
+    async def test_retention_endpoints(self, async_client: AsyncClient):
+        response = await async_client.get("/logs/retention")
+        assert response.status_code == 200
+        assert "policy" in response.json()
+        assert "rows_deleted" in response.json()["progress"]
+
+        response = await async_client.post("/logs/retention/run")
+        assert response.status_code == 202
@@ -0,0 +1,87 @@
+"""
+Unit tests for serving the built frontend.
+"""
+import gzip
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from app.config import settings
+from app.core.caching import IMMUTABLE
+from app.core.static import static_site
+from main import app
+
+SCRIPT = "console.log('akari');\n" * 200
+
+
+@pytest_asyncio.fixture
+async def site(tmp_path, monkeypatch):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_text("<html>" + "<div></div>" * 200 + "</html>")
+    (tmp_path / "assets" / "index-a1B2c3D4.js").write_text(SCRIPT)
+    (tmp_path / "assets" / "logo.svg").write_text("<svg></svg>")
+    monkeypatch.setattr(settings, "static_dir", str(tmp_path))
+    static_site.load()
+    yield tmp_path
+    static_site.directory = None
+
+
+@pytest_asyncio.fixture
+async def root_client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+class TestStaticSite:
+    """Test cases for static assets, the SPA fallback and route priority."""
+
+    async def test_routes_take_priority(self, site, root_client: AsyncClient):
+        assert (await root_client.get("/health")).json() == {"status": "healthy"}
+        response = await root_client.get("/api/unknown")
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Not Found"}
+        assert (await root_client.get("/api/tasks")).status_code == 200
+
+    async def test_index_from_memory(self, site, root_client: AsyncClient):
+        response = await root_client.get("/tasks/3", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["cache-control"] == "no-cache"
+        assert response.text.startswith("<html>")
+
+        (site / "index.html").write_text("<html>changed</html>")
+        etag = response.headers["etag"]
+        response = await root_client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    async def test_hashed_asset_is_immutable(self, site, root_client: AsyncClient):
+        response = await root_client.get("/assets/index-a1B2c3D4.js", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == IMMUTABLE
+        assert response.headers["content-type"].startswith("text/javascript")
+        assert response.text == SCRIPT
+
+        response = await root_client.get("/assets/logo.svg")
+        assert response.headers["cache-control"] == "no-cache"
+        assert (await root_client.get("/assets/missing.js")).status_code == 404
+
+    async def test_precompressed_variants(self, site, root_client: AsyncClient):
+        await static_site.precompress()
+        compressed = site / "assets" / "index-a1B2c3D4.js.gz"
+        assert gzip.decompress(compressed.read_bytes()).decode() == SCRIPT
+        # Too small to be worth it
+        assert not (site / "assets" / "logo.svg.gz").exists()
+
+        response = await root_client.get("/assets/index-a1B2c3D4.js", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) == compressed.stat().st_size
+        assert response.text == SCRIPT
+
+    async def test_new_assets_after_redeploy(self, site, root_client: AsyncClient):
+        (site / "assets" / "chunk-Z9y8X7w6.js").write_text("export {}")
+        response = await root_client.get("/assets/chunk-Z9y8X7w6.js")
+        assert response.status_code == 200
+        assert response.text == "export {}"
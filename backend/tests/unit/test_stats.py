@@ -0,0 +1,225 @@
+"""
+Unit tests for execution rollups and the stats API.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
+from httpx import AsyncClient
+
+from app.db.log_router import log_router
+from app.db.log_writer import log_writer
+from app.db.rollups import rebuild, DURATION_BOUNDS, LAG_BOUNDS
+from app.models.log import LIFECYCLE_FIELDS
+from app.scheduler.scheduler import scheduler
+from app.models.log import TaskLog, TaskRunRollup, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+DAY = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.asyncio
+class TestStats:
+    """Test cases for incrementally maintained rollups."""
+
+    async def create_task(self):
+        return await Task.create(
+            name="Stats Task",
+            command="echo",
+            schedule_type=ScheduleType.INTERVAL,
+            interval_seconds=60
+        )
+
+    async def finish(self, task, hour, status=ExecutionStatus.COMPLETED, duration=1.0):
+        return await TaskLog.create(
+            task=task,
+            status=status,
+            command_executed="echo",
+            started_at=DAY.replace(hour=hour, minute=30),
+            duration=duration
+        )
+
+    async def test_finished_runs_update_rollups(self):
+        task = await self.create_task()
+        await self.finish(task, 1, duration=0.2)
+        await self.finish(task, 1, ExecutionStatus.FAILED, duration=3.0)
+        await self.finish(task, 2, ExecutionStatus.TIMEOUT, duration=None)
+
+        hour = await TaskRunRollup.get(task_id=task.id, bucket="hour", bucket_start=DAY.replace(hour=1))
+        assert (hour.runs, hour.completed, hour.failed) == (2, 1, 1)
+        assert (hour.duration_min, hour.duration_max, hour.duration_count) == (0.2, 3.0, 2)
+        assert sum(hour.duration_histogram) == 2
+        day = await TaskRunRollup.get(task_id=task.id, bucket="day", bucket_start=DAY)
+        assert (day.runs, day.timed_out) == (3, 1)
+
+    async def test_run_counted_once(self):
+        task = await self.create_task()
+        log = await TaskLog.create(task=task, status=ExecutionStatus.RUNNING, command_executed="echo", started_at=DAY)
+        assert not await TaskRunRollup.filter(task_id=task.id).exists()
+
+        log.status = ExecutionStatus.COMPLETED
+        log.duration = 0.5
+        await log.save()
+        log.error_message = "edited later"
+        await log.save()
+        day = await TaskRunRollup.get(task_id=task.id, bucket="day")
+        assert day.runs == 1
+
+    async def test_write_behind_updates_rollups(self):
+        task = await self.create_task()
+        log_writer.start()
+        try:
+            log = TaskLog(task=task, status=ExecutionStatus.RUNNING, command_executed="echo", started_at=DAY)
+            await log_writer.save(log)
+            await log_writer.flush()
+            log.status = ExecutionStatus.FAILED
+            await log_writer.save(log)
+            log.error_message = "again"
+            await log_writer.save(log)
+        finally:
+            await log_writer.stop()
+        day = await TaskRunRollup.get(task_id=task.id, bucket="day")
+        assert (day.runs, day.failed) == (1, 1)
+
+    async def test_stats_survive_deleted_logs(self, async_client: AsyncClient):
+        task = await self.create_task()
+        for hour in (1, 1, 5):
+            await self.finish(task, hour, duration=2.0)
+        await self.finish(task, 5, ExecutionStatus.FAILED, duration=40.0)
+        await TaskLog.filter(task_id=task.id).delete()
+
+        params = {"task_id": task.id, "start": "2024-05-01T00:00:00Z", "end": "2024-05-02T00:00:00Z"}
+        response = await async_client.get("/stats", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"]["runs"] == 4
+        assert data["total"]["failed"] == 1
+        assert [(bucket["start"][:13], bucket["runs"]) for bucket in data["buckets"]] == [
+            ("2024-05-01T01", 2), ("2024-05-01T05", 2)
+        ]
+        p50 = data["total"]["duration_p50"]
+        assert DURATION_BOUNDS[6] <= p50 <= DURATION_BOUNDS[7]
+        assert data["total"]["duration_p99"] <= 40.0
+
+        response = await async_client.get("/stats", params={**params, "bucket": "day"})
+        assert [bucket["runs"] for bucket in response.json()["buckets"]] == [4]
+
+    async def test_invalid_ranges(self, async_client: AsyncClient):
+        response = await async_client.get("/stats", params={"bucket": "week"})
+        assert response.status_code == 422
+        response = await async_client.get("/stats", params={"start": "2024-05-02T00:00:00Z", "end": "2024-05-01T00:00:00Z"})
+        assert response.status_code == 422
+        response = await async_client.get("/stats", params={"start": "2000-01-01T00:00:00Z", "end": "2024-05-01T00:00:00Z"})
+        assert response.status_code == 422
+
+    async def test_naive_range_is_utc(self, async_client: AsyncClient):
+        task = await self.create_task()
+        await self.finish(task, 1, duration=2.0)
+
+        params = {"task_id": task.id, "start": "2024-05-01T00:00:00", "end": "2024-05-02T00:00:00"}
+        response = await async_client.get("/stats", params=params)
+        assert response.status_code == 200
+        assert response.json()["total"]["runs"] == 1
+        # Naive start against the default end, now
+        response = await async_client.get("/stats", params={"task_id": task.id, "start": "2024-05-01T00:00:00", "bucket": "day"})
+        assert response.status_code == 200
+        assert response.json()["total"]["runs"] == 1
+
+    async def test_rebuild_is_idempotent(self):
+        task = await self.create_task()
+        for hour in (1, 2, 2):
+            await self.finish(task, hour)
+        await TaskRunRollup.filter(task_id=task.id).delete()
+
+        for _ in range(2):
+            result = await rebuild(DAY, DAY, pause=0)
+            assert result.logs >= 3
+            day = await TaskRunRollup.get(task_id=task.id, bucket="day")
+            assert day.runs == 3
+            assert await TaskRunRollup.filter(task_id=task.id, bucket="hour").count() == 2
+
+    async def test_rebuild_keeps_runs_finished_meanwhile(self, monkeypatch):
+        task = await self.create_task()
+        now = datetime.now(timezone.utc)
+        await self.finish(task, 1)
+        await TaskLog.create(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo", started_at=now)
+        await TaskRunRollup.filter(task_id=task.id).delete()
+
+        export = log_router.export
+
+        async def export_while_running(*args, **kwargs):
+            async for rows in export(*args, **kwargs):
+                yield rows
+            await TaskLog.create(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo", started_at=now)
+        monkeypatch.setattr(log_router, "export", export_while_running)
+
+        result = await rebuild(DAY, now, pause=0)
+        assert result.logs == 3
+        today = await TaskRunRollup.get(task_id=task.id, bucket="day", bucket_start=now.replace(hour=0, minute=0, second=0, microsecond=0))
+        assert today.runs == 2
+        assert (await TaskRunRollup.get(task_id=task.id, bucket="day", bucket_start=DAY)).runs == 1
+
+    async def test_start_lag_stats(self, async_client: AsyncClient):
+        task = await self.create_task()
+        other = await self.create_task()
+        for current, lag in ((task, 0.004), (task, 0.2), (other, 3.0)):
+            scheduled = DAY.replace(hour=1, minute=30)
+            await TaskLog.create(
+                task=current, status=ExecutionStatus.COMPLETED, command_executed="echo", started_at=scheduled,
+                duration=1.0, scheduled_at=scheduled, spawned_at=scheduled + timedelta(seconds=lag)
+            )
+        # Manual runs have no fire time and no lag
+        await self.finish(task, 1)
+
+        hour = await TaskRunRollup.get(task_id=task.id, bucket="hour")
+        assert (hour.runs, hour.lag_count, hour.lag_min, hour.lag_max) == (3, 2, 0.004, 0.2)
+        assert sum(hour.lag_histogram) == 2
+
+        params = {"start": "2024-05-01T00:00:00Z", "end": "2024-05-02T00:00:00Z"}
+        response = await async_client.get("/stats", params={**params, "task_id": task.id})
+        total = response.json()["total"]
+        assert total["lag_avg"] == pytest.approx(0.102)
+        assert LAG_BOUNDS[1] <= total["lag_p50"] <= LAG_BOUNDS[2]
+        assert total["lag_p99"] <= 0.2
+
+        response = await async_client.get("/stats", params=params)
+        total = response.json()["total"]
+        assert total["lag_max"] == 3.0 and total["lag_p99"] > 1
+
+        await TaskRunRollup.filter(task_id=task.id).delete()
+        await rebuild(DAY, DAY, pause=0)
+        hour = await TaskRunRollup.get(task_id=task.id, bucket="hour")
+        assert (hour.lag_count, hour.lag_max) == (2, 0.2)
+
+
+@pytest.mark.asyncio
+class TestRunLifecycle:
+    """Test cases for the lifecycle timestamps of scheduled runs."""
+
+    async def test_fire_records_lifecycle(self):
+        task = await Task.create(name="Lifecycle Task", command="echo", args=["hi"],
+                                 schedule_type=ScheduleType.INTERVAL, interval_seconds=60)
+        await scheduler.load_tasks()
+        scheduled = datetime.now(timezone.utc) - timedelta(seconds=1)
+        scheduler._job_submitted(JobSubmissionEvent(EVENT_JOB_SUBMITTED, f"task_{task.id}", "default", [scheduled]))
+
+        await scheduler._execute_task_wrapper(task.id)
+        await log_writer.flush()
+        log = await TaskLog.get(task_id=task.id)
+        assert log.status == ExecutionStatus.COMPLETED
+        assert log.scheduled_at == scheduled
+        # Output is read by another thread and may be timestamped after the exit
+        times = [getattr(log, field) for field in LIFECYCLE_FIELDS if field != "first_output_at"]
+        assert all(times) and times == sorted(times)
+        assert log.spawned_at <= log.first_output_at <= log.persisted_at
+        assert log.fired_at <= log.started_at <= log.spawned_at
+
+        day = await TaskRunRollup.get(task_id=task.id, bucket="day")
+        assert day.lag_count == 1 and day.lag_min >= 1
+
+        # The fire time is used once, a manual run has none
+        await scheduler.execute_now(task.id)
+        await scheduler.running_jobs.pop(task.id)
+        await log_writer.flush()
+        manual = await TaskLog.filter(task_id=task.id).order_by("-id").first()
+        assert manual.scheduled_at is None and manual.persisted_at is not None
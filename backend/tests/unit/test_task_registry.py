@@ -0,0 +1,145 @@
+"""
+Unit tests for the scheduler's in-memory task registry.
+"""
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from tortoise import Tortoise
+
+from app.config import settings
+from app.models.task import Task, ScheduleType
+from app.scheduler.scheduler import scheduler
+
+
+async def create_task(**kwargs) -> Task:
+    return await Task.create(
+        name=kwargs.pop("name", "Registry Task"),
+        command="echo",
+        schedule_type=ScheduleType.INTERVAL,
+        interval_seconds=60,
+        **kwargs
+    )
+
+
+@pytest.mark.asyncio
+class TestTaskRegistry:
+    """Test cases for reading tasks from the registry instead of the database."""
+
+    async def test_fires_do_not_query_tasks(self, monkeypatch):
+        task = await create_task()
+        await scheduler.load_tasks()
+
+        def no_queries(*args, **kwargs):
+            raise AssertionError("tasks were read from the database")
+        monkeypatch.setattr(Task, "all", no_queries)
+        monkeypatch.setattr(Task, "get_or_none", no_queries)
+
+        executed = []
+
+        async def execute(task, timings=None):
+            executed.append(task.id)
+        monkeypatch.setattr(scheduler, "_execute_task", execute)
+
+        await scheduler._execute_task_wrapper(task.id)
+        assert await scheduler.execute_now(task.id) == task.id
+        await scheduler.running_jobs.pop(task.id)
+        assert executed == [task.id, task.id]
+        assert await scheduler.execute_now(task.id + 1) is None
+
+    async def test_api_updates_registry(self, async_client: AsyncClient):
+        await scheduler.load_tasks()
+        response = await async_client.post("/tasks/", json={
+            "name": "API Registry Task",
+            "command": "echo",
+            "args": [],
+            "schedule_type": ScheduleType.INTERVAL,
+            "interval_seconds": 60,
+            "enabled": False
+        })
+        task_id = response.json()["id"]
+        assert scheduler.tasks[task_id].name == "API Registry Task"
+
+        await async_client.put(f"/tasks/{task_id}", json={"command": "true"})
+        assert scheduler.tasks[task_id].command == "true"
+
+        await async_client.delete(f"/tasks/{task_id}")
+        assert task_id not in scheduler.tasks
+        assert await scheduler.get_task(task_id) is None
+
+    async def test_api_writes_keep_registry_current(self, async_client: AsyncClient, monkeypatch):
+        await scheduler.load_tasks()
+
+        async def no_reload(reschedule=False):
+            raise AssertionError("registry was reloaded")
+        monkeypatch.setattr(scheduler, "load_tasks", no_reload)
+        monkeypatch.setattr(scheduler, "add_task", lambda task: asyncio.sleep(0))
+
+        response = await async_client.post("/tasks/", json={
+            "name": "Current Task",
+            "command": "echo",
+            "args": [],
+            "schedule_type": ScheduleType.INTERVAL,
+            "interval_seconds": 60
+        })
+        task_id = response.json()["id"]
+        await async_client.put(f"/tasks/{task_id}", json={"timeout": 10})
+        await async_client.post("/tasks/bulk/disable", json={"ids": [task_id]})
+        task = await scheduler.get_task(task_id)
+        assert task.timeout == 10
+        assert not task.enabled
+
+    async def test_failed_create_is_not_registered(self, async_client: AsyncClient, monkeypatch):
+        await scheduler.load_tasks()
+        registered = []
+        monkeypatch.setattr(scheduler, "register_task", registered.append)
+
+        async def fail(*args, **kwargs):
+            raise RuntimeError("insert failed")
+        monkeypatch.setattr(Task, "create", fail)
+
+        with pytest.raises(RuntimeError):
+            await async_client.post("/tasks/", json={
+                "name": "Failing Task",
+                "command": "echo",
+                "args": [],
+                "schedule_type": ScheduleType.INTERVAL,
+                "interval_seconds": 60
+            })
+        assert registered == []
+
+    async def test_reload_after_other_writes(self):
+        task = await create_task()
+        await scheduler.load_tasks()
+
+        stored = await Task.get(id=task.id)
+        stored.timeout = 10
+        await stored.save()
+        assert (await scheduler.get_task(task.id)).timeout == 10
+
+    async def test_out_of_band_edit_reschedules(self, async_client: AsyncClient, monkeypatch):
+        task = await create_task()
+        await scheduler.load_tasks()
+        await scheduler.add_task(task)
+        assert task.id in scheduler.job_id_map
+        etag = (await async_client.get("/tasks")).headers["etag"]
+
+        # Written around the ORM, as another process would, so no change version moves
+        await Tortoise.get_connection("default").execute_query(
+            "UPDATE tasks SET enabled = 0, timeout = 10 WHERE id = ?", [task.id]
+        )
+        assert scheduler.tasks[task.id].timeout == 300
+
+        data_version = scheduler._data_version
+        monkeypatch.setattr(settings, "task_registry_check_seconds", 0)
+        monkeypatch.setattr(scheduler, "_read_data_version", lambda: asyncio.sleep(0, data_version + 1))
+        watcher = asyncio.create_task(scheduler.watch_tasks())
+        await asyncio.sleep(0.05)
+        watcher.cancel()
+
+        assert scheduler.tasks[task.id].timeout == 10
+        assert task.id not in scheduler.job_id_map
+        # Task responses cached before the outside edit are stale
+        response = await async_client.get("/tasks", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["data"][0]["timeout"] == 10
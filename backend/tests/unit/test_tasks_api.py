@@ -1,9 +1,12 @@
 """
 Unit tests for tasks API endpoints.
 """
+from datetime import datetime, timezone
+
 import pytest
 from httpx import AsyncClient
-from app.models.task import ScheduleType
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
 
 
 @pytest.mark.asyncio
@@ -209,6 +212,37 @@ class TestTasksAPI:
         response = await async_client.delete("/tasks/99999")
         assert response.status_code == 404
 
+    async def test_failed_delete_keeps_task(self, async_client: AsyncClient, monkeypatch):
+        """Test that a delete failing before its commit leaves the task, its job and its logs."""
+        from app.scheduler.scheduler import scheduler
+
+        task_data = {
+            "name": "Task Kept",
+            "command": "echo",
+            "args": [],
+            "schedule_type": ScheduleType.INTERVAL.value,
+            "interval_seconds": 3600,
+            "enabled": True
+        }
+        task_id = (await async_client.post("/tasks", json=task_data)).json()["id"]
+        await TaskLog.create(task_id=task_id, status=ExecutionStatus.COMPLETED, command_executed="echo", stdout="kept")
+
+        async def fail(*args, **kwargs):
+            raise RuntimeError("disk I/O error")
+        monkeypatch.setattr("app.api.tasks.release_blobs", fail)
+        with pytest.raises(RuntimeError):
+            await async_client.delete(f"/tasks/{task_id}")
+
+        assert await Task.exists(id=task_id)
+        assert await TaskLog.filter(task_id=task_id).count() == 1
+        assert task_id in scheduler.job_id_map and task_id in scheduler.tasks
+
+        monkeypatch.undo()
+        response = await async_client.delete(f"/tasks/{task_id}")
+        assert response.status_code == 204
+        assert task_id not in scheduler.job_id_map
+        assert await TaskLog.filter(task_id=task_id).count() == 0
+
     async def test_get_tasks_with_pagination(self, async_client: AsyncClient):
         """Test pagination for tasks list."""
         # Create multiple tasks
@@ -234,6 +268,24 @@ class TestTasksAPI:
         assert data["limit"] == 5
         assert len(data["data"]) == 5
 
+    async def test_get_tasks_statistics(self, async_client: AsyncClient):
+        """Test log count and latest result of each listed task."""
+        tasks = [
+            await Task.create(name=f"Stats Task {i}", command="echo", schedule_type=ScheduleType.INTERVAL,
+                              interval_seconds=60)
+            for i in range(3)
+        ]
+        # Created out of start order, the latest start decides the result
+        for task, statuses in ((tasks[0], [(2, ExecutionStatus.FAILED), (3, ExecutionStatus.COMPLETED)]),
+                               (tasks[1], [(5, ExecutionStatus.FAILED), (4, ExecutionStatus.COMPLETED)])):
+            for day, log_status in statuses:
+                await TaskLog.create(task=task, status=log_status, command_executed="echo",
+                                     started_at=datetime(2024, 1, day, tzinfo=timezone.utc))
+
+        response = await async_client.get("/tasks")
+        stats = {task["id"]: (task["log_count"], task["last_execution_success"]) for task in response.json()["data"]}
+        assert stats == {tasks[0].id: (2, True), tasks[1].id: (2, False), tasks[2].id: (0, None)}
+
     async def test_get_tasks_filter_enabled(self, async_client: AsyncClient):
         """Test filtering tasks by enabled status."""
         # Create enabled and disabled tasks
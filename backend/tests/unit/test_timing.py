@@ -0,0 +1,93 @@
+"""
+Unit tests for per-request query accounting and Server-Timing.
+"""
+import json
+import logging
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from app.config import settings
+from app.core.timing import ServerTimingMiddleware, TimedRoute, QueryBudgetExceeded, query_budget
+from app.models.log import TaskLog, ExecutionStatus
+from app.models.task import Task, ScheduleType
+
+
+def timing_metrics(header: str) -> dict:
+    metrics = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def budget_app() -> FastAPI:
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.get("/two")
+    @query_budget(1)
+    async def two_queries():
+        await Task.all().count()
+        await Task.all().count()
+        return {"ok": True}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(ServerTimingMiddleware)
+    return app
+
+
+async def create_task_with_log():
+    task = await Task.create(name="Timed Task", command="echo", schedule_type=ScheduleType.INTERVAL, interval_seconds=60)
+    await TaskLog.create(task=task, status=ExecutionStatus.COMPLETED, command_executed="echo", stdout="hi")
+    return task
+
+
+@pytest.mark.asyncio
+class TestServerTiming:
+    """Test cases for the Server-Timing header and query budgets."""
+
+    async def test_header_counts_queries(self, async_client: AsyncClient):
+        await create_task_with_log()
+        response = await async_client.get("/tasks/")
+        metrics = timing_metrics(response.headers["server-timing"])
+        assert metrics["db"]["desc"] == '"3 queries"'
+        assert set(metrics) == {"db", "orm", "serialize", "total"}
+        assert float(metrics["total"]["dur"]) >= float(metrics["db"]["dur"])
+
+        # Not modified answers run no query
+        response = await async_client.get("/tasks/", headers={"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304
+        assert timing_metrics(response.headers["server-timing"])["db"]["desc"] == '"0 queries"'
+
+    async def test_routes_within_budget(self, async_client: AsyncClient):
+        task = await create_task_with_log()
+        log = await TaskLog.get(task_id=task.id)
+        for url in ("/tasks/", f"/tasks/{task.id}", f"/tasks/{task.id}/logs", "/logs/", f"/logs/{log.id}"):
+            response = await async_client.get(url)
+            assert response.status_code == 200, url
+
+    async def test_budget_strict_and_logged(self, monkeypatch, caplog):
+        monkeypatch.setattr(settings, "query_budget_strict", False)
+        transport = ASGITransport(app=budget_app())
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            with caplog.at_level(logging.WARNING, logger="app.core.timing"):
+                response = await client.get("/two")
+            assert response.status_code == 200
+            assert "ran 2 queries, over its budget of 1" in caplog.text
+
+            monkeypatch.setattr(settings, "query_budget_strict", True)
+            with pytest.raises(QueryBudgetExceeded):
+                await client.get("/two")
+
+    async def test_slow_request_log(self, async_client: AsyncClient, monkeypatch, caplog):
+        monkeypatch.setattr(settings, "slow_request_ms", 0)
+        await create_task_with_log()
+        with caplog.at_level(logging.WARNING, logger="app.core.timing"):
+            await async_client.get("/tasks/")
+        record = next(record for record in caplog.records if record.message.startswith("Slow request"))
+        details = json.loads(record.message[len("Slow request "):])
+        assert details == record.request_timing
+        assert (details["route"], details["status"], details["queries"]) == ("/api/tasks/", 200, 3)
+        assert details["slowest_query"].startswith("SELECT")
@@ -0,0 +1,55 @@
+"""
+Unit tests for the event loop watchdog.
+"""
+import asyncio
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.core.watchdog import loop_watchdog, LOOP_STALLS
+
+
+def block_the_loop(seconds: float):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+class TestLoopWatchdog:
+    """Test cases for detecting a blocked event loop."""
+
+    async def test_captures_blocking_stack(self, async_client: AsyncClient, monkeypatch):
+        monkeypatch.setattr(settings, "loop_watchdog_interval_seconds", 0.01)
+        monkeypatch.setattr(settings, "loop_watchdog_threshold_seconds", 0.05)
+        stalls = LOOP_STALLS.value()
+        watchdog = asyncio.create_task(loop_watchdog.run(), name="watchdog")
+        try:
+            await asyncio.sleep(0.05)
+            block_the_loop(0.3)
+            await asyncio.sleep(0.1)
+            response = await async_client.get("/diagnostics/loop")
+        finally:
+            watchdog.cancel()
+            await asyncio.gather(watchdog, return_exceptions=True)
+
+        assert LOOP_STALLS.value() == stalls + 1
+        data = response.json()
+        assert data["running"] is True
+        stall = data["stalls"][0]
+        assert stall["resolved"] is True
+        assert 0.2 <= stall["blocked_seconds"] < 1
+        assert "test_captures_blocking_stack" in stall["task"]
+        assert "block_the_loop" in stall["stack"][-1]
+        assert not loop_watchdog.running
+
+    async def test_quiet_loop_has_no_stalls(self, monkeypatch):
+        monkeypatch.setattr(settings, "loop_watchdog_interval_seconds", 0.01)
+        monkeypatch.setattr(settings, "loop_watchdog_threshold_seconds", 0.2)
+        stalls = LOOP_STALLS.value()
+        watchdog = asyncio.create_task(loop_watchdog.run())
+        await asyncio.sleep(0.2)
+        watchdog.cancel()
+        await asyncio.gather(watchdog, return_exceptions=True)
+        assert LOOP_STALLS.value() == stalls
+        assert loop_watchdog.lag < 0.2
@@ -1,9 +1,9 @@
 import { defineStore } from 'pinia'
 import api from '@/utils/api'
-import type { TaskLog, PaginationParams, PaginatedResponse } from '@/types/task'
+import type { TaskLog, TaskLogSummary, PaginationParams, PaginatedResponse } from '@/types/task'
 
 export const useLogStore = defineStore('log', () => {
-  const getLogs = async (params?: PaginationParams): Promise<PaginatedResponse<TaskLog>> => {
+  const getLogs = async (params?: PaginationParams): Promise<PaginatedResponse<TaskLogSummary>> => {
     const response = await api.get('/logs', { params })
     return response.data
   }
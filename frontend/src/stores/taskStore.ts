@@ -1,7 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
 import api from '@/utils/api'
-import type { Task, TaskCreate, TaskUpdate, PaginationParams, PaginatedResponse, TaskLog, TestExecuteResult } from '@/types/task'
+import type { Task, TaskCreate, TaskUpdate, PaginationParams, PaginatedResponse, TaskLogSummary, TestExecuteResult } from '@/types/task'
 
 export const useTaskStore = defineStore('task', () => {
   const tasks = ref<Task[]>([])
@@ -43,7 +43,7 @@ export const useTaskStore = defineStore('task', () => {
     return response.data
   }
 
-  const getTaskLogs = async (taskId: number, params?: PaginationParams): Promise<PaginatedResponse<TaskLog>> => {
+  const getTaskLogs = async (taskId: number, params?: PaginationParams): Promise<PaginatedResponse<TaskLogSummary>> => {
     const response = await api.get(`/tasks/${taskId}/logs`, { params })
     return response.data
   }
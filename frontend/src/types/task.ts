@@ -10,6 +10,9 @@ export interface Task {
   enabled: boolean
   timeout: number
   max_concurrent: number
+  log_max_age_days?: number
+  log_max_runs?: number
+  log_failure_max_age_days?: number
   created_at: string
   updated_at: string
   log_count: number
@@ -27,6 +30,9 @@ export interface TaskCreate {
   enabled?: boolean
   timeout?: number
   max_concurrent?: number
+  log_max_age_days?: number
+  log_max_runs?: number
+  log_failure_max_age_days?: number
 }
 
 export interface TaskUpdate {
@@ -40,6 +46,9 @@ export interface TaskUpdate {
   enabled?: boolean
   timeout?: number
   max_concurrent?: number
+  log_max_age_days?: number
+  log_max_runs?: number
+  log_failure_max_age_days?: number
 }
 
 export interface TaskLog {
@@ -57,6 +66,22 @@ export interface TaskLog {
   created_at: string
 }
 
+export interface TaskLogSummary {
+  id: number
+  task_id: number
+  status: number
+  started_at: string
+  finished_at?: string
+  duration?: number
+  exit_code?: number
+  error_message?: string
+  command_executed: string
+  stdout_size?: number
+  stderr_size?: number
+  output_preview?: string
+  created_at: string
+}
+
 export interface PaginationParams {
   skip?: number
   limit?: number